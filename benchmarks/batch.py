@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+"""Benchmark for the batch() methods added by --batch-functions.
+
+Applies libm's sin() and pow() to an array of doubles with a plain Python
+loop, with the map() fallback used when no C compiler is available, and
+with the compiled C shim.
+
+Usage:
+
+    python benchmarks/batch.py [--size N] [--number N]
+
+"""
+
+import argparse
+import array
+import ctypes
+import ctypes.util
+import os
+import timeit
+
+from string_param import load_preamble, THIS_DIR
+
+
+def load_batch_support():
+    """Execute the preamble followed by the batch support code."""
+    namespace = load_preamble()
+    path = os.path.join(THIS_DIR, os.path.pardir, "ctypesgen", "printer_python", "batchsupport.py")
+    with open(path) as f:
+        exec(compile(f.read(), path, "exec"), namespace)
+    return namespace
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--size", type=int, default=100000, help="elements per call")
+    p.add_argument("--number", type=int, default=10, help="calls per measurement")
+    args = p.parse_args(argv)
+
+    ns = load_batch_support()
+    libm = ctypes.CDLL(ctypes.util.find_library("m"))
+    libm.sin.argtypes = [ctypes.c_double]
+    libm.sin.restype = ctypes.c_double
+    libm.pow.argtypes = [ctypes.c_double, ctypes.c_double]
+    libm.pow.restype = ctypes.c_double
+
+    xs = array.array("d", [i / float(args.size) for i in range(args.size)])
+    out = array.array("d", xs)
+
+    cases = [
+        ("sin", libm.sin, lambda f: [f(x) for x in xs], (xs,)),
+        ("pow", libm.pow, lambda f: [f(x, 2.5) for x in xs], (xs, 2.5)),
+    ]
+
+    header = ("func", "loop elem/s", "map elem/s", "shim elem/s", "speedup")
+    print("%-6s %14s %14s %14s %8s" % header)
+    for name, func, loop, batch_args in cases:
+        fallback = ns["_batch_function"](func, compile_shim=False)
+        shim = ns["_batch_function"](func)
+        shim(*batch_args, out=out)  # compile outside the measurement
+        rates = []
+        for run in (
+            lambda: loop(func),
+            lambda: fallback(*batch_args, out=out),
+            lambda: shim(*batch_args, out=out),
+        ):
+            t = timeit.timeit(run, number=args.number)
+            rates.append(args.size * args.number / t)
+        print(
+            "%-6s %14.0f %14.0f %14.0f %7.1fx"
+            % (name, rates[0], rates[1], rates[2], rates[2] / rates[0])
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+"""Synthetic C headers for benchmarking ctypesgen.
+
+Each corpus stresses one part of ctypesgen: many function prototypes,
+structs with nested and anonymous members, deep typedef chains, huge enums,
+macro-heavy headers and bitfields. A corpus is generated from a size, so the
+same header can be rebuilt anywhere from its name and size alone.
+
+Usage:
+
+    python benchmarks/corpus.py NAME SIZE [-o FILE] [--source FILE]
+
+"""
+
+import argparse
+import sys
+
+
+class Corpus(object):
+    """A generated header, with a C implementation of its functions when
+    they can be called."""
+
+    def __init__(self, name, size, header, source=None):
+        self.name = name
+        self.size = size
+        self.header = header
+        self.source = source
+
+
+def functions(n):
+    """n prototypes taking a mix of numbers, strings and struct pointers,
+    with trivial bodies so that calls can be timed."""
+    header = ["struct bench_pair { int a; double b; };", ""]
+    source = ['#include "bench.h"', ""]
+    signatures = [
+        ("int", "int x", "return x;"),
+        ("double", "double x, double y", "return x + y;"),
+        ("int", "const char *s", "return s[0];"),
+        ("double", "struct bench_pair *p", "return p->a + p->b;"),
+        ("void", "int x, long y, unsigned char z", "(void)x; (void)y; (void)z;"),
+    ]
+    for i in range(n):
+        restype, params, body = signatures[i % len(signatures)]
+        header.append("%s bench_f%d(%s);" % (restype, i, params))
+        source.append("%s bench_f%d(%s) { %s }" % (restype, i, params, body))
+    return "\n".join(header) + "\n", "\n".join(source) + "\n"
+
+
+def structs(n):
+    """n structs, each nesting the previous one and holding anonymous unions
+    and structs."""
+    # Pointers only go to the smallest struct: ctypes builds the buffer
+    # format of a pointer from that of its target, which for a chain of
+    # nested structs grows exponentially.
+    lines = ["struct bench_s0 { int a; double b; };"]
+    for i in range(1, n):
+        lines.append(
+            "struct bench_s%d {\n"
+            "    struct bench_s%d prev;\n"
+            "    struct bench_s0 *first;\n"
+            "    union { int i; float f; char c[8]; };\n"
+            "    struct { short x, y; } point;\n"
+            "    char name[16];\n"
+            "};" % (i, i - 1)
+        )
+    return "\n".join(lines) + "\n", None
+
+
+def typedefs(n):
+    """A chain of n typedefs, each naming the previous one, used at the end."""
+    lines = ["typedef int bench_t0;"]
+    for i in range(1, n):
+        lines.append("typedef bench_t%d bench_t%d;" % (i - 1, i))
+    lines.append("bench_t%d bench_use_typedef(bench_t%d x);" % (n - 1, n // 2))
+    return "\n".join(lines) + "\n", None
+
+
+def enums(n):
+    """One enum of n enumerators with explicit and implicit values."""
+    lines = ["enum bench_e {"]
+    for i in range(n):
+        if i % 10 == 0:
+            lines.append("    BENCH_E%d = %d," % (i, i * 2))
+        else:
+            lines.append("    BENCH_E%d," % i)
+    lines.append("};")
+    return "\n".join(lines) + "\n", None
+
+
+def macros(n):
+    """n object-like and function-like macros with expressions referring to
+    earlier macros."""
+    lines = ["#define BENCH_M0 1"]
+    for i in range(1, n):
+        if i % 3 == 0:
+            lines.append("#define BENCH_M%d(x, y) ((x) * BENCH_M%d + (y))" % (i, i - 2))
+        elif i % 3 == 1:
+            lines.append("#define BENCH_M%d (BENCH_M%d << 1 | 0x%x)" % (i, max(i - 3, 0), i))
+        else:
+            lines.append('#define BENCH_M%d "string %d"' % (i, i))
+    return "\n".join(lines) + "\n", None
+
+
+def bitfields(n):
+    """n structs made of bitfields of assorted widths."""
+    lines = []
+    for i in range(n):
+        lines.append(
+            "struct bench_b%d {\n"
+            "    unsigned int a : 1;\n"
+            "    unsigned int b : %d;\n"
+            "    int c : 7;\n"
+            "    unsigned short d : 3;\n"
+            "    unsigned int e : 12;\n"
+            "};" % (i, i % 16 + 1)
+        )
+    return "\n".join(lines) + "\n", None
+
+
+# name -> (generator, default size)
+CORPORA = {
+    "functions": (functions, 2000),
+    "structs": (structs, 500),
+    "typedefs": (typedefs, 1000),
+    "enums": (enums, 5000),
+    "macros": (macros, 2000),
+    "bitfields": (bitfields, 500),
+}
+
+
+def generate(name, size=None):
+    """Return the Corpus `name` with `size` elements (or its default size)."""
+    func, default_size = CORPORA[name]
+    if size is None:
+        size = default_size
+    header, source = func(size)
+    return Corpus(name, size, header, source)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("name", choices=sorted(CORPORA))
+    p.add_argument("size", type=int, nargs="?", help="number of elements")
+    p.add_argument("-o", "--output", help="write the header to FILE [default stdout]")
+    p.add_argument("--source", metavar="FILE", help="write the C implementation to FILE")
+    args = p.parse_args(argv)
+
+    corpus = generate(args.name, args.size)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(corpus.header)
+    else:
+        sys.stdout.write(corpus.header)
+    if args.source:
+        if corpus.source is None:
+            p.error("the %s corpus has no C implementation" % args.name)
+        with open(args.source, "w") as f:
+            f.write(corpus.source)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+"""Benchmark the layouts of JSON output.
+
+Parses each corpus from corpus.py, and a few system headers, once, then
+times the JSON printer and measures its output with the default layout,
+--json-compact, --json-type-table and both. Output written with the type
+table is expanded again with expand_refs() and checked against the default
+output; the benchmark exits with an error if they differ.
+
+Usage:
+
+    python benchmarks/json_output.py [--corpus NAME[:SIZE]] [--header NAME] [--repeat N]
+
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import corpus as corpus_module
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(THIS_DIR, os.path.pardir))
+
+import ctypesgen
+from ctypesgen.printer_json.printer import expand_refs
+
+DEFAULT_HEADERS = ["stdio.h", "stdlib.h", "signal.h", "pthread.h"]
+
+LAYOUTS = [
+    ("default", {}),
+    ("compact", {"json_compact": True}),
+    ("type table", {"json_type_table": True}),
+    ("both", {"json_compact": True, "json_type_table": True}),
+]
+
+
+def parse(header, workdir):
+    path = os.path.join(workdir, "bench.h")
+    with open(path, "w") as f:
+        f.write(header)
+    options = ctypesgen.options.get_default_options()
+    options.headers = [path]
+    options.all_headers = True
+    options.output_language = "json"
+    descriptions = ctypesgen.parser.parse(options.headers, options)
+    ctypesgen.processor.process(descriptions, options)
+    return options, descriptions
+
+
+def render(options, descriptions, layout, repeat):
+    """Return the output with `layout` and the best time of `repeat` runs."""
+    best = None
+    for name, value in layout.items():
+        setattr(options, name, value)
+    for i in range(repeat):
+        output = io.StringIO()
+        start = time.perf_counter()
+        ctypesgen.printer_json.WrapperPrinter(output, options, descriptions)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    for name in layout:
+        setattr(options, name, False)
+    return output.getvalue(), best
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument(
+        "--corpus",
+        action="append",
+        metavar="NAME[:SIZE]",
+        help="corpus to print (default: all of them)",
+    )
+    p.add_argument(
+        "--header",
+        action="append",
+        metavar="NAME",
+        help="system header to print (default: %s)" % ", ".join(DEFAULT_HEADERS),
+    )
+    p.add_argument("--repeat", type=int, default=3, help="keep the best of N runs")
+    args = p.parse_args(argv)
+
+    ctypesgen.messages.log.setLevel(logging.CRITICAL)
+    cases = []
+    for spec in args.corpus or sorted(corpus_module.CORPORA):
+        name, _, size = spec.partition(":")
+        cases.append((name, corpus_module.generate(name, int(size) if size else None).header))
+    for name in args.header or DEFAULT_HEADERS:
+        cases.append(("<%s>" % name, "#include <%s>\n" % name))
+
+    failed = False
+    print("%-14s %-12s %12s %10s" % ("input", "layout", "bytes", "seconds"))
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, header in cases:
+            options, descriptions = parse(header, workdir)
+            expected = None
+            for layout_name, layout in LAYOUTS:
+                text, seconds = render(options, descriptions, layout, args.repeat)
+                print("%-14s %-12s %12d %10.4f" % (name, layout_name, len(text), seconds))
+                items = json.loads(text)
+                if expected is None:
+                    expected = items
+                elif expand_refs(items) != expected:
+                    print("%-14s %-12s output differs once expanded" % (name, layout_name))
+                    failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
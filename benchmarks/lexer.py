@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+"""Benchmark the preprocessor lexer, and check its token streams.
+
+Lexes the preprocessed text of each corpus from corpus.py, and of a few
+system headers, with the lexer's dispatch tables (which only try the rules
+that can match the next character) and with the reference engine (which
+tries every rule in turn). Both must give the same tokens; the benchmark
+exits with an error otherwise.
+
+Usage:
+
+    python benchmarks/lexer.py [--corpus NAME[:SIZE]] [--header NAME] [--repeat N]
+
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import corpus as corpus_module
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(THIS_DIR, os.path.pardir))
+
+import ctypesgen
+from ctypesgen.parser import preprocessor
+
+DEFAULT_HEADERS = ["stdio.h", "stdlib.h", "math.h", "signal.h", "pthread.h"]
+
+
+def preprocessed_text(header, workdir):
+    """Return the text the lexer reads for `header`, as saved by
+    --save-preprocessed-headers."""
+    path = os.path.join(workdir, "preprocessed.i")
+    options = ctypesgen.options.get_default_options()
+    options.headers = ["bench.h"]
+    options.save_preprocessed_headers = path
+    ctypesgen.parser.parse(options.headers, options, {"bench.h": header})
+    with open(path) as f:
+        return f.read()
+
+
+def tokens(text, reference):
+    lexer = preprocessor.get_lexer_prototype().clone()
+    if reference:
+        lexer.lexstatedispatch = {}
+        lexer.begin("INITIAL")
+    lexer.input(text)
+    result = []
+    while True:
+        tok = lexer.token()
+        if tok is None:
+            return result
+        result.append((tok.type, str(tok.value), tok.lineno, tok.lexpos, tok.filename))
+
+
+def best_time(text, reference, repeat):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        tokens(text, reference)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument(
+        "--corpus",
+        action="append",
+        metavar="NAME[:SIZE]",
+        help="corpus to lex (default: all of them)",
+    )
+    p.add_argument(
+        "--header",
+        action="append",
+        metavar="NAME",
+        help="system header to lex (default: %s)" % ", ".join(DEFAULT_HEADERS),
+    )
+    p.add_argument("--repeat", type=int, default=5, help="keep the best of N runs")
+    args = p.parse_args(argv)
+
+    ctypesgen.messages.log.setLevel(logging.CRITICAL)
+    cases = []
+    for spec in args.corpus or sorted(corpus_module.CORPORA):
+        name, _, size = spec.partition(":")
+        cases.append((name, corpus_module.generate(name, int(size) if size else None).header))
+    for name in args.header or DEFAULT_HEADERS:
+        cases.append(("<%s>" % name, "#include <%s>\n" % name))
+
+    workdir = tempfile.mkdtemp()
+    failed = False
+    try:
+        print(
+            "%-16s %8s %12s %12s %8s" % ("input", "tokens", "reference s", "dispatch s", "speedup")
+        )
+        for name, header in cases:
+            text = preprocessed_text(header, workdir)
+            expected = tokens(text, True)
+            if tokens(text, False) != expected:
+                print("%-16s token streams differ" % name)
+                failed = True
+                continue
+            reference = best_time(text, True, args.repeat)
+            dispatch = best_time(text, False, args.repeat)
+            print(
+                "%-16s %8d %12.4f %12.4f %7.2fx"
+                % (name, len(expected), reference, dispatch, reference / dispatch)
+            )
+    finally:
+        shutil.rmtree(workdir)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+"""Measure the memory held by the descriptions of each synthetic corpus.
+
+Parses and processes each corpus from corpus.py, then reports the memory
+still allocated once everything but the DescriptionCollection has been
+freed (descriptions, their types and expressions), in bytes per
+description, as measured by tracemalloc.
+
+Usage:
+
+    python benchmarks/memory.py [--corpus NAME[:SIZE]] [--json FILE]
+
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import sys
+import tempfile
+import tracemalloc
+
+import corpus as corpus_module
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(THIS_DIR, os.path.pardir))
+
+import ctypesgen
+
+
+def parse(path):
+    options = ctypesgen.options.get_default_options()
+    options.headers = [path]
+    descriptions = ctypesgen.parser.parse(options.headers, options)
+    ctypesgen.processor.process(descriptions, options)
+    return descriptions
+
+
+def measure(corpus, workdir):
+    """Return the number of descriptions of `corpus` and the bytes they hold."""
+    path = os.path.join(workdir, "%s.h" % corpus.name)
+    with open(path, "w") as f:
+        f.write(corpus.header)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        descriptions = parse(path)
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return len(descriptions.all), held
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument(
+        "--corpus",
+        action="append",
+        metavar="NAME[:SIZE]",
+        help="corpus to measure (default: all of them)",
+    )
+    p.add_argument("--json", metavar="FILE", help="also save the results to FILE")
+    args = p.parse_args(argv)
+
+    ctypesgen.messages.log.setLevel(logging.CRITICAL)
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        # Build the parser tables and other caches before measuring
+        warmup = corpus_module.Corpus("warmup", 1, "int warmup(int x);\n#define W 1\n", None)
+        measure(warmup, workdir)
+
+        print("%-12s %12s %14s %12s" % ("corpus", "descriptions", "bytes", "bytes/desc"))
+        for spec in args.corpus or sorted(corpus_module.CORPORA):
+            name, _, size = spec.partition(":")
+            corpus = corpus_module.generate(name, int(size) if size else None)
+            count, held = measure(corpus, workdir)
+            per_description = held / float(count) if count else 0.0
+            print("%-12s %12d %14d %12.0f" % (name, count, held, per_description))
+            results.append(
+                {
+                    "corpus": name,
+                    "size": corpus.size,
+                    "descriptions": count,
+                    "bytes": held,
+                    "bytes_per_description": per_description,
+                }
+            )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+"""Benchmark the whole ctypesgen pipeline on synthetic headers.
+
+Runs parsing, processing and printing on each corpus from corpus.py and
+reports the time per phase (from ctypesgen.stats where the tree has it) and
+header lines per second. It also times importing each generated wrapper
+and, when a C compiler is available, calling functions through it.
+
+--compare runs the same benchmark against other git revisions, each
+exported to a temporary directory, and prints the timings side by side.
+
+Usage:
+
+    python benchmarks/pipeline.py [--corpus NAME[:SIZE]] [--repeat N] [--json FILE]
+    python benchmarks/pipeline.py --compare REV [REV] [--corpus NAME[:SIZE]] ...
+
+"""
+
+import argparse
+import ctypes
+import importlib.util
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import corpus as corpus_module
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(THIS_DIR, os.path.pardir)
+
+
+def import_ctypesgen(tree):
+    """Import ctypesgen from the source tree `tree`."""
+    sys.path.insert(0, os.path.abspath(tree))
+    import ctypesgen
+
+    ctypesgen.messages.log.setLevel(logging.CRITICAL)
+    return ctypesgen
+
+
+def compile_library(source, workdir):
+    """Compile `source` into a shared library, or return None without a
+    working C compiler."""
+    path = os.path.join(workdir, "libbench.so")
+    with open(os.path.join(workdir, "bench.c"), "w") as f:
+        f.write(source)
+    cmd = os.environ.get("CC", "cc").split() + ["-O2", "-shared", "-fPIC", "-o", path, "bench.c"]
+    try:
+        subprocess.check_call(cmd, cwd=workdir, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return path
+
+
+def load_wrapper(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_pipeline(ctypesgen, header, library, output):
+    """Generate a wrapper for `header`. Returns the total time and the
+    per-phase times, if this tree can record them."""
+    options = ctypesgen.options.get_default_options()
+    options.headers = [header]
+    options.libraries = [library] if library else []
+    stats = None
+    if hasattr(ctypesgen, "stats"):
+        stats = options.stats = ctypesgen.stats.Stats(track_memory=False)
+
+    start = time.perf_counter()
+    descriptions = ctypesgen.parser.parse(options.headers, options)
+    ctypesgen.processor.process(descriptions, options)
+    if stats is not None:
+        with stats.phase("printing"):
+            ctypesgen.printer_python.WrapperPrinter(output, options, descriptions)
+    else:
+        ctypesgen.printer_python.WrapperPrinter(output, options, descriptions)
+    total = time.perf_counter() - start
+
+    phases = {}
+    if stats is not None:
+        phases = dict((name, entry["seconds"]) for name, entry in stats.phases.items())
+    return total, phases
+
+
+def time_calls(module, lib, number):
+    """Time calls through the wrapper and through plain ctypes, in ns/call."""
+    pair = module.struct_bench_pair(1, 2.0)
+    cases = [
+        ("int(int)", "bench_f0", (7,)),
+        ("double(double, double)", "bench_f1", (1.0, 2.0)),
+        ("int(const char *)", "bench_f2", (b"x",)),
+        ("double(struct *)", "bench_f3", (ctypes.pointer(pair),)),
+        ("void(int, long, uchar)", "bench_f4", (1, 2, 3)),
+    ]
+    results = {}
+    for label, name, args in cases:
+        wrapped = getattr(module, name)
+        raw = getattr(lib, name)
+        raw.argtypes = wrapped.argtypes
+        raw.restype = wrapped.restype
+        results[label] = {}
+        for kind, f in (("wrapper", wrapped), ("ctypes", raw)):
+            t = min(timeit.repeat(lambda: f(*args), number=number, repeat=3))
+            results[label][kind] = t / number * 1e9
+    return results
+
+
+def bench_corpus(ctypesgen, corpus, repeat, calls):
+    workdir = tempfile.mkdtemp(prefix="ctypesgen-bench-")
+    try:
+        header = os.path.join(workdir, "bench.h")
+        with open(header, "w") as f:
+            f.write(corpus.header)
+        library = corpus.source and compile_library(corpus.source, workdir)
+        output = os.path.join(workdir, "bench_wrapper.py")
+
+        # Keep the fastest of each measurement
+        total, phases = None, {}
+        for i in range(repeat):
+            t, p = run_pipeline(ctypesgen, header, library, output)
+            total = t if total is None else min(total, t)
+            for name, seconds in p.items():
+                phases[name] = min(phases.get(name, seconds), seconds)
+
+        import_times = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            module = load_wrapper(output, "bench_wrapper_%d" % i)
+            import_times.append(time.perf_counter() - start)
+
+        result = {
+            "name": corpus.name,
+            "size": corpus.size,
+            "lines": corpus.header.count("\n"),
+            "seconds": total,
+            "phases": phases,
+            "import_seconds": min(import_times),
+        }
+        if library and calls:
+            result["calls_ns"] = time_calls(module, ctypes.CDLL(library), calls)
+        return result
+    finally:
+        shutil.rmtree(workdir)
+
+
+def print_results(results):
+    for r in results:
+        print(
+            "%s (size %d, %d lines): %.3f s, %.0f lines/s, wrapper import %.1f ms"
+            % (
+                r["name"],
+                r["size"],
+                r["lines"],
+                r["seconds"],
+                r["lines"] / r["seconds"],
+                r["import_seconds"] * 1e3,
+            )
+        )
+        for name, seconds in r["phases"].items():
+            print("    %-40s %9.4f s %5.1f%%" % (name, seconds, 100 * seconds / r["seconds"]))
+        for label, times in sorted(r.get("calls_ns", {}).items()):
+            print(
+                "    call %-35s %7.0f ns (ctypes %.0f ns)"
+                % (label, times["wrapper"], times["ctypes"])
+            )
+
+
+def export_revision(rev, dest):
+    """Extract the tree of git revision `rev` into `dest`."""
+    os.makedirs(dest)
+    archive = subprocess.Popen(["git", "archive", rev], cwd=REPO_DIR, stdout=subprocess.PIPE)
+    subprocess.check_call(["tar", "-x", "-C", dest], stdin=archive.stdout)
+    archive.stdout.close()
+    if archive.wait():
+        raise SystemExit("git archive %s failed" % rev)
+
+
+def compare(revs, argv):
+    """Run this benchmark on each of `revs` ("." being the working tree) and
+    print the results side by side."""
+    tmpdir = tempfile.mkdtemp(prefix="ctypesgen-compare-")
+    try:
+        runs = []
+        for i, rev in enumerate(revs):
+            if rev == ".":
+                tree = REPO_DIR
+            else:
+                tree = os.path.join(tmpdir, "tree%d" % i)
+                export_revision(rev, tree)
+            out = os.path.join(tmpdir, "results%d.json" % i)
+            cmd = [sys.executable, os.path.abspath(__file__), "--tree", tree, "--json", out]
+            subprocess.check_call(cmd + argv, stdout=subprocess.DEVNULL)
+            with open(out) as f:
+                runs.append(json.load(f))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    a, b = runs
+    print("%-48s %12s %12s %8s" % ("", revs[0], revs[1], "ratio"))
+    for ra, rb in zip(a, b):
+
+        def row(label, ta, tb):
+            if ta is not None and tb is not None:
+                print("%-48s %12.4f %12.4f %7.2fx" % (label, ta, tb, ta / tb))
+
+        row("%s total (s)" % ra["name"], ra["seconds"], rb["seconds"])
+        for name in ra["phases"]:
+            row("  " + name, ra["phases"][name], rb["phases"].get(name))
+        if not ra["phases"]:
+            # An older tree without ctypesgen.stats
+            for name in rb["phases"]:
+                print("%-48s %12s %12.4f" % ("  " + name, "-", rb["phases"][name]))
+        row("  wrapper import (s)", ra["import_seconds"], rb["import_seconds"])
+        for label in sorted(ra.get("calls_ns", {})):
+            row(
+                "  call %s (ns)" % label,
+                ra["calls_ns"][label]["wrapper"],
+                rb.get("calls_ns", {}).get(label, {}).get("wrapper"),
+            )
+
+
+def parse_corpus_arg(arg):
+    name, _, size = arg.partition(":")
+    if name not in corpus_module.CORPORA:
+        raise argparse.ArgumentTypeError("unknown corpus %r" % name)
+    return name, int(size) if size else None
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument(
+        "--corpus",
+        action="append",
+        type=parse_corpus_arg,
+        metavar="NAME[:SIZE]",
+        help="corpus to run, see corpus.py [default: all]",
+    )
+    p.add_argument("--repeat", type=int, default=3, help="runs per corpus, the fastest is kept")
+    p.add_argument("--calls", type=int, default=20000, help="calls per call timing, 0 to skip")
+    p.add_argument("--json", metavar="FILE", help="also save the results as JSON")
+    p.add_argument(
+        "--compare",
+        nargs="+",
+        metavar="REV",
+        help="compare git revisions; with one REV, compare it to the working tree",
+    )
+    p.add_argument("--tree", default=REPO_DIR, help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.compare:
+        revs = args.compare
+        if len(revs) == 1:
+            revs = revs + ["."]
+        if len(revs) != 2:
+            p.error("--compare takes one or two revisions")
+        # Pass everything else on to the benchmark of each revision
+        i = argv.index("--compare")
+        compare(revs, argv[:i] + argv[i + 1 + len(args.compare) :])
+        return
+
+    ctypesgen = import_ctypesgen(args.tree)
+    corpora = args.corpus or [(name, None) for name in sorted(corpus_module.CORPORA)]
+    results = []
+    for name, size in corpora:
+        corpus = corpus_module.generate(name, size)
+        results.append(bench_corpus(ctypesgen, corpus, args.repeat, args.calls))
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+"""Benchmark the LR parser's reductions per second.
+
+Parses each corpus from corpus.py, and a few system headers, once while
+recording the tokens from the C lexer, then times only the yacc parser (with
+the grammar rules and the handlers they call) on a replay of those tokens,
+with the garbage collector off to cut the noise. Reports the number of
+grammar reductions and reductions per second.
+
+--compare runs the same benchmark against another git revision, exported
+to a temporary directory, and prints both rates side by side.
+
+Usage:
+
+    python benchmarks/reductions.py [--corpus NAME[:SIZE]] [--header NAME] [--repeat N]
+    python benchmarks/reductions.py --compare REV [REV] [--corpus NAME[:SIZE]] ...
+
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import corpus as corpus_module
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.join(THIS_DIR, os.path.pardir)
+
+DEFAULT_HEADERS = ["stdio.h", "stdlib.h", "signal.h", "pthread.h", "Python.h"]
+
+
+def import_ctypesgen(tree):
+    """Import ctypesgen from the source tree `tree`."""
+    sys.path.insert(0, os.path.abspath(tree))
+    import ctypesgen
+
+    ctypesgen.messages.log.setLevel(logging.CRITICAL)
+    return ctypesgen
+
+
+def python_include_dir():
+    import sysconfig
+
+    return sysconfig.get_paths()["include"]
+
+
+class Recorder(object):
+    """Wraps a lexer, keeping the tokens it returns."""
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.tokens = []
+
+    def token(self):
+        t = self.lexer.token()
+        if t is not None:
+            self.tokens.append(t)
+        return t
+
+    def __getattr__(self, name):
+        return getattr(self.lexer, name)
+
+
+class Replay(object):
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+
+    def token(self):
+        return next(self.tokens, None)
+
+
+def new_parser(ctypesgen, path):
+    options = ctypesgen.options.get_default_options()
+    options.headers = [path]
+    options.include_search_paths = [python_include_dir()]
+    return ctypesgen.parser.DataCollectingParser(options.headers, options)
+
+
+def record(ctypesgen, path):
+    """Return the tokens the parser reads for `path`."""
+    parser = new_parser(ctypesgen, path)
+    parser.lexer = Recorder(parser.lexer)
+    parser.parse()
+    return parser.lexer.tokens
+
+
+def replay(ctypesgen, path, tokens):
+    """Return the reductions made parsing `tokens` and the seconds they took."""
+    yacc_parser = new_parser(ctypesgen, path).parser
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        yacc_parser.parse(lexer=Replay(tokens))
+        seconds = time.perf_counter() - start
+    finally:
+        gc.enable()
+    return yacc_parser.reductions, seconds
+
+
+def bench(ctypesgen, cases, repeat):
+    results = []
+    workdir = tempfile.mkdtemp(prefix="ctypesgen-bench-")
+    try:
+        for name, header in cases:
+            path = os.path.join(workdir, "bench.h")
+            with open(path, "w") as f:
+                f.write(header)
+            tokens = record(ctypesgen, path)
+            best = None
+            for i in range(repeat):
+                reductions, seconds = replay(ctypesgen, path, tokens)
+                best = seconds if best is None else min(best, seconds)
+            results.append({"input": name, "reductions": reductions, "seconds": best})
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+
+def print_results(results):
+    print("%-16s %12s %10s %14s" % ("input", "reductions", "seconds", "reductions/s"))
+    for r in results:
+        print(
+            "%-16s %12d %10.4f %14.0f"
+            % (r["input"], r["reductions"], r["seconds"], r["reductions"] / r["seconds"])
+        )
+
+
+def export_revision(rev, dest):
+    """Extract the tree of git revision `rev` into `dest`."""
+    os.makedirs(dest)
+    archive = subprocess.Popen(["git", "archive", rev], cwd=REPO_DIR, stdout=subprocess.PIPE)
+    subprocess.check_call(["tar", "-x", "-C", dest], stdin=archive.stdout)
+    archive.stdout.close()
+    if archive.wait():
+        raise SystemExit("git archive %s failed" % rev)
+
+
+def compare(revs, argv):
+    """Run this benchmark on each of `revs` ("." being the working tree) and
+    print the rates side by side."""
+    tmpdir = tempfile.mkdtemp(prefix="ctypesgen-compare-")
+    try:
+        runs = []
+        for i, rev in enumerate(revs):
+            if rev == ".":
+                tree = REPO_DIR
+            else:
+                tree = os.path.join(tmpdir, "tree%d" % i)
+                export_revision(rev, tree)
+            out = os.path.join(tmpdir, "results%d.json" % i)
+            cmd = [sys.executable, os.path.abspath(__file__), "--tree", tree, "--json", out]
+            subprocess.check_call(cmd + argv, stdout=subprocess.DEVNULL)
+            with open(out) as f:
+                runs.append(json.load(f))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print("%-16s %12s %14s %14s %8s" % ("input", "reductions", revs[0], revs[1], "ratio"))
+    for ra, rb in zip(*runs):
+        rate_a = ra["reductions"] / ra["seconds"]
+        rate_b = rb["reductions"] / rb["seconds"]
+        print(
+            "%-16s %12d %14.0f %14.0f %7.2fx"
+            % (ra["input"], ra["reductions"], rate_a, rate_b, rate_b / rate_a)
+        )
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument(
+        "--corpus",
+        action="append",
+        metavar="NAME[:SIZE]",
+        help="corpus to parse (default: all of them)",
+    )
+    p.add_argument(
+        "--header",
+        action="append",
+        metavar="NAME",
+        help="system header to parse (default: %s)" % ", ".join(DEFAULT_HEADERS),
+    )
+    p.add_argument("--repeat", type=int, default=5, help="keep the best of N runs")
+    p.add_argument("--json", metavar="FILE", help="also save the results as JSON")
+    p.add_argument(
+        "--compare",
+        nargs="+",
+        metavar="REV",
+        help="compare git revisions; with one REV, compare it to the working tree",
+    )
+    p.add_argument("--tree", default=REPO_DIR, help=argparse.SUPPRESS)
+    args = p.parse_args(argv)
+
+    if args.compare:
+        revs = args.compare
+        if len(revs) == 1:
+            revs = revs + ["."]
+        if len(revs) != 2:
+            p.error("--compare takes one or two revisions")
+        # Pass everything else on to the benchmark of each revision
+        i = argv.index("--compare")
+        compare(revs, argv[:i] + argv[i + 1 + len(args.compare) :])
+        return
+
+    ctypesgen = import_ctypesgen(args.tree)
+    cases = []
+    for spec in args.corpus or sorted(corpus_module.CORPORA):
+        name, _, size = spec.partition(":")
+        cases.append((name, corpus_module.generate(name, int(size) if size else None).header))
+    for name in args.header or DEFAULT_HEADERS:
+        cases.append(("<%s>" % name, "#include <%s>\n" % name))
+
+    results = bench(ctypesgen, cases, args.repeat)
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
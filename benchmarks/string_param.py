@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+"""Micro-benchmark for String.from_param in the Python preamble.
+
+Every call to a wrapped function taking a char * goes through
+String.from_param.  This measures conversions per second for the common
+argument kinds, and the full call rate through libc's strlen().
+
+Usage:
+
+    python benchmarks/string_param.py [--number N]
+
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import os
+import sys
+import timeit
+
+THIS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(THIS_DIR, os.path.pardir))
+
+from ctypesgen.printer_python.printer import get_preamble
+
+
+def load_preamble():
+    """Execute the Python 3 preamble and return its namespace."""
+    path, v = get_preamble(3, 2)
+    namespace = {}
+    with open(path) as f:
+        exec(compile(f.read(), path, "exec"), namespace)
+    return namespace
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--number", type=int, default=200000, help="calls per measurement")
+    args = p.parse_args(argv)
+
+    ns = load_preamble()
+    String = ns["String"]
+    pointer = ctypes.cast(ctypes.c_char_p(b"hello"), ctypes.POINTER(ctypes.c_char))
+    cases = [
+        ("bytes", b"hello"),
+        ("str", "hello"),
+        ("None", None),
+        ("POINTER(c_char)", pointer),
+        ("c_char_p", ctypes.c_char_p(b"hello")),
+        ("c_char array", ctypes.create_string_buffer(b"hello")),
+    ]
+
+    libc = ctypes.CDLL(ctypes.util.find_library("c"))
+    strlen = libc.strlen
+    strlen.argtypes = [String]
+    strlen.restype = ctypes.c_size_t
+
+    print("%-18s %16s %16s" % ("argument", "from_param/s", "strlen() calls/s"))
+    for name, arg in cases:
+        t = timeit.timeit(lambda: String.from_param(arg), number=args.number)
+        line = "%-18s %16.0f" % (name, args.number / t)
+        if arg is not None:
+            t = timeit.timeit(lambda: strlen(arg), number=args.number)
+            line += " %16.0f" % (args.number / t)
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
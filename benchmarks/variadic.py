@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: us-ascii -*-
+# vim:ts=4:sw=4:softtabstop=4:smarttab:expandtab
+"""Micro-benchmark for _variadic_function in the Python preamble.
+
+Calls libc's snprintf() (three fixed arguments) and sprintf() (two fixed
+arguments) through the preamble's _variadic_function and through the
+previous implementation, which rebuilt the argument list on every call.
+
+Usage:
+
+    python benchmarks/variadic.py [--number N]
+
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import timeit
+
+from string_param import load_preamble
+
+
+class BaselineVariadicFunction(object):
+    """_variadic_function as it was before per-arity call specialisation."""
+
+    def __init__(self, func, restype, argtypes, errcheck):
+        self.func = func
+        self.func.restype = restype
+        self.argtypes = argtypes
+        if errcheck:
+            self.func.errcheck = errcheck
+
+    def __call__(self, *args):
+        fixed_args = []
+        i = 0
+        for argtype in self.argtypes:
+            fixed_args.append(argtype.from_param(args[i]))
+            i += 1
+        return self.func(*fixed_args + list(args[i:]))
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument("--number", type=int, default=200000, help="calls per measurement")
+    args = p.parse_args(argv)
+
+    ns = load_preamble()
+    String = ns["String"]
+    libc = ctypes.CDLL(ctypes.util.find_library("c"))
+    buf = ctypes.create_string_buffer(64)
+
+    cases = [
+        ("snprintf", [String, ctypes.c_size_t, String], (buf, 64, b"%d %d", 1, 2)),
+        ("sprintf", [String, String], (buf, b"%d %s", 1, b"x")),
+    ]
+
+    print("%-10s %14s %14s %8s" % ("function", "baseline/s", "current/s", "speedup"))
+    for name, argtypes, call_args in cases:
+        rates = []
+        for cls in (BaselineVariadicFunction, ns["_variadic_function"]):
+            # Each wrapper sets restype on the function, so give each its own
+            f = cls(getattr(ctypes.CDLL(libc._name), name), ctypes.c_int, argtypes, None)
+            t = timeit.timeit(lambda: f(*call_args), number=args.number)
+            rates.append(args.number / t)
+        print("%-10s %14.0f %14.0f %7.2fx" % (name, rates[0], rates[1], rates[1] / rates[0]))
+
+
+if __name__ == "__main__":
+    main()
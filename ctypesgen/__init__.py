@@ -33,7 +33,7 @@ Ctypesgen writes the descriptions to the output file, along with a header.
 
 The package ctypesgen.printer is responsible for the printing stage.
 
-There are three modules in ctypesgen that describe the format that the
+There are four modules in ctypesgen that describe the format that the
 parser, processor, and printer modules use to pass information. They are:
 
 * descriptions: Classes to represent the descriptions.
@@ -42,17 +42,23 @@ parser, processor, and printer modules use to pass information. They are:
 
 * expressions: Classes to represent an expression in a language-independent
 format.
+
+* locations: Where in the source files each description came from.
 """
 
 __all__ = [
+    "api",
     "parser",
     "processor",
     "printer",
     "descriptions",
     "ctypedescs",
     "expressions",
+    "locations",
+    "ir",
     "messages",
     "options",
+    "stats",
     "version",
 ]
 
@@ -75,9 +81,17 @@ VERSION = __version__
 from . import descriptions
 from . import ctypedescs
 from . import expressions
+from . import locations
+
+# Saving the descriptions between runs
+from . import ir
 
 # Helper modules
 from . import messages
 from . import options
+from . import stats
+
+# In-memory generation
+from . import api
 
 printer = printer_python  # Default the printer to generating Python
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""
+ctypesgen.api generates wrappers in memory, for programs using ctypesgen as a
+library.
+
+Headers can be given as paths or as text. Nothing is written to disk: the C
+preprocessor reads its input from a pipe, and the wrapper is returned as a
+string or as a module object which has already been executed.
+
+>>> source = generate_source(sources={"foo.h": "int foo(int x);"}, libraries=["foo"])
+>>> foo = generate_module(["/usr/include/foo.h"], libraries=["foo"])
+
+Options are taken from the `options` argument, as built by
+ctypesgen.options.get_default_options(), with any keyword arguments set on
+a copy of it.
+
+Both functions may be called from several threads at once, and always give
+the same output for the same input.
+"""
+
+import copy, json, os, types
+
+try:
+    from StringIO import StringIO  # Python 2, where the printers write str
+except ImportError:
+    from io import StringIO
+
+from . import options as core_options
+from . import parser as core_parser
+from . import printer_python, printer_json, processor
+
+__all__ = ["generate_source", "generate_module"]
+
+
+def _prepare_options(headers, sources, options, more_options):
+    if isinstance(sources, str):
+        sources = {"header.h": sources}
+    sources = sources or {}
+
+    if options is None:
+        options = core_options.get_default_options()
+    else:
+        options = copy.copy(options)
+    for opt, val in more_options.items():
+        setattr(options, opt, val)
+    options.headers = list(headers) + [name for name in sources if name not in headers]
+    if not options.headers:
+        raise ValueError("No header files or sources given")
+    return options, sources
+
+
+def _generate(options, sources):
+    descriptions = core_parser.parse(options.headers, options, sources)
+    processor.process(descriptions, options)
+
+    output = StringIO()
+    if options.output_language.startswith("py"):
+        printer_python.WrapperPrinter(output, options, descriptions)
+    elif options.output_language == "json":
+        printer_json.WrapperPrinter(output, options, descriptions)
+    else:
+        raise ValueError("No such output language `" + options.output_language + "'")
+    return output.getvalue()
+
+
+def generate_source(headers=(), sources=None, options=None, **more_options):
+    """Return the wrapper for `headers` as a string.
+
+    `headers` is a list of paths. `sources` maps further header names to
+    their text; a single string is taken as the text of "header.h".
+    """
+    options, sources = _prepare_options(headers, sources, options, more_options)
+    return _generate(options, sources)
+
+
+def generate_module(headers=(), sources=None, options=None, name=None, **more_options):
+    """Generate a Python wrapper like generate_source() and execute it.
+
+    Returns the new module object, called `name` (by default after the first
+    header). It is not added to sys.modules. JSON output is returned as the
+    decoded JSON instead, as a list of descriptions with either layout.
+    """
+    options, sources = _prepare_options(headers, sources, options, more_options)
+    source = _generate(options, sources)
+    if options.output_language == "json":
+        if getattr(options, "json_format", "array") == "ndjson":
+            return [json.loads(line) for line in source.splitlines()]
+        return json.loads(source)
+
+    if name is None:
+        name = os.path.splitext(os.path.basename(options.headers[0]))[0]
+    module = types.ModuleType(name)
+    # The library loader also searches next to the module
+    module.__file__ = os.path.join(os.getcwd(), name + ".py")
+    exec(compile(source, "<ctypesgen %s>" % name, "exec"), module.__dict__)
+    return module
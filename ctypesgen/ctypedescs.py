@@ -138,14 +138,20 @@ class CtypesType(object):
 class CtypesSimple(CtypesType):
     """Represents a builtin type, like "char" or "int"."""
 
-    def __init__(self, name, signed, longs):
+    def __init__(self, name, signed, longs, python_types=False):
         CtypesType.__init__(self)
         self.name = name
         self.signed = signed
         self.longs = longs
+        # Whether the types of ctypes_type_map_python_builtin may be used;
+        # they may not with --no-python-types
+        self._python_types = python_types
 
     def py_string(self):
-        return ctypes_type_map[(self.name, self.signed, self.longs)]
+        key = (self.name, self.signed, self.longs)
+        if self._python_types and key not in ctypes_type_map:
+            return ctypes_type_map_python_builtin[key]
+        return ctypes_type_map[key]
 
 
 class CtypesSpecial(CtypesType):
@@ -188,10 +194,16 @@ class CtypesBitfield(CtypesType):
 
 
 class CtypesPointer(CtypesType):
-    def __init__(self, destination, qualifiers):
+    def __init__(self, destination, qualifiers, destination_qualifiers=()):
         CtypesType.__init__(self)
         self.destination = destination
         self.qualifiers = qualifiers
+        # The qualifiers of what it points to alone: "const" for "const int *"
+        # but not for "int * const"
+        self._destination_qualifiers = tuple(destination_qualifiers)
+
+    def points_to_const(self):
+        return "const" in self._destination_qualifiers
 
     def visit(self, visitor):
         if self.destination:
@@ -283,6 +295,8 @@ class CtypesFunction(CtypesType):
         )
 
 
+# Tags for anonymous types created without one. The parser numbers the
+# anonymous types it finds itself, see CtypesParser.anonymous_tag().
 last_tagnum = 0
 
 
@@ -293,7 +307,7 @@ def anonymous_struct_tag():
 
 
 class CtypesStruct(CtypesType):
-    def __init__(self, tag, packed, variety, members, src=None):
+    def __init__(self, tag, packed, variety, members, src=None, anonymous=False):
         CtypesType.__init__(self)
         self.tag = tag
         self.packed = packed
@@ -304,7 +318,7 @@ class CtypesStruct(CtypesType):
             self.tag = anonymous_struct_tag()
             self.anonymous = True
         else:
-            self.anonymous = False
+            self.anonymous = anonymous
 
         if self.members == None:
             self.opaque = True
@@ -345,7 +359,7 @@ def anonymous_enum_tag():
 
 
 class CtypesEnum(CtypesType):
-    def __init__(self, tag, enumerators, src=None):
+    def __init__(self, tag, enumerators, src=None, anonymous=False):
         CtypesType.__init__(self)
         self.tag = tag
         self.enumerators = enumerators
@@ -354,7 +368,7 @@ class CtypesEnum(CtypesType):
             self.tag = anonymous_enum_tag()
             self.anonymous = True
         else:
-            self.anonymous = False
+            self.anonymous = anonymous
 
         if self.enumerators == None:
             self.opaque = True
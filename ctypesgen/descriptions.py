@@ -8,12 +8,46 @@ The descriptions module also contains a class, DescriptionCollection, to hold
 lists of Description objects.
 """
 
+import collections
+
+from . import locations
+
 
 class DescriptionCollection(object):
-    """Represents a collection of Descriptions."""
+    """Represents a collection of Descriptions.
+
+    Operations add descriptions with add(), which keeps the list of their
+    kind, all and output_order consistent. Adding a description just after
+    another one takes constant time: the description is only put in its
+    place in all when all is next read.
+
+    lookup(), by_kind(), in_file() and files() find descriptions by name,
+    kind and source file. Their indexes are built on the first query, and
+    kept up to date by add() and rename()."""
+
+    # The attribute listing the descriptions of each kind in output_order
+    _kind_lists = {
+        "constant": "constants",
+        "typedef": "typedefs",
+        "struct": "structs",
+        "enum": "enums",
+        "function": "functions",
+        "variable": "variables",
+        "macro": "macros",
+    }
 
     def __init__(
-        self, constants, typedefs, structs, enums, functions, variables, macros, all, output_order
+        self,
+        constants,
+        typedefs,
+        structs,
+        enums,
+        functions,
+        variables,
+        macros,
+        all,
+        output_order,
+        source_files=None,
     ):
         self.constants = constants
         self.typedefs = typedefs
@@ -24,14 +58,139 @@ class DescriptionCollection(object):
         self.macros = macros
         self.all = all
         self.output_order = output_order
+        # The files read by the C preprocessor, including system headers, and
+        # the symbols files read by the processor
+        self.source_files = source_files or []
+
+    @property
+    def all(self):
+        if self._after:
+            self._all = self._ordered()
+        return self._all
+
+    @all.setter
+    def all(self, descriptions):
+        self._all = descriptions
+        if not hasattr(self, "_after"):
+            # id(description) -> (description, the descriptions added just
+            # after it, in order). The description is kept so that its id()
+            # is not reused. Descriptions still to be put in place are put in
+            # the new list too.
+            self._after = {}
+        # (namespace, name) -> descriptions, and source file ID -> descriptions
+        self._by_name = None
+        self._by_file = None
+
+    def add(self, kind, desc, after=None):
+        """Add `desc`, a description of `kind` as in output_order, to the end
+        of output_order, and to all, at the end or just after description
+        `after`."""
+        getattr(self, self._kind_lists[kind]).append(desc)
+        self.output_order.append((kind, desc))
+        if after is None:
+            self._all.append(desc)
+        else:
+            self._after.setdefault(id(after), (after, []))[1].append(desc)
+        if self._by_name is not None:
+            self._index(desc)
+
+    def rename(self, desc, name):
+        """Change the name (or for a struct, union or enum, the tag) of
+        description `desc` to `name`."""
+        if self._by_name is not None:
+            self._by_name[(desc.namespace, desc.index_name())].remove(desc)
+        if desc.namespace == "ordinary":
+            desc.name = name
+        else:
+            desc.tag = name
+        if self._by_name is not None:
+            self._by_name.setdefault((desc.namespace, name), []).append(desc)
+
+    def lookup(self, name, namespace="ordinary"):
+        """Return the descriptions named `name` in `namespace`: "ordinary"
+        for constants, typedefs, functions, variables and macros, "struct"
+        for struct and union tags, or "enum" for enum tags."""
+        self._build_indexes()
+        return list(self._by_name.get((namespace, name), ()))
+
+    def by_kind(self, kind):
+        """Return the descriptions of `kind`, as in output_order."""
+        return list(getattr(self, self._kind_lists[kind]))
+
+    def in_file(self, filename):
+        """Return the descriptions from source file `filename`."""
+        self._build_indexes()
+        return list(self._by_file.get(locations.file_id(filename), ()))
+
+    def files(self):
+        """Return the source files of the descriptions, in the order of
+        their first description."""
+        self._build_indexes()
+        return [locations.file_name(id) for id in self._by_file]
+
+    def _build_indexes(self):
+        if self._by_name is None:
+            self._by_name = {}
+            self._by_file = collections.OrderedDict()
+            for desc in self.all:
+                self._index(desc)
+
+    def _index(self, desc):
+        self._by_name.setdefault((desc.namespace, desc.index_name()), []).append(desc)
+        if desc.location is not None:
+            self._by_file.setdefault(locations.file_id_of(desc.location), []).append(desc)
+
+    def _ordered(self):
+        ordered = []
+        for desc in self._all:
+            stack = [desc]
+            while stack:
+                desc = stack.pop()
+                ordered.append(desc)
+                stack.extend(reversed(self._after.pop(id(desc), (None, ()))[1]))
+        if self._after:
+            raise ValueError("descriptions were added after descriptions not in the collection")
+        return ordered
+
+    def __getstate__(self):
+        # Put the added descriptions in place, as _after is keyed by id(), and
+        # leave out the indexes, which are rebuilt when needed
+        self.all
+        state = dict(self.__dict__)
+        state["_by_name"] = state["_by_file"] = None
+        return state
+
+
+# Until a description has requirements, dependents, errors or warnings, it
+# shares these empty ones, and gets its own set or list on the first write.
+_no_descriptions = frozenset()
+_no_messages = ()
 
 
 class Description(object):
     """Represents a constant, typedef, struct, function, variable, enum,
-    or macro description. Description is an abstract base class."""
+    or macro description. Description is an abstract base class.
+
+    Descriptions have __slots__ rather than a __dict__, as there can be
+    hundreds of thousands of them: new attributes must be added to the
+    __slots__ of the class."""
+
+    __slots__ = (
+        "location",
+        "include_rule",
+        "requirements",
+        "dependents",
+        "errors",
+        "warnings",
+        # Set by the processor
+        "can_include",
+        "included",
+    )
 
     def __init__(self, src=None):
-        self.src = src  # A tuple of (filename, lineno)
+        # A handle from ctypesgen.locations; src is the (filename, lineno)
+        # tuple it stands for
+        self.location = locations.from_src(src)
 
         # If object will be included in output file. Values are "yes", "never",
         # and "if_needed".
@@ -40,8 +199,8 @@ class Description(object):
         # A word about requirements, and dependents:
         # If X requires Y, Y is in X.requirements.
         # If X is in Y.requirements, then Y is in X.dependents.
-        self.requirements = set()
-        self.dependents = set()
+        self.requirements = _no_descriptions
+        self.dependents = _no_descriptions
 
         # If the processor module finds a fatal error that prevents a
         # a description from being output, then it appends a string describing
@@ -52,18 +211,50 @@ class Description(object):
         # If there is anything in 'errors' after processing is complete, the
         # description is not output.
 
-        self.errors = []
-        self.warnings = []
+        self.errors = _no_messages
+        self.warnings = _no_messages
+
+    @property
+    def src(self):
+        return locations.src(self.location)
+
+    @src.setter
+    def src(self, src):
+        self.location = locations.from_src(src)
+
+    def __getstate__(self):
+        # Location handles depend on the order files were seen in this
+        # process, so (filename, lineno) is saved instead
+        state = {}
+        for cls in type(self).__mro__:
+            for name in getattr(cls, "__slots__", ()):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+        state["location"] = self.src
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.src = state["location"]
 
     def add_requirements(self, reqs):
-        self.requirements = self.requirements.union(reqs)
+        requirements = set(self.requirements)
+        requirements.update(reqs)
+        self.requirements = requirements
         for req in reqs:
+            if not isinstance(req.dependents, set):
+                req.dependents = set(req.dependents)
             req.dependents.add(self)
 
     def error(self, msg, cls=None):
+        if not isinstance(self.errors, list):
+            self.errors = list(self.errors)
         self.errors.append((msg, cls))
 
     def warning(self, msg, cls=None):
+        if not isinstance(self.warnings, list):
+            self.warnings = list(self.warnings)
         self.warnings.append((msg, cls))
 
     def __repr__(self):
@@ -78,10 +269,20 @@ class Description(object):
     def c_name(self):
         """Return the name associated with this description in C code."""
 
+    # The C namespace of the name: "ordinary", "struct" (for structs and
+    # unions) or "enum", as used by DescriptionCollection.lookup()
+    namespace = "ordinary"
+
+    def index_name(self):
+        """Return the name of this description in its namespace."""
+        return self.name
+
 
 class ConstantDescription(Description):
     """Simple class to contain information about a constant."""
 
+    __slots__ = ("name", "value")
+
     def __init__(self, name, value, src=None):
         Description.__init__(self, src)
         # Name of constant, a string
@@ -102,6 +303,8 @@ class ConstantDescription(Description):
 class TypedefDescription(Description):
     """Simple container class for a type definition."""
 
+    __slots__ = ("name", "ctype")
+
     def __init__(self, name, ctype, src=None):
         Description.__init__(self, src)
         self.name = name  # Name, a string
@@ -120,6 +323,10 @@ class TypedefDescription(Description):
 class StructDescription(Description):
     """Simple container class for a structure or union definition."""
 
+    __slots__ = ("tag", "packed", "variety", "members", "opaque", "ctype")
+
+    namespace = "struct"
+
     def __init__(self, tag, packed, variety, members, opaque, ctype, src=None):
         Description.__init__(self, src)
         # The name of the structure minus the "struct" or "union"
@@ -143,10 +350,17 @@ class StructDescription(Description):
     def c_name(self):
         return "%s %s" % (self.variety, self.tag)
 
+    def index_name(self):
+        return self.tag
+
 
 class EnumDescription(Description):
     """Simple container class for an enum definition."""
 
+    __slots__ = ("tag", "members", "ctype", "opaque")
+
+    namespace = "enum"
+
     def __init__(self, tag, members, ctype, src=None):
         Description.__init__(self, src)
         # The name of the enum, minus the "enum"
@@ -165,10 +379,15 @@ class EnumDescription(Description):
     def c_name(self):
         return "enum %s" % self.tag
 
+    def index_name(self):
+        return self.tag
+
 
 class FunctionDescription(Description):
     """Simple container class for a C function."""
 
+    __slots__ = ("name", "cname", "restype", "argtypes", "errcheck", "variadic", "source_library")
+
     def __init__(self, name, restype, argtypes, errcheck, variadic=False, src=None):
         Description.__init__(self, src)
         # Name, a string
@@ -197,6 +416,8 @@ class FunctionDescription(Description):
 class VariableDescription(Description):
     """Simple container class for a C variable declaration."""
 
+    __slots__ = ("name", "cname", "ctype", "source_library")
+
     def __init__(self, name, ctype, src=None):
         Description.__init__(self, src)
         # Name, a string
@@ -219,6 +440,8 @@ class VariableDescription(Description):
 class MacroDescription(Description):
     """Simple container class for a C macro."""
 
+    __slots__ = ("name", "params", "expr", "original_string")
+
     def __init__(self, name, params, expr, src=None):
         Description.__init__(self, src)
         self.name = name
@@ -48,10 +48,16 @@ class EvaluationContext(object):
 
 
 class ExpressionNode(object):
+    # Expression nodes have __slots__, as there are many of them. Until a
+    # node has errors it shares an empty tuple, and gets a list on the first.
+    __slots__ = ("errors",)
+
     def __init__(self):
-        self.errors = []
+        self.errors = ()
 
     def error(self, message, cls=None):
+        if not isinstance(self.errors, list):
+            self.errors = list(self.errors)
         self.errors.append((message, cls))
 
     def __repr__(self):
@@ -67,6 +73,8 @@ class ExpressionNode(object):
 
 
 class ConstantExpressionNode(ExpressionNode):
+    __slots__ = ("value",)
+
     def __init__(self, value):
         ExpressionNode.__init__(self)
         self.value = value
@@ -85,6 +93,8 @@ class ConstantExpressionNode(ExpressionNode):
 
 
 class IdentifierExpressionNode(ExpressionNode):
+    __slots__ = ("name",)
+
     def __init__(self, name):
         ExpressionNode.__init__(self)
         self.name = name
@@ -103,6 +113,8 @@ class IdentifierExpressionNode(ExpressionNode):
 
 
 class ParameterExpressionNode(ExpressionNode):
+    __slots__ = ("name",)
+
     def __init__(self, name):
         ExpressionNode.__init__(self)
         self.name = name
@@ -120,6 +132,8 @@ class ParameterExpressionNode(ExpressionNode):
 
 
 class UnaryExpressionNode(ExpressionNode):
+    __slots__ = ("name", "op", "format", "child_can_be_ctype", "child")
+
     def __init__(self, name, op, format, child_can_be_ctype, child):
         ExpressionNode.__init__(self)
         self.name = name
@@ -143,6 +157,8 @@ class UnaryExpressionNode(ExpressionNode):
 
 
 class SizeOfExpressionNode(ExpressionNode):
+    __slots__ = ("child",)
+
     def __init__(self, child):
         ExpressionNode.__init__(self)
         self.child = child
@@ -165,6 +181,8 @@ class SizeOfExpressionNode(ExpressionNode):
 
 
 class BinaryExpressionNode(ExpressionNode):
+    __slots__ = ("name", "op", "format", "can_be_ctype", "left", "right")
+
     def __init__(self, name, op, format, can_be_ctype, left, right):
         ExpressionNode.__init__(self)
         self.name = name
@@ -193,6 +211,8 @@ class BinaryExpressionNode(ExpressionNode):
 
 
 class ConditionalExpressionNode(ExpressionNode):
+    __slots__ = ("cond", "yes", "no")
+
     def __init__(self, cond, yes, no):
         ExpressionNode.__init__(self)
         self.cond = cond
@@ -220,6 +240,8 @@ class ConditionalExpressionNode(ExpressionNode):
 
 
 class AttributeExpressionNode(ExpressionNode):
+    __slots__ = ("op", "format", "base", "attribute")
+
     def __init__(self, op, format, base, attribute):
         ExpressionNode.__init__(self)
         self.op = op
@@ -250,6 +272,8 @@ class AttributeExpressionNode(ExpressionNode):
 
 
 class CallExpressionNode(ExpressionNode):
+    __slots__ = ("function", "arguments")
+
     def __init__(self, function, arguments):
         ExpressionNode.__init__(self)
         self.function = function
@@ -274,6 +298,8 @@ class CallExpressionNode(ExpressionNode):
 # There seems not to be any reasonable way to translate C typecasts
 # into Python. Ctypesgen doesn't try, except for the special case of NULL.
 class TypeCastExpressionNode(ExpressionNode):
+    __slots__ = ("base", "ctype", "isnull")
+
     def __init__(self, base, ctype):
         ExpressionNode.__init__(self)
         self.base = base
@@ -303,6 +329,8 @@ class TypeCastExpressionNode(ExpressionNode):
 
 
 class UnsupportedExpressionNode(ExpressionNode):
+    __slots__ = ("message",)
+
     def __init__(self, message):
         ExpressionNode.__init__(self)
         self.message = message
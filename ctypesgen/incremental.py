@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+"""
+ctypesgen.incremental skips regenerating a wrapper when nothing it was
+generated from has changed, and leaves the output file untouched when the
+regenerated wrapper is the same.
+
+With --incremental, a manifest is saved next to the output, as
+FILE.manifest.json. It records:
+
+ * a hash of the options and the ctypesgen version,
+ * every file read by the C preprocessor, and the files inserted in the
+   output or read for --header-template, with its size, modification time
+   and hash,
+ * the output file, and the hash of each description printed to it: the
+   description is identified by its kind, name and source file, and the hash
+   covers its text and the names of the descriptions it requires.
+
+The next run with the same options stops early if none of the input files
+changed (a file whose time changed but whose contents did not counts as
+unchanged). Otherwise the headers are parsed again, the descriptions which
+were added, changed or removed are reported, and the output is only
+rewritten if its text is different. Its modification time then only changes
+with its contents, so that build steps depending on it are not rerun.
+
+All headers are preprocessed and parsed together, as one translation unit,
+so a change to any of them means parsing all of them.
+"""
+
+import hashlib, json, os
+
+from . import locations, version
+from .messages import status_message
+
+__all__ = [
+    "Manifest",
+    "manifest_path",
+    "options_key",
+    "file_state",
+    "input_files",
+    "description_hashes",
+    "update",
+]
+
+MANIFEST_VERSION = 3
+
+# Options which do not change the output
+_unkeyed_options = set(
+    [
+        "incremental",
+        "watch",
+        "watch_interval",
+        "stats",
+        "show_stats",
+        "stats_json",
+        "parser_profile",
+        "profile_parser",
+        "profile_parser_json",
+        "save_ir",
+    ]
+)
+
+
+def manifest_path(output):
+    return output + ".manifest.json"
+
+
+def _hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def options_key(options):
+    """Return a hash of everything in `options` which affects the output."""
+    items = sorted(
+        (name, value) for name, value in vars(options).items() if name not in _unkeyed_options
+    )
+    text = json.dumps([version.VERSION_NUMBER, items], default=repr)
+    return _hash(text.encode("utf-8"))
+
+
+def file_state(path):
+    """Return the size, modification time and hash of file `path`."""
+    st = os.stat(path)
+    with open(path, "rb") as f:
+        digest = _hash(f.read())
+    return {"size": st.st_size, "mtime": st.st_mtime, "sha1": digest}
+
+
+def _unchanged(path, state):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    if st.st_size != state["size"]:
+        return False
+    if st.st_mtime == state["mtime"]:
+        return True
+    return file_state(path)["sha1"] == state["sha1"]
+
+
+def input_files(options, data):
+    """Return the files the wrapper for the DescriptionCollection `data` is
+    generated from with `options`: the source files and the files the
+    printer reads."""
+    files = list(data.source_files)
+    files.extend(options.inserted_files or [])
+    if options.header_template:
+        files.append(options.header_template)
+    return files
+
+
+def description_id(kind, desc):
+    src = locations.filename(desc.location) if desc.location is not None else ""
+    return "%s %s %s" % (kind, desc.py_name(), src)
+
+
+def description_hashes(printer, data):
+    """Return {identity: hash} for each description printed by `printer`."""
+    hashes = {}
+    for kind, desc in data.output_order:
+        if desc.included:
+            text = printer.render_description(kind, desc)
+            requirements = sorted(req.casual_name() for req in desc.requirements)
+            text = "\n".join([text] + requirements)
+            hashes[description_id(kind, desc)] = _hash(text.encode("utf-8"))
+    return hashes
+
+
+class Manifest(object):
+    """What a wrapper was generated from, as saved next to it."""
+
+    def __init__(self, key, inputs, output, descriptions):
+        self.key = key
+        self.inputs = inputs  # path -> file_state()
+        self.output = output  # file_state() of the output
+        self.descriptions = descriptions  # description_id() -> hash
+
+    @classmethod
+    def load(cls, path):
+        """Return the manifest saved in `path`, or None if there is none
+        which this version of ctypesgen can use."""
+        try:
+            with open(path) as f:
+                d = json.load(f)
+            if d.get("version") != MANIFEST_VERSION:
+                return None
+            return cls(d["key"], d["inputs"], d["output"], d["descriptions"])
+        except (IOError, OSError, ValueError, KeyError, AttributeError):
+            return None
+
+    def save(self, path):
+        d = {
+            "version": MANIFEST_VERSION,
+            "key": self.key,
+            "inputs": self.inputs,
+            "output": self.output,
+            "descriptions": self.descriptions,
+        }
+        with open(path, "w") as f:
+            json.dump(d, f, indent=1, sort_keys=True)
+            f.write("\n")
+
+    def changed_inputs(self):
+        """Return the input files which changed since the manifest was saved."""
+        return [path for path, state in self.inputs.items() if not _unchanged(path, state)]
+
+    def up_to_date(self, key, output):
+        """Is the wrapper in `output` still what the options `key` generate?"""
+        return self.key == key and _unchanged(output, self.output) and not self.changed_inputs()
+
+
+def update(output, text, key, files, hashes, previous=None):
+    """Write the wrapper `text` to `output` if it changed, and save its
+    manifest, with the options `key`, the input_files() `files` and the
+    description_hashes() `hashes`. `previous` is the manifest of the last
+    run, if any. Returns True if the output was written."""
+    if previous is not None:
+        old = previous.descriptions
+        added = [d for d in hashes if d not in old]
+        removed = [d for d in old if d not in hashes]
+        changed = [d for d in hashes if d in old and old[d] != hashes[d]]
+        status_message(
+            "%d descriptions added, %d changed, %d removed."
+            % (len(added), len(changed), len(removed))
+        )
+
+    encoded = text if isinstance(text, bytes) else text.encode("utf-8")
+    try:
+        with open(output, "rb") as f:
+            written = f.read() != encoded
+    except (IOError, OSError):
+        written = True
+    if written:
+        with open(output, "wb") as f:
+            f.write(encoded)
+    else:
+        status_message("%s is unchanged." % output)
+
+    inputs = {}
+    for name in files:
+        if os.path.isfile(name):
+            path = os.path.abspath(name)
+            inputs[path] = file_state(path)
+    Manifest(key, inputs, file_state(output), hashes).save(manifest_path(output))
+    return written
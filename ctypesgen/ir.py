@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+"""
+ctypesgen.ir saves the descriptions of processed headers to a file and loads
+them back, for --save-ir and --load-ir, so that several printers (or several
+runs of one with different options) share one parse.
+
+The file holds the whole DescriptionCollection: descriptions with their
+type trees and expressions, requirements and dependents, and whether each is
+included, along with the names of the headers, which the printers use. It
+is a pickle compressed with zlib, after a header giving the format version
+and the version of ctypesgen which wrote it; only the same version of
+ctypesgen can load it.
+
+Expressions keep the lambdas from the grammar that evaluate them. These are
+saved as the position of their code among the lambdas and nested functions
+of the module defining them, and rebuilt from the module when loaded. Only
+classes defined in ctypesgen and a few built-in types are loaded, but as
+with any pickle, only load files you wrote.
+"""
+
+import importlib, inspect, io, pickle, pkgutil, struct, sys, types, zlib
+
+try:
+    import builtins
+except ImportError:
+    import __builtin__ as builtins
+
+from . import version
+
+__all__ = ["IRError", "save", "load"]
+
+MAGIC = b"ctypesgen IR\n"
+IR_VERSION = 4
+
+_header = struct.Struct("!HH")  # IR version, length of the ctypesgen version
+
+# Builtins which may appear in the descriptions
+_safe_builtins = set(["set", "frozenset", "complex", "bytearray", "slice", "range"])
+
+# Module name -> (code objects of the functions _Pickler can save, {code: index})
+_code_tables = {}
+
+
+class IRError(Exception):
+    pass
+
+
+def _is_ctypesgen_module(name):
+    return name == "ctypesgen" or name.startswith("ctypesgen.")
+
+
+def _code_table(module_name):
+    table = _code_tables.get(module_name)
+    if table is None:
+        module = importlib.import_module(module_name)
+        codes = []
+
+        # Only the functions with "<" in their __qualname__ (lambdas and
+        # functions defined in functions, not comprehensions) and without
+        # closures
+        def walk(code, in_function):
+            for const in code.co_consts:
+                if isinstance(const, types.CodeType):
+                    name = const.co_name
+                    nested = in_function and not name.startswith("<")
+                    if (nested or name == "<lambda>") and not const.co_freevars:
+                        codes.append(const)
+                    walk(const, in_function or bool(const.co_flags & inspect.CO_NEWLOCALS))
+
+        # Python 2 modules have no __loader__
+        loader = getattr(module, "__loader__", None) or pkgutil.get_loader(module_name)
+        walk(loader.get_code(module_name), False)
+        indexes = {}
+        for i, code in enumerate(codes):
+            indexes.setdefault(code, i)
+        table = _code_tables[module_name] = (codes, indexes)
+    return table
+
+
+def _is_local(func):
+    # Lambdas and functions defined in functions, which pickle cannot save by
+    # name
+    qualname = getattr(func, "__qualname__", None)
+    if qualname is not None:
+        return "<" in qualname
+    # Python 2 functions have no __qualname__
+    return getattr(sys.modules.get(func.__module__), func.__name__, None) is not func
+
+
+class _Pickler(pickle.Pickler):
+    def persistent_id(self, obj):
+        if not isinstance(obj, types.FunctionType) or not _is_local(obj):
+            return None
+        index = None
+        if _is_ctypesgen_module(obj.__module__) and not obj.__code__.co_freevars:
+            index = _code_table(obj.__module__)[1].get(obj.__code__)
+        if index is None:
+            raise pickle.PicklingError("can't save function %s" % obj.__name__)
+        return ("code", obj.__module__, index)
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file):
+        pickle.Unpickler.__init__(self, file)
+        self.functions = {}
+
+    def find_class(self, module, name):
+        # Dotted names would reach through the attributes of the module
+        if "." not in name:
+            if module in ("builtins", "__builtin__") and name in _safe_builtins:
+                return getattr(builtins, name)
+            if _is_ctypesgen_module(module):
+                obj = getattr(importlib.import_module(module), name, None)
+                if isinstance(obj, type) and _is_ctypesgen_module(obj.__module__):
+                    return obj
+        raise pickle.UnpicklingError("%s.%s is not allowed in an IR file" % (module, name))
+
+    def persistent_load(self, pid):
+        if pid not in self.functions:
+            kind, module_name, index = pid
+            if kind != "code" or not _is_ctypesgen_module(module_name):
+                raise pickle.UnpicklingError("bad function in IR file: %r" % (pid,))
+            codes = _code_table(module_name)[0]
+            if not isinstance(index, int) or not 0 <= index < len(codes):
+                raise pickle.UnpicklingError("bad function in IR file: %r" % (pid,))
+            code = codes[index]
+            module = sys.modules[module_name]
+            self.functions[pid] = types.FunctionType(code, module.__dict__, code.co_name)
+        return self.functions[pid]
+
+
+def save(descriptions, headers, path):
+    """Save the DescriptionCollection `descriptions`, parsed from the files
+    `headers`, to file `path`."""
+    data = io.BytesIO()
+    _Pickler(data, pickle.HIGHEST_PROTOCOL).dump((descriptions, list(headers)))
+    ctypesgen_version = version.VERSION_NUMBER.encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(_header.pack(IR_VERSION, len(ctypesgen_version)))
+        f.write(ctypesgen_version)
+        f.write(zlib.compress(data.getvalue()))
+
+
+def load(path):
+    """Return the DescriptionCollection and the list of headers saved in
+    file `path`. Raises IRError if it is not an IR file this version of
+    ctypesgen can load."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        raise IRError("%s is not a ctypesgen IR file" % path)
+    pos = len(MAGIC)
+    try:
+        ir_version, length = _header.unpack_from(data, pos)
+    except struct.error:
+        raise IRError("%s is truncated" % path)
+    pos += _header.size
+    ctypesgen_version = data[pos : pos + length].decode("utf-8", "replace")
+    if ir_version != IR_VERSION or ctypesgen_version != version.VERSION_NUMBER:
+        raise IRError(
+            "%s was saved by ctypesgen %s (IR version %d), not %s (IR version %d)"
+            % (path, ctypesgen_version, ir_version, version.VERSION_NUMBER, IR_VERSION)
+        )
+    try:
+        descriptions, headers = _Unpickler(io.BytesIO(zlib.decompress(data[pos + length :]))).load()
+    except Exception as e:
+        raise IRError("%s is damaged: %s" % (path, e))
+    return descriptions, headers
@@ -154,6 +154,7 @@ class DarwinLibraryLoader(LibraryLoader):
 
 class PosixLibraryLoader(LibraryLoader):
     _ld_so_cache = None
+    _ld_so_cache_dirs = None
 
     def _create_ld_so_cache(self):
         # Recreate search path followed by ld.so.  This is going to be
@@ -220,9 +221,12 @@ class PosixLibraryLoader(LibraryLoader):
                 pass
 
         self._ld_so_cache = cache
+        self._ld_so_cache_dirs = list(self.other_dirs)
 
     def getplatformpaths(self, libname):
-        if self._ld_so_cache is None:
+        # A long-running process may change the search directories between
+        # loads; the cache is only rebuilt when it does.
+        if self._ld_so_cache is None or self._ld_so_cache_dirs != self.other_dirs:
             self._create_ld_so_cache()
 
         result = self._ld_so_cache.get(libname)
@@ -314,7 +318,8 @@ def add_library_search_dirs(other_dirs):
     for F in other_dirs:
         if not os.path.isabs(F):
             F = os.path.abspath(F)
-        loader.other_dirs.append(F)
+        if F not in loader.other_dirs:
+            loader.other_dirs.append(F)
 
 
 load_library = loader.load_library
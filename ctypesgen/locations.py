@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""
+ctypesgen.locations records where in the source files descriptions came from,
+as one integer per location.
+
+Each source file is given a file ID the first time it is seen, and its name
+is kept once, in a table shared by the whole process. A location is the file
+ID and the line number packed into one integer, a handle: descriptions hold
+their handle rather than a (filename, lineno) tuple. Handles of the same file
+sort by line, and grouping by file only needs file_id_of().
+
+>>> handle = location("/usr/include/stdio.h", 42)
+>>> src(handle)
+('/usr/include/stdio.h', 42)
+
+The table only grows with the number of distinct file names, so it stays
+small in long-running processes such as --watch and the server.
+"""
+
+import sys, threading
+
+__all__ = [
+    "location",
+    "src",
+    "from_src",
+    "filename",
+    "lineno",
+    "file_id",
+    "file_id_of",
+    "file_name",
+]
+
+_LINE_BITS = 32
+_LINE_MASK = (1 << _LINE_BITS) - 1
+_SIGN = 1 << (_LINE_BITS - 1)
+
+# File ID -> file name, and file name -> file ID. Parsers in other threads
+# may add names at the same time, so new IDs are given under _lock.
+_names = []
+_ids = {}
+_lock = threading.Lock()
+
+try:
+    _intern = sys.intern
+except AttributeError:
+    _intern = intern
+
+
+def file_id(name):
+    """Return the file ID of the file `name`, giving it one if needed."""
+    try:
+        return _ids[name]
+    except KeyError:
+        with _lock:
+            if name not in _ids:
+                name = _intern(name)
+                _names.append(name)
+                _ids[name] = len(_names) - 1
+            return _ids[name]
+
+
+def file_name(id):
+    """Return the name of the file with ID `id`."""
+    return _names[id]
+
+
+def file_id_of(handle):
+    """Return the file ID of the file of `handle`."""
+    return handle >> _LINE_BITS
+
+
+def location(filename, lineno):
+    """Return the handle of line `lineno` of file `filename`. The line may be
+    0 or negative (-1 for built-in tokens), as the parser uses these."""
+    return (file_id(filename) << _LINE_BITS) | (int(lineno) & _LINE_MASK)
+
+
+def filename(handle):
+    return _names[handle >> _LINE_BITS]
+
+
+def lineno(handle):
+    line = handle & _LINE_MASK
+    if line & _SIGN:
+        line -= 1 << _LINE_BITS
+    return line
+
+
+def src(handle):
+    """Return the (filename, lineno) tuple of `handle`, or None if `handle`
+    is None."""
+    if handle is None:
+        return None
+    return filename(handle), lineno(handle)
+
+
+def from_src(src):
+    """Return the handle of a (filename, lineno) tuple, or None if `src` is
+    None."""
+    if src is None:
+        return None
+    return location(*src)
@@ -4,13 +4,22 @@
 Main loop for ctypesgen.
 """
 
-import optparse, sys
+import copy, optparse, os, sys
+
+try:
+    from StringIO import StringIO  # Python 2, where the printers write str
+except ImportError:
+    from io import StringIO
 
 from . import options as core_options
 from . import parser as core_parser
 from . import printer_python, printer_json, processor
 from . import messages as msgs
 from . import version
+from . import stats
+from . import incremental
+from . import ir
+from . import watch
 
 
 def find_names_in_modules(modules):
@@ -45,8 +54,91 @@ def option_callback_libdir(option, opt, value, parser):
     parser.values.runtime_libdirs.append(value)
 
 
+def generate(options, printer):
+    """Parse, process and print the headers in `options`. Returns the
+    files the wrapper was generated from."""
+    if options.show_stats or options.stats_json:
+        options.stats = stats.Stats()
+    if options.profile_parser or options.profile_parser_json:
+        options.parser_profile = stats.ParserProfile()
+
+    if options.incremental:
+        manifest = incremental.Manifest.load(incremental.manifest_path(options.output))
+        key = incremental.options_key(options)
+        if manifest is not None and manifest.up_to_date(key, options.output):
+            if not options.save_ir or os.path.exists(options.save_ir):
+                msgs.status_message("%s is up to date." % options.output)
+                return list(manifest.inputs)
+
+    if options.load_ir:
+        # Steps 1 and 2 were done by the run which saved it
+        with stats.phase(options, "loading IR"):
+            descriptions, options.headers = ir.load(options.load_ir)
+    else:
+        # Step 1: Parse
+        descriptions = core_parser.parse(options.headers, options)
+
+        # Step 2: Process
+        processor.process(descriptions, options)
+
+    if options.save_ir:
+        with stats.phase(options, "saving IR"):
+            ir.save(descriptions, options.headers, options.save_ir)
+        msgs.status_message("Saved descriptions to %s." % options.save_ir)
+
+    # Step 3: Print
+    with stats.phase(options, "printing"):
+        if options.incremental:
+            output = StringIO()
+            p = printer(output, options, descriptions)
+            incremental.update(
+                options.output,
+                output.getvalue(),
+                key,
+                incremental.input_files(options, descriptions),
+                incremental.description_hashes(p, descriptions),
+                manifest,
+            )
+        else:
+            printer(options.output, options, descriptions)
+
+    msgs.status_message("Wrapping complete.")
+
+    if options.show_stats:
+        sys.stderr.write(options.stats.format_table() + "\n")
+    if options.stats_json:
+        options.stats.save_json(options.stats_json)
+    if options.profile_parser:
+        sys.stderr.write(options.parser_profile.format_table() + "\n")
+    if options.profile_parser_json:
+        options.parser_profile.save_json(options.profile_parser_json)
+
+    # Correct what may be a common mistake
+    if descriptions.all == []:
+        if not options.all_headers:
+            msgs.warning_message(
+                "There wasn't anything of use in the "
+                "specified header file(s). Perhaps you meant to run with "
+                "--all-headers to include objects from included sub-headers? ",
+                cls="usage",
+            )
+
+    return incremental.input_files(options, descriptions)
+
+
 def main(givenargs=None):
-    usage = "usage: %prog [options] /path/to/header.h ..."
+    args = sys.argv[1:] if givenargs is None else list(givenargs)
+    if args and args[0] in ("serve", "client"):
+        # Unix sockets are not available everywhere, so import on demand
+        from . import server
+
+        return getattr(server, args[0])(args[1:])
+
+    usage = (
+        "usage: %prog [options] /path/to/header.h ...\n"
+        "       %prog serve [--socket PATH] [--workers N]\n"
+        "       %prog client [--socket PATH] [options] /path/to/header.h ..."
+    )
     op = optparse.OptionParser(usage=usage, version=version.VERSION_NUMBER)
 
     # Parameters
@@ -155,8 +247,8 @@ def main(givenargs=None):
         dest="optimize_lexer",
         action="store_true",
         default=False,
-        help="Run the lexer in optimized mode.  This mode requires write "
-        "access to lextab.py file stored within the ctypesgen package.",
+        help="Does nothing; kept for compatibility. The lexer tables are "
+        "always cached, in $CTYPESGEN_CACHE_DIR or ~/.cache/ctypesgen.",
     )
 
     # Processor options
@@ -198,6 +290,25 @@ def main(givenargs=None):
         default=None,
         help="regular expression for symbols to exclude",
     )
+    op.add_option(
+        "",
+        "--include-symbols-file",
+        dest="include_symbols_files",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="always include the symbols listed in FILE: one exact name, glob pattern "
+        "or 're:'-prefixed regular expression per line",
+    )
+    op.add_option(
+        "",
+        "--exclude-symbols-file",
+        dest="exclude_symbols_files",
+        action="append",
+        default=[],
+        metavar="FILE",
+        help="exclude the symbols listed in FILE, in the format of --include-symbols-file",
+    )
     op.add_option(
         "",
         "--no-stddef-types",
@@ -249,6 +360,38 @@ def main(givenargs=None):
         metavar="FILENAME",
         help="Add the contents of FILENAME to the end of the wrapper file.",
     )
+    op.add_option(
+        "",
+        "--buffer-args",
+        action="store_true",
+        dest="buffer_args",
+        default=False,
+        help="Let pointer parameters (to numbers, structs or void) also accept "
+        "any object supporting the buffer protocol, such as bytearray, "
+        "array.array, mmap or numpy arrays, without copying it.",
+    )
+    op.add_option(
+        "",
+        "--numpy-dtypes",
+        action="store_true",
+        dest="numpy_dtypes",
+        default=False,
+        help="Give every struct and union a numpy dtype with the same layout "
+        "(as STRUCT._numpy_dtype_) and add numpy_dtype() and "
+        "as_numpy_array() helpers to the wrapper. numpy is only imported "
+        "when these are used.",
+    )
+    op.add_option(
+        "",
+        "--batch-functions",
+        action="store_true",
+        dest="batch_functions",
+        default=False,
+        help="Give functions that take and return only numbers a batch() "
+        "method which calls them once per element of buffers such as "
+        "array.array or numpy arrays. The loop runs in C when a C compiler "
+        "is available. Needs Python 3.",
+    )
     op.add_option(
         "",
         "--output-language",
@@ -263,6 +406,34 @@ def main(givenargs=None):
         "(py) attempts to select `py32', `py27', or `py25' based on the "
         "version of Python that runs this script.",
     )
+    op.add_option(
+        "",
+        "--json-format",
+        dest="json_format",
+        metavar="FORMAT",
+        default="array",
+        choices=("array", "ndjson"),
+        help="Layout of JSON output: `array' [default] writes a single array "
+        "of descriptions, `ndjson' writes one description per line. Both are "
+        "written as the descriptions are rendered.",
+    )
+    op.add_option(
+        "",
+        "--json-compact",
+        action="store_true",
+        dest="json_compact",
+        default=False,
+        help="Write JSON output without indentation, spaces or sorted keys.",
+    )
+    op.add_option(
+        "",
+        "--json-type-table",
+        action="store_true",
+        dest="json_type_table",
+        default=False,
+        help="Write each distinct type once in JSON output, as a `ctype' item "
+        'with an ID, and refer to it elsewhere as {"$ref": ID}.',
+    )
 
     # Error options
     op.add_option(
@@ -290,7 +461,87 @@ def main(givenargs=None):
         help="Do not print macro warnings.",
     )
 
-    op.set_defaults(**core_options.default_values)
+    op.add_option(
+        "",
+        "--incremental",
+        action="store_true",
+        default=False,
+        dest="incremental",
+        help="Save a manifest next to the output file, skip the run when "
+        "none of the headers it was generated from changed, and only rewrite "
+        "the output when it is different.",
+    )
+    op.add_option(
+        "",
+        "--watch",
+        action="store_true",
+        default=False,
+        dest="watch",
+        help="Keep running, and regenerate the wrapper (as with --incremental) "
+        "whenever a file it was generated from changes.",
+    )
+    op.add_option(
+        "",
+        "--watch-interval",
+        type="float",
+        default=0.5,
+        dest="watch_interval",
+        metavar="SECONDS",
+        help="How often --watch looks for changes (default: 0.5). Changes "
+        "are waited out until files stay the same for this long.",
+    )
+    op.add_option(
+        "",
+        "--save-ir",
+        dest="save_ir",
+        metavar="FILE",
+        help="Save the processed descriptions to FILE, for --load-ir.",
+    )
+    op.add_option(
+        "",
+        "--load-ir",
+        dest="load_ir",
+        metavar="FILE",
+        help="Print the descriptions saved with --save-ir to FILE instead of "
+        "parsing headers. FILE must have been saved by the same version of "
+        "ctypesgen; parsing and processing options have no effect.",
+    )
+    op.add_option(
+        "",
+        "--stats",
+        action="store_true",
+        default=False,
+        dest="show_stats",
+        help="Print the time and peak memory used by each phase, and counts "
+        "of tokens, reductions and descriptions.",
+    )
+    op.add_option(
+        "",
+        "--stats-json",
+        dest="stats_json",
+        metavar="FILE",
+        help="Save the data shown by --stats to FILE as JSON.",
+    )
+    op.add_option(
+        "",
+        "--profile-parser",
+        action="store_true",
+        default=False,
+        dest="profile_parser",
+        help="Print the reductions and time of each grammar rule, the number "
+        "of shifts, the deepest parser stack and counts of error recovery "
+        "steps. Parsing is slower while profiling.",
+    )
+    op.add_option(
+        "",
+        "--profile-parser-json",
+        dest="profile_parser_json",
+        metavar="FILE",
+        help="Save the data shown by --profile-parser to FILE as JSON.",
+    )
+
+    # A copy, so that appending to the lists does not change the defaults
+    op.set_defaults(**copy.deepcopy(core_options.default_values))
 
     (options, args) = op.parse_args(givenargs)
     options.headers = args
@@ -299,7 +550,7 @@ def main(givenargs=None):
     options.other_known_names = find_names_in_modules(options.modules)
 
     # Required parameters
-    if len(args) < 1:
+    if len(args) < 1 and not options.load_ir:
         msgs.error_message("No header files specified", cls="usage")
         sys.exit(1)
 
@@ -316,23 +567,26 @@ def main(givenargs=None):
         msgs.error_message("No such output language `" + options.output_language + "'", cls="usage")
         sys.exit(1)
 
-    # Step 1: Parse
-    descriptions = core_parser.parse(options.headers, options)
-
-    # Step 2: Process
-    processor.process(descriptions, options)
-
-    # Step 3: Print
-    printer(options.output, options, descriptions)
+    if options.watch:
+        # Only rewrite the output when it changes
+        options.incremental = True
+    if options.incremental and not options.output:
+        msgs.error_message(
+            "%s needs an output file (-o)" % ("--watch" if options.watch else "--incremental"),
+            cls="usage",
+        )
+        sys.exit(1)
 
-    msgs.status_message("Wrapping complete.")
+    if options.load_ir and (args or options.incremental):
+        msgs.error_message(
+            "--load-ir cannot be used with header files, --incremental or --watch", cls="usage"
+        )
+        sys.exit(1)
 
-    # Correct what may be a common mistake
-    if descriptions.all == []:
-        if not options.all_headers:
-            msgs.warning_message(
-                "There wasn't anything of use in the "
-                "specified header file(s). Perhaps you meant to run with "
-                "--all-headers to include objects from included sub-headers? ",
-                cls="usage",
-            )
+    try:
+        files = generate(options, printer)
+    except (ir.IRError, processor.SymbolFileError) as e:
+        msgs.error_message(str(e), cls="usage")
+        sys.exit(1)
+    if options.watch:
+        watch.watch(files, lambda: generate(options, printer), options.watch_interval)
@@ -22,6 +22,8 @@ default_values = {
     "builtin_symbols": False,
     "include_symbols": None,
     "exclude_symbols": None,
+    "include_symbols_files": [],
+    "exclude_symbols_files": [],
     "show_all_errors": False,
     "show_long_errors": False,
     "show_macro_warnings": True,
@@ -32,9 +34,26 @@ default_values = {
     "libraries": [],
     "strip_build_path": None,
     "output_language": "py",
+    "json_format": "array",
+    "json_compact": False,
+    "json_type_table": False,
     "no_stddef_types": False,
     "no_gnu_types": False,
     "no_python_types": False,
+    "buffer_args": False,
+    "numpy_dtypes": False,
+    "batch_functions": False,
+    "incremental": False,
+    "watch": False,
+    "watch_interval": 0.5,
+    "save_ir": None,
+    "load_ir": None,
+    "show_stats": False,
+    "stats_json": None,
+    "stats": None,
+    "profile_parser": False,
+    "profile_parser_json": None,
+    "parser_profile": None,
 }
 
 
@@ -12,13 +12,20 @@ where "options" is an optparse.Values object.
 parse() returns a DescriptionCollection object. See ctypesgen.descriptions
 for more information.
 
+Headers can also be given as text, without writing them to disk:
+>>> descriptions = parse(["foo.h"], options, sources={"foo.h": "int foo(void);"})
+
+parse() may be called from several threads at once. Each call has its own
+parser, and the output does not depend on what other calls are doing; in
+particular anonymous structs, unions and enums are numbered per call.
+
 """
 
 from .datacollectingparser import DataCollectingParser
 
 
-def parse(headers, options):
-    parser = DataCollectingParser(headers, options)
+def parse(headers, options, sources=None):
+    parser = DataCollectingParser(headers, options, sources)
     parser.parse()
     return parser.data()
 
@@ -13,6 +13,7 @@ import operator
 import os.path
 import re
 import sys
+import threading
 import time
 import warnings
 
@@ -20,6 +21,7 @@ from . import preprocessor
 from . import yacc
 from . import cgrammar
 from . import cdeclarations
+from .. import stats
 
 # --------------------------------------------------------------------------
 # Lexer
@@ -83,34 +85,66 @@ class CLexer(object):
         return None
 
 
+class TimedLexer(object):
+    """Wraps a lexer, adding up the time spent in its token() method."""
+
+    def __init__(self, lexer):
+        self.lexer = lexer
+        self.seconds = 0.0
+
+    def token(self):
+        start = stats._clock()
+        t = self.lexer.token()
+        self.seconds += stats._clock() - start
+        return t
+
+
 # --------------------------------------------------------------------------
 # Parser
 # --------------------------------------------------------------------------
 
+# The parse tables are read once and shared by all CParsers; each gets its
+# own yacc.Parser holding the parse state.
+_parser_prototype = None
+_parser_prototype_lock = threading.Lock()
+
+
+def get_parser_prototype():
+    global _parser_prototype
+    with _parser_prototype_lock:
+        if _parser_prototype is None:
+            prototype = yacc.yacc(
+                method="LALR",
+                debug=False,
+                module=cgrammar,
+                write_tables=True,
+                outputdir=os.path.dirname(__file__),
+                optimize=True,
+            )
+
+            # If yacc is reading tables from a file, then it won't find the error
+            # function... need to set it manually
+            prototype.errorfunc = cgrammar.p_error
+            _parser_prototype = prototype
+        return _parser_prototype
+
 
 class CParser(object):
     """Parse a C source file.
 
     Subclass and override the handle_* methods.  Call `parse` with a string
     to parse.
+
+    All parse state belongs to the CParser, so different CParsers may parse
+    in different threads at the same time. A single CParser must not be
+    used by two threads at once.
     """
 
     def __init__(self, options):
+        self.options = options
         self.preprocessor_parser = preprocessor.PreprocessorParser(options, self)
         self.parser = yacc.Parser()
-        prototype = yacc.yacc(
-            method="LALR",
-            debug=False,
-            module=cgrammar,
-            write_tables=True,
-            outputdir=os.path.dirname(__file__),
-            optimize=True,
-        )
-
-        # If yacc is reading tables from a file, then it won't find the error
-        # function... need to set it manually
-        prototype.errorfunc = cgrammar.p_error
-        prototype.init_parser(self.parser)
+        get_parser_prototype().init_parser(self.parser)
         self.parser.cparser = self
 
         self.lexer = CLexer(self)
@@ -123,17 +157,30 @@ class CParser(object):
         if sys.platform == "win32" and not options.no_python_types:
             self.lexer.type_names.add("__int64")
 
-    def parse(self, filename, debug=False):
-        """Parse a file.
+    def parse(self, filename, debug=False, source=None):
+        """Parse a file, or the C source `source` if it is given.
 
         If `debug` is True, parsing state is dumped to stdout.
         """
 
         self.handle_status("Preprocessing %s" % filename)
-        self.preprocessor_parser.parse(filename)
+        self.preprocessor_parser.parse(filename, source)
         self.lexer.input(self.preprocessor_parser.output)
         self.handle_status("Parsing %s" % filename)
-        self.parser.parse(lexer=self.lexer, debug=debug)
+        profile = getattr(self.options, "parser_profile", None)
+        if getattr(self.options, "stats", None) is None:
+            self.parser.parse(lexer=self.lexer, debug=debug, profile=profile)
+            return
+
+        # The C lexer is driven by the parser, so time spent in it is
+        # measured separately and moved out of the parsing phase.
+        lexer = TimedLexer(self.lexer)
+        with stats.phase(self.options, "yacc parsing"):
+            self.parser.parse(lexer=lexer, debug=debug, profile=profile)
+        entry = self.options.stats.phases["yacc parsing"]
+        entry["seconds"] -= lexer.seconds
+        self.options.stats.add_time("C lexing", lexer.seconds)
+        self.options.stats.count("reductions", self.parser.reductions)
 
     # ----------------------------------------------------------------------
     # Parser interface.  Override these methods in your subclass.
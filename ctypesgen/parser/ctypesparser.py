@@ -17,8 +17,10 @@ from .cparser import *
 from .cdeclarations import *
 
 
-def make_enum_from_specifier(specifier):
-    tag = specifier.tag
+def make_enum_from_specifier(specifier, anonymous_tag=None):
+    """Return the CtypesEnum for `specifier`, called `anonymous_tag` if the
+    enum has no tag of its own."""
+    tag = specifier.tag or anonymous_tag
 
     enumerators = []
     last_name = None
@@ -41,7 +43,9 @@ def make_enum_from_specifier(specifier):
         enumerators.append((e.name, value))
         last_name = e.name
 
-    return CtypesEnum(tag, enumerators, src=(specifier.filename, specifier.lineno))
+    return CtypesEnum(
+        tag, enumerators, src=(specifier.filename, specifier.lineno), anonymous=not specifier.tag
+    )
 
 
 def get_decl_id(decl):
@@ -62,13 +66,19 @@ class CtypesParser(CParser):
 
     def __init__(self, options):
         super(CtypesParser, self).__init__(options)
-        self.type_map = ctypes_type_map
+        self.type_map = dict(ctypes_type_map)
         if not options.no_python_types:
             self.type_map.update(ctypes_type_map_python_builtin)
+        self.last_tagnum = 0
+
+    def anonymous_tag(self):
+        """Return a tag for a new anonymous struct, union or enum. Tags are
+        numbered per parser, so the same headers always get the same tags."""
+        self.last_tagnum += 1
+        return "anon_%d" % self.last_tagnum
 
     def make_struct_from_specifier(self, specifier):
         variety = {True: "union", False: "struct"}[specifier.is_union]
-        tag = specifier.tag
 
         if specifier.declarations:
             members = []
@@ -88,8 +98,15 @@ class CtypesParser(CParser):
         else:
             members = None
 
+        # Numbered after any anonymous types among the members
+        tag = specifier.tag or self.anonymous_tag()
         return CtypesStruct(
-            tag, specifier.is_packed, variety, members, src=(specifier.filename, specifier.lineno)
+            tag,
+            specifier.is_packed,
+            variety,
+            members,
+            src=(specifier.filename, specifier.lineno),
+            anonymous=not specifier.tag,
         )
 
     def get_ctypes_type(self, typ, declarator, check_qualifiers=False):
@@ -102,7 +119,7 @@ class CtypesParser(CParser):
             if isinstance(specifier, StructTypeSpecifier):
                 t = self.make_struct_from_specifier(specifier)
             elif isinstance(specifier, EnumSpecifier):
-                t = make_enum_from_specifier(specifier)
+                t = make_enum_from_specifier(specifier, specifier.tag or self.anonymous_tag())
             elif specifier == "signed":
                 signed = True
             elif specifier == "unsigned":
@@ -115,7 +132,7 @@ class CtypesParser(CParser):
         if not t:
             # It is a numeric type of some sort
             if (typename, signed, longs) in self.type_map:
-                t = CtypesSimple(typename, signed, longs)
+                t = CtypesSimple(typename, signed, longs, not self.options.no_python_types)
 
             elif signed and not longs:
                 t = CtypesTypedef(typename)
@@ -138,6 +155,7 @@ class CtypesParser(CParser):
 
         qualifiers = []
         qualifiers.extend(typ.qualifiers)
+        destination_qualifiers = typ.qualifiers
         while declarator and declarator.pointer:
             if declarator.parameters is not None:
                 variadic = "..." in declarator.parameters
@@ -159,7 +177,10 @@ class CtypesParser(CParser):
 
             qualifiers.extend(declarator.qualifiers)
 
-            t = CtypesPointer(t, tuple(typ.qualifiers) + tuple(declarator.qualifiers))
+            t = CtypesPointer(
+                t, tuple(typ.qualifiers) + tuple(declarator.qualifiers), destination_qualifiers
+            )
+            destination_qualifiers = declarator.qualifiers
 
             declarator = declarator.pointer
 
@@ -12,7 +12,6 @@ from ..descriptions import *
 from ..ctypedescs import *
 from ..expressions import *
 from ..messages import *
-from tempfile import mkstemp
 import os
 
 
@@ -21,12 +20,16 @@ class DataCollectingParser(ctypesparser.CtypesParser, ctypesparser.CtypesTypeVis
     p=DataCollectingParser(names_of_header_files,options)
     p.parse()
     data=p.data() #A dictionary of constants, enums, structs, functions, etc.
+
+    Headers named in the optional dict `sources` are not read from disk;
+    their text is sources[name].
     """
 
-    def __init__(self, headers, options):
+    def __init__(self, headers, options, sources=None):
         super(DataCollectingParser, self).__init__(options)
         self.headers = headers
         self.options = options
+        self.sources = sources or {}
 
         self.constants = []
         self.typedefs = []
@@ -59,16 +62,18 @@ class DataCollectingParser(ctypesparser.CtypesParser, ctypesparser.CtypesTypeVis
         self.already_seen_opaque_enums = {}
 
     def parse(self):
-        fd, fname = mkstemp(suffix=".h")
-        f = os.fdopen(fd, "w")
+        # The preprocessor reads this from its standard input
+        source = []
         for header in self.options.other_headers:
-            f.write("#include <%s>\n" % header)
+            source.append("#include <%s>\n" % header)
         for header in self.headers:
-            f.write('#include "%s"\n' % os.path.abspath(header))
-        f.flush()
-        f.close()
-        super(DataCollectingParser, self).parse(fname, 0)
-        os.unlink(fname)
+            if header in self.sources:
+                # A line marker makes declarations appear to come from header
+                text = self.sources[header]
+                source.append('# 1 "%s"\n%s\n' % (header, text))
+            else:
+                source.append('#include "%s"\n' % os.path.abspath(header))
+        super(DataCollectingParser, self).parse("<stdin>", 0, "".join(source))
 
         for name, params, expr, (filename, lineno) in self.saved_macros:
             self.handle_macro(name, params, expr, filename, lineno)
@@ -100,7 +105,7 @@ class DataCollectingParser(ctypesparser.CtypesParser, ctypesparser.CtypesTypeVis
         # Called by CtypesParser
         ctype.visit(self)
 
-        typedef = TypedefDescription(name, ctype, src=(filename, repr(lineno)))
+        typedef = TypedefDescription(name, ctype, src=(filename, lineno))
 
         self.typedefs.append(typedef)
         self.all.append(typedef)
@@ -120,7 +125,7 @@ class DataCollectingParser(ctypesparser.CtypesParser, ctypesparser.CtypesTypeVis
             argtype.visit(self)
 
         function = FunctionDescription(
-            name, restype, argtypes, errcheck, variadic=variadic, src=(filename, repr(lineno))
+            name, restype, argtypes, errcheck, variadic=variadic, src=(filename, lineno)
         )
 
         self.functions.append(function)
@@ -131,7 +136,7 @@ class DataCollectingParser(ctypesparser.CtypesParser, ctypesparser.CtypesTypeVis
         # Called by CtypesParser
         ctype.visit(self)
 
-        variable = VariableDescription(name, ctype, src=(filename, repr(lineno)))
+        variable = VariableDescription(name, ctype, src=(filename, lineno))
 
         self.variables.append(variable)
         self.all.append(variable)
@@ -160,7 +165,7 @@ class DataCollectingParser(ctypesparser.CtypesParser, ctypesparser.CtypesTypeVis
                     None,  # No members
                     True,  # Opaque
                     ctypestruct,
-                    src=(filename, str(lineno)),
+                    src=(filename, lineno),
                 )
 
                 self.already_seen_opaque_structs[name] = struct
@@ -191,7 +196,7 @@ class DataCollectingParser(ctypesparser.CtypesParser, ctypesparser.CtypesTypeVis
                     ctypestruct.variety,
                     ctypestruct.members,
                     False,  # Not opaque
-                    src=(filename, str(lineno)),
+                    src=(filename, lineno),
                     ctype=ctypestruct,
                 )
                 self.structs.append(struct)
@@ -213,7 +218,7 @@ class DataCollectingParser(ctypesparser.CtypesParser, ctypesparser.CtypesTypeVis
 
         if ctypeenum.opaque:
             if tag not in self.already_seen_opaque_enums:
-                enum = EnumDescription(ctypeenum.tag, None, ctypeenum, src=(filename, str(lineno)))
+                enum = EnumDescription(ctypeenum.tag, None, ctypeenum, src=(filename, lineno))
                 enum.opaque = True
 
                 self.already_seen_opaque_enums[tag] = enum
@@ -236,7 +241,7 @@ class DataCollectingParser(ctypesparser.CtypesParser, ctypesparser.CtypesTypeVis
                 enum = EnumDescription(
                     ctypeenum.tag,
                     ctypeenum.enumerators,
-                    src=(filename, str(lineno)),
+                    src=(filename, lineno),
                     ctype=ctypeenum,
                 )
                 enum.opaque = False
@@ -324,4 +329,5 @@ class DataCollectingParser(ctypesparser.CtypesParser, ctypesparser.CtypesTypeVis
             self.macros,
             self.all,
             self.output_order,
+            self.preprocessor_parser.source_files,
         )
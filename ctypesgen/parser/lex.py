@@ -26,7 +26,12 @@
 
 __version__ = "2.2"
 
-import re, sys, types, os.path
+import importlib, re, sys, types, os.path, tempfile, threading
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:
+    import sre_parse, sre_constants
 
 # Regular expression used to match valid token names
 _is_identifier = re.compile(r"^[a-zA-Z0-9_]+$")
@@ -89,14 +94,17 @@ class Lexer:
         self.lineno = 1  # Current line number
         self.lexdebug = 0  # Debugging mode
         self.lexoptimize = 0  # Optimized mode
+        self.lexstatedispatch = {}  # Dispatch tables by state, see build_dispatch()
+        self.lexdispatch = None  # Dispatch table of the current state
 
     def clone(self, object=None):
-        c = Lexer()
+        # The clone shares the compiled tables, but not the input or state
+        c = self.__class__()
         c.lexstatere = self.lexstatere
         c.lexstateinfo = self.lexstateinfo
         c.lexstateretext = self.lexstateretext
         c.lexstate = self.lexstate
-        c.lexstatestack = self.lexstatestack
+        c.lexstatestack = list(self.lexstatestack)
         c.lexstateignore = self.lexstateignore
         c.lexstateerrorf = self.lexstateerrorf
         c.lexreflags = self.lexreflags
@@ -109,6 +117,7 @@ class Lexer:
         c.lexoptimize = self.lexoptimize
         c.lexliterals = self.lexliterals
         c.lexmodule = self.lexmodule
+        c.lexstatedispatch = self.lexstatedispatch
 
         # If the object parameter has been supplied, it means we are attaching the
         # lexer to a new object.  In this case, we have to rebind all methods in
@@ -132,6 +141,8 @@ class Lexer:
             for key, ef in self.lexstateerrorf.items():
                 c.lexstateerrorf[key] = getattr(object, ef.__name__)
             c.lexmodule = object
+            if self.lexstatedispatch:
+                c.build_dispatch()
 
         # Set up other attributes
         c.begin(c.lexstate)
@@ -142,16 +153,6 @@ class Lexer:
     # ------------------------------------------------------------
     # <tm> 25 June 2008 added 'outputdir'
     def writetab(self, tabfile, outputdir=""):
-        tf = open(os.path.join(outputdir, tabfile) + ".py", "w")
-        tf.write(
-            "# %s.py. This file automatically created by PLY (version %s). Don't edit!\n"
-            % (tabfile, __version__)
-        )
-        tf.write("_lextokens    = %s\n" % repr(self.lextokens))
-        tf.write("_lexreflags   = %s\n" % repr(self.lexreflags))
-        tf.write("_lexliterals  = %s\n" % repr(self.lexliterals))
-        tf.write("_lexstateinfo = %s\n" % repr(self.lexstateinfo))
-
         tabre = {}
         for key, lre in self.lexstatere.items():
             titem = []
@@ -159,23 +160,51 @@ class Lexer:
                 titem.append((self.lexstateretext[key][i], _funcs_to_names(lre[i][1])))
             tabre[key] = titem
 
-        tf.write("_lexstatere   = %s\n" % repr(tabre))
-        tf.write("_lexstateignore = %s\n" % repr(self.lexstateignore))
-
         taberr = {}
         for key, ef in self.lexstateerrorf.items():
             if ef:
                 taberr[key] = ef.__name__
             else:
                 taberr[key] = None
-        tf.write("_lexstateerrorf = %s\n" % repr(taberr))
-        tf.close()
+
+        # Written to a temporary file first, so that other processes never
+        # read half of it
+        filename = os.path.join(outputdir, tabfile) + ".py"
+        fd, tmpname = tempfile.mkstemp(suffix=".py", dir=os.path.dirname(filename) or ".")
+        try:
+            with os.fdopen(fd, "w") as tf:
+                tf.write(
+                    "# %s.py. This file automatically created by PLY (version %s). Don't edit!\n"
+                    % (os.path.basename(tabfile), __version__)
+                )
+                tf.write("_lextokens    = %s\n" % repr(self.lextokens))
+                tf.write("_lexreflags   = %s\n" % repr(self.lexreflags))
+                tf.write("_lexliterals  = %s\n" % repr(self.lexliterals))
+                tf.write("_lexstateinfo = %s\n" % repr(self.lexstateinfo))
+                tf.write("_lexstatere   = %s\n" % repr(tabre))
+                tf.write("_lexstateignore = %s\n" % repr(self.lexstateignore))
+                tf.write("_lexstateerrorf = %s\n" % repr(taberr))
+            try:
+                os.rename(tmpname, filename)
+            except OSError:
+                # Windows does not rename over an existing file
+                os.unlink(filename)
+                os.rename(tmpname, filename)
+        except:
+            os.unlink(tmpname)
+            raise
 
     # ------------------------------------------------------------
     # readtab() - Read lexer information from a tab file
     # ------------------------------------------------------------
     def readtab(self, tabfile, fdict):
-        exec("import %s as lextab" % tabfile)
+        if os.path.isabs(tabfile):
+            # A table outside of sys.path, e.g. in a cache directory
+            lextab = types.ModuleType("lextab")
+            with open(tabfile + ".py") as f:
+                exec(compile(f.read(), tabfile + ".py", "exec"), lextab.__dict__)
+        else:
+            lextab = importlib.import_module(tabfile)
         self.lextokens = lextab._lextokens
         self.lexreflags = lextab._lexreflags
         self.lexliterals = lextab._lexliterals
@@ -188,14 +217,18 @@ class Lexer:
             txtitem = []
             for i in range(len(lre)):
                 titem.append(
-                    (re.compile(lre[i][0], lextab._lexreflags), _names_to_funcs(lre[i][1], fdict))
+                    (
+                        re.compile(lre[i][0], re.VERBOSE | lextab._lexreflags),
+                        _names_to_funcs(lre[i][1], fdict),
+                    )
                 )
                 txtitem.append(lre[i][0])
             self.lexstatere[key] = titem
             self.lexstateretext[key] = txtitem
         self.lexstateerrorf = {}
         for key, ef in lextab._lexstateerrorf.items():
-            self.lexstateerrorf[key] = fdict[ef]
+            self.lexstateerrorf[key] = ef and fdict[ef]
+        self.build_dispatch()
         self.begin("INITIAL")
 
     # ------------------------------------------------------------
@@ -218,6 +251,7 @@ class Lexer:
         self.lexretext = self.lexstateretext[state]
         self.lexignore = self.lexstateignore.get(state, "")
         self.lexerrorf = self.lexstateerrorf.get(state, None)
+        self.lexdispatch = self.lexstatedispatch.get(state)
         self.lexstate = state
 
     # ------------------------------------------------------------
@@ -253,6 +287,9 @@ class Lexer:
     # you are doing
     # ------------------------------------------------------------
     def token(self):
+        if self.lexdispatch is not None:
+            return self.dispatch_token()
+
         # Make local copies of frequently referenced attributes
         lexpos = self.lexpos
         lexlen = self.lexlen
@@ -371,6 +408,246 @@ class Lexer:
             raise RuntimeError("No input string given with input()")
         return None
 
+    # ------------------------------------------------------------
+    # build_dispatch() - Prepare the tables of dispatch_token()
+    #
+    # For each state, and each ASCII character, the table lists the
+    # master regexes which may match text starting with that character,
+    # in their usual order. Each entry of a regex's index maps a group to
+    # (function, token type, whether the rule is marked with @GROUPS),
+    # with rules which are not callable turned into ignored tokens. A regex
+    # matching a run of ignored characters is compiled too.
+    # ------------------------------------------------------------
+    def build_dispatch(self):
+        self.lexstatedispatch = {}
+        for state, lexre in self.lexstatere.items():
+            masters = []
+            for (cre, findex), retext in zip(lexre, self.lexstateretext[state]):
+                entries = []
+                for f in findex:
+                    if not f:
+                        entries.append(f)
+                    elif f[0] is None:
+                        entries.append((None, f[1], False))
+                    elif not hasattr(f[0], "__call__"):
+                        entries.append((None, None, False))
+                    else:
+                        entries.append((f[0], f[1], getattr(f[0], "needs_groups", False)))
+                masters.append(((cre, entries), _first_chars(retext, self.lexreflags)))
+
+            table = []
+            for i in range(128):
+                c = chr(i)
+                table.append([m for m, first in masters if first is None or c in first])
+            ignore = self.lexstateignore.get(state, "")
+            skip = ignore and re.compile("[%s]+" % "".join(re.escape(c) for c in ignore)).match
+            # Other characters are tried against every regex
+            self.lexstatedispatch[state] = (table, [m for m, first in masters], skip)
+        self.lexdispatch = self.lexstatedispatch.get(self.lexstate)
+
+    # ------------------------------------------------------------
+    # dispatch_token() - token(), trying only the master regexes which
+    # can match the next character. The tokens are the same, except that
+    # tok.groups is only set for rules marked with @GROUPS.
+    # ------------------------------------------------------------
+    def dispatch_token(self):
+        lexpos = self.lexpos
+        lexlen = self.lexlen
+        lexignore = self.lexignore
+        skip = self.lexdispatch[2]
+        lexdata = self.lexdata
+
+        while lexpos < lexlen:
+            c = lexdata[lexpos]
+            if c in lexignore:
+                lexpos = skip(lexdata, lexpos).end()
+                continue
+
+            table, others, _ = self.lexdispatch
+            o = ord(c)
+            for lexre, lexindexfunc in table[o] if o < 128 else others:
+                m = lexre.match(lexdata, lexpos)
+                if not m:
+                    continue
+
+                self.lexmatch = m
+                func, toktype, needs_groups = lexindexfunc[m.lastindex]
+
+                tok = LexToken()
+                tok.value = m.group()
+                if needs_groups:
+                    tok.groups = m.groups()
+                tok.lineno = self.lineno
+                tok.lexpos = lexpos
+                tok.lexer = self
+                tok.type = toktype
+
+                lexpos = m.end()
+                self.lexpos = lexpos
+
+                if func is None:
+                    # A token without a function, or an ignored one
+                    if toktype:
+                        return tok
+                    break
+
+                newtok = func(tok)
+                if not newtok:
+                    lexpos = self.lexpos
+                    lexdata = self.lexdata
+                    break
+
+                if not self.lexoptimize:
+                    if newtok.type not in self.lextokens and len(newtok.type) > 1:
+                        raise LexError(
+                            "%s:%d: Rule '%s' returned an unknown token type '%s'"
+                            % (
+                                func.__code__.co_filename,
+                                func.__code__.co_firstlineno,
+                                func.__name__,
+                                newtok.type,
+                            ),
+                            lexdata[lexpos:],
+                        )
+
+                return newtok
+            else:
+                # Literals and errors are handled as by token()
+                if c in self.lexliterals:
+                    tok = LexToken()
+                    tok.value = c
+                    tok.lineno = self.lineno
+                    tok.lexer = self
+                    tok.type = c
+                    tok.lexpos = lexpos
+                    self.lexpos = lexpos + 1
+                    return tok
+
+                if self.lexerrorf:
+                    tok = LexToken()
+                    tok.value = self.lexdata[lexpos:]
+                    tok.lineno = self.lineno
+                    tok.type = "error"
+                    tok.lexer = self
+                    tok.lexpos = lexpos
+                    self.lexpos = lexpos
+                    newtok = self.lexerrorf(tok)
+                    if lexpos == self.lexpos:
+                        raise LexError(
+                            "Scanning error. Illegal character '%s'" % (lexdata[lexpos]),
+                            lexdata[lexpos:],
+                        )
+                    lexpos = self.lexpos
+                    if not newtok:
+                        continue
+                    return newtok
+
+                self.lexpos = lexpos
+                raise LexError(
+                    "Illegal character '%s' at index %d" % (lexdata[lexpos], lexpos),
+                    lexdata[lexpos:],
+                )
+
+        self.lexpos = lexpos + 1
+        if self.lexdata is None:
+            raise RuntimeError("No input string given with input()")
+        return None
+
+
+# -----------------------------------------------------------------------------
+# _first_chars()
+#
+# Returns the set of ASCII characters which text matched by regular
+# expression `regex` may start with, or None if it may start with any.
+# When in doubt, any character is allowed: the set is only used to skip
+# regexes which cannot match.
+# -----------------------------------------------------------------------------
+
+_ascii = [chr(i) for i in range(128)]
+_categories = {
+    sre_constants.CATEGORY_DIGIT: set(c for c in _ascii if c.isdigit()),
+    sre_constants.CATEGORY_WORD: set(c for c in _ascii if c.isalnum() or c == "_"),
+    sre_constants.CATEGORY_SPACE: set(" \t\n\r\f\v"),
+}
+
+
+def _first_chars(regex, reflags=0):
+    if reflags & (re.IGNORECASE | re.LOCALE):
+        return None
+    try:
+        items = sre_parse.parse(regex, re.VERBOSE | reflags)
+        chars, nullable = _first_chars_seq(items, {})
+    except Exception:
+        return None
+    if chars is None or nullable:
+        return None
+    return chars
+
+
+def _first_chars_seq(items, groups):
+    # Returns (characters or None for any, whether the items can match "").
+    # `groups` records which groups can match "", by group number.
+    result = set()
+    for op, av in items:
+        chars, nullable = _first_chars_op(op, av, groups)
+        if chars is None:
+            return None, False
+        result |= chars
+        if not nullable:
+            return result, False
+    return result, True
+
+
+def _first_chars_op(op, av, groups):
+    c = sre_constants
+    if op is c.LITERAL:
+        return set([chr(av)]), False
+    if op is c.IN:
+        result = set()
+        for iop, iav in av:
+            if iop is c.LITERAL:
+                result.add(chr(iav))
+            elif iop is c.RANGE:
+                result.update(chr(i) for i in range(iav[0], min(iav[1], 127) + 1))
+            elif iop is c.CATEGORY and iav in _categories:
+                result |= _categories[iav]
+            else:
+                return None, False
+        return result, False
+    if op is c.SUBPATTERN:
+        chars, nullable = _first_chars_seq(av[-1], groups)
+        if av[0] is not None:
+            groups[av[0]] = nullable
+        return chars, nullable
+    if op is c.BRANCH:
+        result, nullable = set(), False
+        for branch in av[1]:
+            chars, n = _first_chars_seq(branch, groups)
+            if chars is None:
+                return None, False
+            result |= chars
+            nullable = nullable or n
+        return result, nullable
+    if op in (c.MAX_REPEAT, c.MIN_REPEAT):
+        chars, nullable = _first_chars_seq(av[2], groups)
+        return chars, nullable or av[0] == 0
+    if op is c.GROUPREF_EXISTS:
+        # Nothing has been matched yet, so a group which cannot match ""
+        # did not match: only the second branch can apply.
+        no, no_nullable = set(), True
+        if av[2] is not None:
+            no, no_nullable = _first_chars_seq(av[2], groups)
+        if groups.get(av[0], True) is False:
+            return no, no_nullable
+        yes, yes_nullable = _first_chars_seq(av[1], groups)
+        if yes is None or no is None:
+            return None, False
+        return yes | no, yes_nullable or no_nullable
+    if op in (c.AT, c.ASSERT, c.ASSERT_NOT):
+        # Zero width; ignoring what they assert only allows more
+        return set(), True
+    return None, False
+
 
 # -----------------------------------------------------------------------------
 # _validate_file()
@@ -529,9 +806,19 @@ def _statetoken(s, names):
 #
 # Build all of the regular expression rules from definitions in the supplied module
 # -----------------------------------------------------------------------------
+# lex() sets global variables and may write the lextab module, so only one
+# thread at a time may be in it. The lexers it returns are independent.
+_lex_lock = threading.RLock()
+
+
+def lex(*args, **kwargs):
+    with _lex_lock:
+        return _lex(*args, **kwargs)
+
+
 # cls added for pyglet/tools/wrapper/cparser.py by Alex Holkner on 22/Jan/2007
 # <tm> 25 June 2008 added 'outputdir'
-def lex(
+def _lex(
     module=None,
     object=None,
     debug=0,
@@ -591,7 +878,7 @@ def lex(
             lexer = lexobj
             return lexobj
 
-        except ImportError:
+        except (ImportError, EnvironmentError):
             pass
 
     # Get the tokens, states, and literals variables (if any)
@@ -887,6 +1174,8 @@ def lex(
             if s not in ignore:
                 ignore[s] = ignore.get("INITIAL", "")
 
+    lexobj.build_dispatch()
+
     # Create global versions of the token() and input() functions
     token = lexobj.token
     input = lexobj.input
@@ -894,7 +1183,11 @@ def lex(
 
     # If in optimize mode, we write the lextab
     if lextab and optimize:
-        lexobj.writetab(lextab, outputdir)
+        try:
+            lexobj.writetab(lextab, outputdir)
+        except EnvironmentError:
+            # The table only saves time next time
+            pass
 
     return lexobj
 
@@ -952,3 +1245,16 @@ def TOKEN(r):
 
 # Alternative spelling of the TOKEN decorator
 Token = TOKEN
+
+# -----------------------------------------------------------------------------
+# @GROUPS decorator
+#
+# Marks a rule which reads tok.groups. Lexers using dispatch tables (see
+# build_dispatch()) leave tok.groups unset for other rules, as working it out
+# for every token takes time.
+# -----------------------------------------------------------------------------
+
+
+def GROUPS(f):
+    f.needs_groups = True
+    return f
@@ -12,7 +12,7 @@ __docformat__ = "restructuredtext"
 
 import os, re, shlex, sys, tokenize, traceback
 import ctypes
-from .lex import TOKEN
+from .lex import TOKEN, GROUPS
 
 tokens = (
     "HEADER_NAME",
@@ -93,6 +93,10 @@ class StringLiteral(str):
         value = value[1:-1]  # .decode('string_escape')
         return str.__new__(cls, value)
 
+    def __getnewargs__(self):
+        # For pickle, which passes these to __new__
+        return ('"%s"' % self,)
+
 
 # --------------------------------------------------------------------------
 # Token declarations
@@ -164,6 +168,7 @@ DIRECTIVE = r'\#\s+(\d+)\s+"([^"]+)"[ \d]*\n'
 
 
 @TOKEN(DIRECTIVE)
+@GROUPS
 def t_ANY_directive(t):
     t.lexer.filename = t.groups[2]
     t.lexer.lineno = int(t.groups[1])
@@ -10,11 +10,12 @@ Reference is C99:
 
 __docformat__ = "restructuredtext"
 
-import os, re, shlex, sys, tokenize, traceback, subprocess
+import collections, hashlib, os, re, shlex, sys, threading, tokenize, traceback, subprocess
 import ctypes
 from . import lex, yacc
 from .lex import TOKEN
 from . import pplexer
+from .. import stats
 
 # --------------------------------------------------------------------------
 # Lexers
@@ -105,6 +106,92 @@ def create_token(type, value, production=None):
 # Grammars
 # --------------------------------------------------------------------------
 
+# A line marker, as matched by pplexer.DIRECTIVE
+_line_marker = re.compile(r'\#\s+(\d+)\s+"([^"]+)"[ \d]*$')
+
+
+def _arrange_lines(ppout):
+    """Return the output of cpp arranged for the lexer, and the files named
+    in its line markers.
+
+    The source lines are put first, then the #define lines. Rather than
+    leaving a blank line in each half for every line which went to the other
+    half (or was blank), the line number and file of each half is kept track
+    of, and a line marker is written where it no longer follows on from the
+    last line kept.
+    """
+    halves = ([], [])  # Source lines, #define lines
+    positions = [(None, 1), (None, 1)]  # Where the lexer is in each half
+    filename, lineno = None, 1  # Where the next line of cpp's output is from
+    source_files = collections.OrderedDict()  # Used as an ordered set
+
+    for line in ppout.split("\n"):
+        m = _line_marker.match(line)
+        if m:
+            lineno, filename = int(m.group(1)), m.group(2)
+            source_files[filename] = None
+            continue
+
+        if line.startswith("# "):
+            keep = (0, 1)
+        elif line.startswith("#define"):
+            keep = (1,)
+        elif line.startswith("#") or not line.strip():
+            # It's a directive, but not a #define, or a blank line. Remove it
+            keep = ()
+        else:
+            keep = (0,)
+
+        for half in keep:
+            if positions[half] != (filename, lineno):
+                if filename is None:
+                    # No marker yet to give the file name
+                    halves[half].append("\n" * (lineno - positions[half][1]))
+                else:
+                    halves[half].append('# %d "%s"\n' % (lineno, filename))
+            halves[half].append(line + "\n")
+            positions[half] = (filename, lineno + 1)
+        lineno += 1
+
+    return "".join(halves[0] + halves[1]), list(source_files)
+
+
+# The lexer is built once per process, and each parser gets a clone of it
+# sharing its compiled regular expressions. The tables it is built from are
+# cached in the user's cache directory, keyed by the lexer's source, so that
+# the rules are not collected and checked again in every process.
+_lexer_prototype = None
+_lexer_prototype_lock = threading.Lock()
+
+
+def lextab_path():
+    """Return where the lexer tables are cached, without ".py"."""
+    digest = hashlib.sha1()
+    for module in (lex, pplexer):
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    cachedir = os.environ.get("CTYPESGEN_CACHE_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "ctypesgen"
+    )
+    return os.path.join(os.path.abspath(cachedir), "lextab-%s" % digest.hexdigest()[:16])
+
+
+def get_lexer_prototype():
+    global _lexer_prototype
+    with _lexer_prototype_lock:
+        if _lexer_prototype is None:
+            lextab = lextab_path()
+            try:
+                os.makedirs(os.path.dirname(lextab))
+            except OSError:
+                if not os.path.isdir(os.path.dirname(lextab)):
+                    # No cache directory: build the tables in memory every time
+                    lextab = None
+            _lexer_prototype = lex.lex(
+                cls=PreprocessorLexer, optimize=1, lextab=lextab, module=pplexer
+            )
+        return _lexer_prototype
+
 
 class PreprocessorParser(object):
     def __init__(self, options, cparser):
@@ -125,20 +212,16 @@ class PreprocessorParser(object):
 
         self.matches = []
         self.output = []
-        optimize = options.optimize_lexer if hasattr(options, "optimize_lexer") else False
-        self.lexer = lex.lex(
-            cls=PreprocessorLexer,
-            optimize=optimize,
-            lextab="lextab",
-            outputdir=os.path.dirname(__file__),
-            module=pplexer,
-        )
+        self.source_files = []
+        self.lexer = get_lexer_prototype().clone()
 
         self.options = options
         self.cparser = cparser  # An instance of CParser
 
-    def parse(self, filename):
-        """Parse a file and save its output"""
+    def parse(self, filename, source=None):
+        """Parse a file and save its output. If `source` is given, it is
+        preprocessed instead of the file, read by the preprocessor from its
+        standard input; `filename` is then only used in messages."""
 
         cmd = self.options.cpp
         cmd += " -U __GNUC__ -dD"
@@ -152,14 +235,23 @@ class PreprocessorParser(object):
             cmd += " -I%s" % path
         for define in self.defines:
             cmd += ' "-D%s"' % define
-        cmd += ' "' + filename + '"'
+        if source is None:
+            cmd += ' "' + filename + '"'
+        else:
+            cmd += " -"
 
         self.cparser.handle_status(cmd)
 
-        pp = subprocess.Popen(
-            cmd, shell=True, universal_newlines=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-        )
-        ppout, pperr = pp.communicate()
+        with stats.phase(self.options, "cpp"):
+            pp = subprocess.Popen(
+                cmd,
+                shell=True,
+                universal_newlines=True,
+                stdin=subprocess.PIPE if source is not None else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            ppout, pperr = pp.communicate(source)
 
         for line in pperr.split("\n"):
             if line:
@@ -167,31 +259,8 @@ class PreprocessorParser(object):
 
         # We separate lines that are #defines and lines that are source code
         # We put all the source lines first, then all the #define lines.
-
-        source_lines = []
-        define_lines = []
-
-        for line in ppout.split("\n"):
-            line = line + "\n"
-            if line.startswith("# "):
-                # Line number information has to go with both groups
-                source_lines.append(line)
-                define_lines.append(line)
-
-            elif line.startswith("#define"):
-                source_lines.append("\n")
-                define_lines.append(line)
-
-            elif line.startswith("#"):
-                # It's a directive, but not a #define. Remove it
-                source_lines.append("\n")
-                define_lines.append("\n")
-
-            else:
-                source_lines.append(line)
-                define_lines.append("\n")
-
-        text = "".join(source_lines + define_lines)
+        # self.source_files is every file cpp read, as named in its line markers
+        text, self.source_files = _arrange_lines(ppout)
 
         if self.options.save_preprocessed_headers:
             self.cparser.handle_status(
@@ -203,12 +272,14 @@ class PreprocessorParser(object):
             except IOError:
                 self.cparser.handle_error("Couldn't save headers.")
 
-        self.lexer.input(text)
-        self.output = []
-
-        while True:
-            token = self.lexer.token()
-            if token is not None:
-                self.output.append(token)
-            else:
-                break
+        with stats.phase(self.options, "preprocessor lexing"):
+            self.lexer.input(text)
+            self.output = []
+
+            while True:
+                token = self.lexer.token()
+                if token is not None:
+                    self.output.append(token)
+                else:
+                    break
+        stats.count(self.options, "tokens", len(self.output))
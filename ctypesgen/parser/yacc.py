@@ -69,7 +69,7 @@ default_lr = "LALR"  # Default LR table generation method
 
 error_count = 3  # Number of symbols that must be shifted to leave recovery mode
 
-import re, types, sys, io, os.path
+import re, types, sys, io, os.path, threading, time
 
 # <tm> 1 July 2008
 try:
@@ -85,6 +85,11 @@ except ImportError:
     hashlib.md5 = md5.new
     del Dummy, md5
 
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
 # Exception raised for yacc-related errors
 class YaccError(Exception):
     pass
@@ -108,8 +113,19 @@ class YaccError(Exception):
 #        .endlexpos  = Ending lex position (optional, set automatically)
 
 
-class YaccSymbol:
-    filename = ""  # <ah>
+class YaccSymbol(object):
+    # One is made for every reduction, so it has no __dict__ (and no
+    # __init__: the parser sets .type and .filename, "" by default <ah>)
+    __slots__ = (
+        "type",
+        "value",
+        "lineno",
+        "filename",
+        "endlineno",
+        "lexpos",
+        "endlexpos",
+        "parser",
+    )
 
     def __str__(self):
         return self.type
@@ -126,28 +142,45 @@ class YaccSymbol:
 # a tuple of (startline,endline) representing the range of lines
 # for a symbol.  The lexspan() method returns a tuple (lexpos,endlexpos)
 # representing the range of positional information for a symbol.
+#
+# One YaccProduction is used for every reduction of a parse.  Rather than
+# a list of the symbols of the production, it holds the new symbol (.sym)
+# and the offset (.base) of the first symbol of the right hand side on the
+# parser's symbol stack, which still holds them while the rule runs.
+# .slice gives the symbols as a sequence, as in PLY.
 
 
-class YaccProduction:
-    def __init__(self, s, stack=None):
-        self.slice = s
-        self.pbstack = []
+class YaccProduction(object):
+    __slots__ = ("sym", "base", "plen", "stack", "slice", "pbstack", "parser", "lexer")
+
+    def __init__(self, stack=None):
+        self.sym = None
+        self.base = 0
+        self.plen = 0
         self.stack = stack
+        self.slice = YaccSlice(self)
+        self.pbstack = []
 
     def __getitem__(self, n):
         if type(n) == int:
-            if n >= 0:
-                return self.slice[n].value
+            if n > 0:
+                return self.stack[self.base + n - 1].value
+            elif n == 0:
+                return self.sym.value
             else:
-                return self.stack[n].value
+                # The symbols below this production
+                return self.stack[self.base + n].value
         else:
             return [s.value for s in self.slice[n.start : n.stop : n.step]]
 
     def __setitem__(self, n, v):
-        self.slice[n].value = v
+        if n == 0:
+            self.sym.value = v
+        else:
+            self.slice[n].value = v
 
     def __len__(self):
-        return len(self.slice)
+        return self.plen + 1
 
     def lineno(self, n):
         return getattr(self.slice[n], "lineno", 0)
@@ -168,14 +201,101 @@ class YaccProduction:
     def pushback(self, n):
         if n <= 0:
             raise ValueError("Expected a positive value")
-        if n > (len(self.slice) - 1):
-            raise ValueError(
-                "Can't push %d tokens. Only %d are available." % (n, len(self.slice) - 1)
-            )
+        if n > self.plen:
+            raise ValueError("Can't push %d tokens. Only %d are available." % (n, self.plen))
         for i in range(0, n):
             self.pbstack.append(self.slice[-i - 1])
 
 
+# The symbols of the production being reduced: the new symbol, then the
+# right hand side
+
+
+class YaccSlice(object):
+    __slots__ = ("production",)
+
+    def __init__(self, production):
+        self.production = production
+
+    def __getitem__(self, n):
+        p = self.production
+        if type(n) != int:
+            return [self[i] for i in range(*n.indices(p.plen + 1))]
+        if n < 0:
+            n += p.plen + 1
+            if n < 0:
+                raise IndexError("production index out of range")
+        if n == 0:
+            return p.sym
+        if n > p.plen:
+            raise IndexError("production index out of range")
+        return p.stack[p.base + n - 1]
+
+    def __len__(self):
+        return self.production.plen + 1
+
+
+# For each production: (name, length, function, {state: goto state}), so
+# that reducing looks nothing up by name and builds no tuple keys.
+
+
+def reduce_table(productions, goto):
+    gotos = {}
+    for (state, name), target in goto.items():
+        gotos.setdefault(name, {})[state] = target
+    table = []
+    for p in productions:
+        if p is None:
+            table.append(None)
+        else:
+            table.append((p.name, p.len, getattr(p, "func", None), gotos.get(p.name, {})))
+    return table
+
+
+# A copy of reduce_table() whose functions tell `profile` how long each call
+# took, for Parser.parse(profile=...). Functions are named by their __name__,
+# so productions sharing one function are counted together.
+
+
+def profiled_reduce_table(table, profile):
+    clock = _clock
+    wrappers = {}
+
+    def wrap(func):
+        name = func.__name__
+        reduced = profile.reduced
+
+        def profiled(p):
+            start = clock()
+            try:
+                func(p)
+            finally:
+                reduced(name, clock() - start, p.base + 1)
+
+        return profiled
+
+    profiled_table = []
+    for entry in table:
+        if entry is None or entry[2] is None:
+            profiled_table.append(entry)
+            continue
+        pname, plen, func, gotos = entry
+        if func not in wrappers:
+            wrappers[func] = wrap(func)
+        profiled_table.append((pname, plen, wrappers[func], gotos))
+    return profiled_table
+
+
+# The action table as a list of one {token type: action} dict per state
+
+
+def action_rows(action):
+    rows = [{} for state in range(max(state for state, ltype in action) + 1)]
+    for (state, ltype), t in action.items():
+        rows[state][ltype] = t
+    return rows
+
+
 # The LR Parsing engine.   This is defined as a class so that multiple parsers
 # can exist in the same process.  A user never instantiates this directly.
 # Instead, the global yacc() function should be used to create a suitable Parser
@@ -192,6 +312,8 @@ class Parser:
         self.goto = {}  # LR goto table
         self.require = {}  # Attribute require table
         self.method = "Unknown LR"  # Table construction method used
+        self.rows = None  # action_rows() of the action table
+        self.reductions_table = None  # reduce_table() of the productions
 
         # <ah> 25 Jan 2007
         self.statestackstack = []
@@ -205,6 +327,7 @@ class Parser:
         del self.symstack[:]
         sym = YaccSymbol()
         sym.type = "$end"
+        sym.filename = ""
         sym.parser = self  # <tm> 25 June 2008
         self.symstack.append(sym)
         self.statestack.append(0)
@@ -222,15 +345,28 @@ class Parser:
         self.statestack[:] = self.statestackstack.pop()
         self.symstack[:] = self.symstackstack.pop()
 
-    def parse(self, input=None, lexer=None, debug=0):
+    def parse(self, input=None, lexer=None, debug=0, profile=None):
+        """Parse the tokens from `lexer`, or from the default lexer given
+        `input`, and return the value of the start symbol.
+
+        If `profile` is given, it is told of each shift (with the stack
+        depth), each reduction (with the production function's name and the
+        seconds it took) and each step of error recovery; see
+        ctypesgen.stats.ParserProfile. Parsing is slower while profiling."""
         lookahead = None  # Current lookahead symbol
         lookaheadstack = []  # Stack of lookahead symbols
-        actions = self.action  # Local reference to action table
-        goto = self.goto  # Local reference to goto table
-        prod = self.productions  # Local reference to production list
-        pslice = YaccProduction(None)  # Production object passed to grammar rules
+        if self.rows is None:
+            self.rows = action_rows(self.action)
+            self.reductions_table = reduce_table(self.productions, self.goto)
+        rows = self.rows  # Local reference to action table
+        reductions_table = self.reductions_table  # Local reference to production list
+        if profile is not None:
+            reductions_table = profiled_reduce_table(reductions_table, profile)
+        pslice = YaccProduction()  # Production object passed to grammar rules
         pslice.parser = self  # Parser object
+        pbstack = pslice.pbstack
         self.errorcount = 0  # Used during error recovery
+        self.reductions = 0  # Number of productions reduced
 
         # If no lexer was given, we will try to use the lex module
         if not lexer:
@@ -259,6 +395,7 @@ class Parser:
         statestack.append(0)
         sym = YaccSymbol()
         sym.type = "$end"
+        sym.filename = ""
         sym.parser = self  # <tm> 25 June 2008
         symstack.append(sym)
 
@@ -276,6 +413,7 @@ class Parser:
                 if not lookahead:
                     lookahead = YaccSymbol()
                     lookahead.type = "$end"
+                    lookahead.filename = ""
                     lookahead.parser = self  # <tm> 25 June 2008
             if debug:
                 errorlead = (
@@ -285,7 +423,7 @@ class Parser:
             # Check the action table
             s = statestack[-1]
             ltype = lookahead.type
-            t = actions.get((s, ltype), None)
+            t = rows[s].get(ltype)
 
             if debug > 1:
                 print("action", t)
@@ -301,6 +439,8 @@ class Parser:
                         sys.stderr.write("%-60s shift state %s\n" % (errorlead, t))
                     symstack.append(lookahead)
                     lookahead = None
+                    if profile is not None:
+                        profile.shifted(len(symstack))
 
                     # Decrease error count on successful shift
                     if self.errorcount > 0:
@@ -310,47 +450,53 @@ class Parser:
 
                 if t < 0:
                     # reduce a symbol on the stack, emit a production
-                    p = prod[-t]
-                    pname = p.name
-                    plen = p.len
+                    pname, plen, func, gotos = reductions_table[-t]
 
                     # Get production function
                     sym = YaccSymbol()
                     sym.type = pname  # Production name
                     sym.value = None
+                    sym.filename = ""
                     if debug > 1:
                         sys.stderr.write("%-60s reduce %d\n" % (errorlead, -t))
 
+                    # The right hand side stays on the stack while the rule
+                    # runs, from symstack[base] to the top
+                    base = len(symstack) - plen
                     if plen:
-                        targ = symstack[-plen - 1 :]
-                        targ[0] = sym
+                        first = symstack[base]
+                        last = symstack[-1]
                         try:
-                            sym.lineno = targ[1].lineno
-                            sym.filename = targ[1].filename
-                            sym.endlineno = getattr(targ[-1], "endlineno", targ[-1].lineno)
-                            sym.lexpos = targ[1].lexpos
-                            sym.endlexpos = getattr(targ[-1], "endlexpos", targ[-1].lexpos)
+                            sym.lineno = first.lineno
+                            sym.filename = first.filename
+                            sym.endlineno = getattr(last, "endlineno", last.lineno)
+                            sym.lexpos = first.lexpos
+                            sym.endlexpos = getattr(last, "endlexpos", last.lexpos)
                         except AttributeError:
                             sym.lineno = 0
-                        del symstack[-plen:]
-                        del statestack[-plen:]
                     else:
                         sym.lineno = 0
-                        targ = [sym]
-                    pslice.slice = targ
-                    pslice.pbstack = []
+                    pslice.sym = sym
+                    pslice.base = base
+                    pslice.plen = plen
+                    self.reductions += 1
                     # Call the grammar rule with our special slice object
-                    p.func(pslice)
+                    func(pslice)
+
+                    if plen:
+                        del symstack[base:]
+                        del statestack[-plen:]
 
                     # If there was a pushback, put that on the stack
-                    if pslice.pbstack:
+                    if pbstack:
                         lookaheadstack.append(lookahead)
-                        for _t in pslice.pbstack:
+                        for _t in pbstack:
                             lookaheadstack.append(_t)
+                        del pbstack[:]
                         lookahead = None
 
                     symstack.append(sym)
-                    statestack.append(goto[statestack[-1], pname])
+                    statestack.append(gotos[statestack[-1]])
                     continue
 
                 if t == 0:
@@ -374,18 +520,23 @@ class Parser:
                 if not self.errorcount:
                     self.errorcount = error_count
                     errtoken = lookahead
+                    if profile is not None:
+                        profile.recovered("syntax errors", getattr(errtoken, "filename", None))
 
                     # <tm> 24 June 2008
                     # Let EOF error token get through so errorfunc would have
                     # access to the parser.
 
                     if self.errorfunc:
-                        global errok, token, restart
-                        errok = self.errok  # Set some special functions available in error recovery
-                        token = get_token
-                        restart = self.restart
-                        tok = self.errorfunc(errtoken)
-                        del errok, token, restart  # Delete special functions
+                        # The special functions are module globals, so only
+                        # one parser at a time may be recovering from an error
+                        with _errorfunc_lock:
+                            global errok, token, restart
+                            errok = self.errok  # Special functions available in error recovery
+                            token = get_token
+                            restart = self.restart
+                            tok = self.errorfunc(errtoken)
+                            del errok, token, restart  # Delete special functions
 
                         if not self.errorcount:
                             # User must have done some kind of panic
@@ -419,6 +570,8 @@ class Parser:
                 # discarded and we just keep going.
 
                 if len(statestack) <= 1 and lookahead.type != "$end":
+                    if profile is not None:
+                        profile.recovered("tokens discarded")
                     lookahead = None
                     errtoken = None
                     # Nuke the pushback stack
@@ -438,18 +591,25 @@ class Parser:
                     if sym.type == "error":
                         # Hmmm. Error is on top of stack, we'll just nuke input
                         # symbol and continue
+                        if profile is not None:
+                            profile.recovered("tokens discarded")
                         lookahead = None
                         continue
                     t = YaccSymbol()
                     t.type = "error"
+                    t.filename = ""
                     if hasattr(lookahead, "lineno"):
                         t.lineno = lookahead.lineno
                     t.value = lookahead
                     lookaheadstack.append(lookahead)
                     lookahead = t
+                    if profile is not None:
+                        profile.recovered("error tokens")
                 else:
                     symstack.pop()
                     statestack.pop()
+                    if profile is not None:
+                        profile.recovered("symbols popped")
 
                 continue
 
@@ -2150,8 +2310,20 @@ _INSTANCETYPE = object
 # Build the parser module
 # -----------------------------------------------------------------------------
 
+# Building a parser uses the global variables above, so yacc() only lets one
+# thread at a time in. The Parser objects it returns share nothing mutable
+# and can be used from different threads.
+_yacc_lock = threading.RLock()
+_errorfunc_lock = threading.RLock()
+
+
+def yacc(*args, **kwargs):
+    with _yacc_lock:
+        return _yacc(*args, **kwargs)
+
+
 # <ah> Add parserclass parameter.
-def yacc(
+def _yacc(
     method=default_lr,
     debug=yaccdebug,
     module=None,
@@ -2424,6 +2596,11 @@ class ParserPrototype(object):
         parser.goto = self.goto
         parser.method = self.method
         parser.require = self.require
+        if getattr(self, "rows", None) is None:
+            self.rows = action_rows(self.action)
+            self.reductions_table = reduce_table(self.productions, self.goto)
+        parser.rows = self.rows
+        parser.reductions_table = self.reductions_table
         return parser
 
 
@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 
-import os, sys, time, json
+import hashlib, os, sys, time, json
 from ctypesgen.descriptions import *
 from ctypesgen.ctypedescs import *
 from ctypesgen.messages import *
@@ -14,6 +14,21 @@ def path_to_local_file(name, known_local_module=test):
     return os.path.join(basedir, name)
 
 
+def attributes(obj):
+    """Return the attributes of `obj` as a dict, from its __dict__ and, for
+    classes with __slots__ such as descriptions, from its slots."""
+    attrs = dict(getattr(obj, "__dict__", ()))
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get("__slots__", ()):
+            if name not in attrs and hasattr(obj, name):
+                attrs[name] = getattr(obj, name)
+    return attrs
+
+
+def has_attributes(obj):
+    return hasattr(obj, "__dict__") or hasattr(obj, "__slots__")
+
+
 # From http://stackoverflow.com/questions/1036409/recursively-convert-python-object-graph-to-dictionary
 def todict(obj, classkey="Klass"):
     if isinstance(obj, dict):
@@ -26,26 +41,98 @@ def todict(obj, classkey="Klass"):
         return obj
     elif hasattr(obj, "__iter__"):
         return [todict(v, classkey) for v in obj]
-    elif hasattr(obj, "__dict__"):
+    elif has_attributes(obj):
         data = dict(
             [
                 (key, todict(value, classkey))
-                for key, value in obj.__dict__.items()
+                for key, value in attributes(obj).items()
+                if not callable(value) and not key.startswith("_")
+            ]
+        )
+        if classkey is not None and hasattr(obj, "__class__"):
+            data[classkey] = obj.__class__.__name__
+        return data
+    else:
+        return obj
+
+
+def todict_refs(obj, refs, intern, classkey="Klass"):
+    """Like todict(), but each CtypesType is replaced by what `intern`
+    returns for its dict, such as a reference to it. That is only worked out
+    once per object: `refs` maps the id() of each CtypesType seen so far to
+    (object, result). Dicts are copied rather than converted in place."""
+    if isinstance(obj, dict):
+        return dict((k, todict_refs(v, refs, intern, classkey)) for k, v in obj.items())
+    elif isinstance(obj, str) or isinstance(obj, bytes):
+        return obj
+    elif hasattr(obj, "__iter__"):
+        return [todict_refs(v, refs, intern, classkey) for v in obj]
+    elif has_attributes(obj):
+        is_type = isinstance(obj, CtypesType)
+        if is_type and id(obj) in refs:
+            return refs[id(obj)][1]
+        data = dict(
+            [
+                (key, todict_refs(value, refs, intern, classkey))
+                for key, value in attributes(obj).items()
                 if not callable(value) and not key.startswith("_")
             ]
         )
         if classkey is not None and hasattr(obj, "__class__"):
             data[classkey] = obj.__class__.__name__
+        if is_type:
+            data = intern(data)
+            # The object is kept so that its id() is not reused
+            refs[id(obj)] = (obj, data)
         return data
     else:
         return obj
 
 
+def expand_refs(items):
+    """Return the descriptions of JSON output written with --json-type-table,
+    with each {"$ref": ID} replaced by the type it refers to, as written
+    without the type table."""
+    types = {}
+    for item in items:
+        if item.get("type") == "ctype":
+            types[item["id"]] = item["ctype"]
+
+    def expand(obj):
+        if isinstance(obj, dict):
+            if len(obj) == 1 and "$ref" in obj:
+                return expand(types[obj["$ref"]])
+            return dict((k, expand(v)) for k, v in obj.items())
+        elif isinstance(obj, list):
+            return [expand(v) for v in obj]
+        return obj
+
+    return [expand(item) for item in items if item.get("type") != "ctype"]
+
+
 class WrapperPrinter:
-    def __init__(self, outpath, options, data):
-        status_message("Writing to %s." % (outpath or "stdout"))
+    # The method printing each kind of description in output_order
+    method_names = {
+        "function": "print_function",
+        "macro": "print_macro",
+        "struct": "print_struct",
+        "struct-body": "print_struct_members",
+        "typedef": "print_typedef",
+        "variable": "print_variable",
+        "enum": "print_enum",
+        "constant": "print_constant",
+    }
 
-        self.file = open(outpath, "w") if outpath else sys.stdout
+    def __init__(self, outpath, options, data):
+        # outpath may also be an open file, which is left open
+        if hasattr(outpath, "write"):
+            status_message("Writing wrapper.")
+            self.file = outpath
+            self.close_file = False
+        else:
+            status_message("Writing to %s." % (outpath or "stdout"))
+            self.file = open(outpath, "w") if outpath else sys.stdout
+            self.close_file = bool(outpath)
         self.options = options
 
         if self.options.strip_build_path and self.options.strip_build_path[-1] != os.path.sep:
@@ -53,28 +140,83 @@ class WrapperPrinter:
 
         self.print_group(self.options.libraries, "libraries", self.print_library)
 
-        method_table = {
-            "function": self.print_function,
-            "macro": self.print_macro,
-            "struct": self.print_struct,
-            "struct-body": self.print_struct_members,
-            "typedef": self.print_typedef,
-            "variable": self.print_variable,
-            "enum": self.print_enum,
-            "constant": self.print_constant,
-        }
+        # With --json-type-table, each distinct type is written once, as a
+        # "ctype" item with an ID made from its contents, before the first
+        # item referring to it as {"$ref": ID}.
+        self.type_table = getattr(self.options, "json_type_table", False)
+        self.type_refs = {}  # ID -> {"$ref": ID}
+        self.new_types = []
+        self.refs = {}
 
-        res = []
+        # Each item is written as soon as it is rendered, so that the whole
+        # document is never held in memory.
+        compact = getattr(self.options, "json_compact", False)
+        if getattr(self.options, "json_format", "array") == "ndjson":
+            self.write_lines(self.items(data), compact)
+        else:
+            self.write_array(self.items(data), compact)
+
+    def items(self, data):
         for kind, desc in data.output_order:
             if desc.included:
-                item = method_table[kind](desc)
+                item = getattr(self, self.method_names[kind])(desc)
+                for new_type in self.new_types:
+                    yield new_type
+                del self.new_types[:]
                 if item:
-                    res.append(item)
-        self.file.write(json.dumps(res, sort_keys=True, indent=4))
-        self.file.write("\n")
+                    yield item
+
+    def todict(self, ctype):
+        if self.type_table:
+            return todict_refs(ctype, self.refs, self.intern_type)
+        return todict(ctype)
+
+    def intern_type(self, data):
+        text = json.dumps(data, sort_keys=True, separators=(",", ":"))
+        type_id = "t" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+        if type_id not in self.type_refs:
+            self.type_refs[type_id] = {"$ref": type_id}
+            self.new_types.append({"type": "ctype", "id": type_id, "ctype": data})
+        return self.type_refs[type_id]
+
+    def write_array(self, items, compact=False):
+        """Write `items` as a JSON array. Unless `compact`, the text is the
+        same as json.dumps(list(items), sort_keys=True, indent=4)."""
+        if compact:
+            start, separator, end = "[", ",", "]\n"
+        else:
+            # Python 2's json leaves a space after each comma when indenting
+            comma = json.JSONEncoder(indent=4).item_separator
+            start, separator, end = "[\n    ", comma + "\n    ", "\n]\n"
+
+        first = True
+        for item in items:
+            self.file.write(start if first else separator)
+            first = False
+            if compact:
+                self.file.write(json.dumps(item, separators=(",", ":")))
+            else:
+                # Strings in JSON have no newlines, so every line is indented
+                text = json.dumps(item, sort_keys=True, indent=4)
+                self.file.write(text.replace("\n", "\n    "))
+        self.file.write("[]\n" if first else end)
+
+    def write_lines(self, items, compact=False):
+        """Write each of `items` as a line of JSON (NDJSON)."""
+        for item in items:
+            if compact:
+                self.file.write(json.dumps(item, separators=(",", ":")))
+            else:
+                self.file.write(json.dumps(item, sort_keys=True))
+            self.file.write("\n")
 
     def __del__(self):
-        self.file.close()
+        if self.close_file:
+            self.file.close()
+
+    def render_description(self, kind, desc):
+        """Return the JSON printed for `desc`, an entry of output_order."""
+        return json.dumps(getattr(self, self.method_names[kind])(desc), sort_keys=True)
 
     def print_group(self, list, name, function):
         if list:
@@ -87,14 +229,14 @@ class WrapperPrinter:
         return {"type": "constant", "name": constant.name, "value": constant.value.py_string(False)}
 
     def print_typedef(self, typedef):
-        return {"type": "typedef", "name": typedef.name, "ctype": todict(typedef.ctype)}
+        return {"type": "typedef", "name": typedef.name, "ctype": self.todict(typedef.ctype)}
 
     def print_struct(self, struct):
         res = {"type": struct.variety, "name": struct.tag}
         if not struct.opaque:
             res["fields"] = []
             for name, ctype in struct.members:
-                field = {"name": name, "ctype": todict(ctype)}
+                field = {"name": name, "ctype": self.todict(ctype)}
                 if isinstance(ctype, CtypesBitfield):
                     field["bitfield"] = ctype.bitfield.py_string(False)
                 res["fields"].append(field)
@@ -109,7 +251,7 @@ class WrapperPrinter:
         if not enum.opaque:
             res["fields"] = []
             for name, ctype in enum.members:
-                field = {"name": name, "ctype": todict(ctype)}
+                field = {"name": name, "ctype": self.todict(ctype)}
                 res["fields"].append(field)
         return res
 
@@ -118,15 +260,15 @@ class WrapperPrinter:
             "type": "function",
             "name": function.c_name(),
             "variadic": function.variadic,
-            "args": todict(function.argtypes),
-            "return": todict(function.restype),
+            "args": self.todict(function.argtypes),
+            "return": self.todict(function.restype),
         }
         if function.source_library:
             res["source"] = function.source_library
         return res
 
     def print_variable(self, variable):
-        res = {"type": "variable", "ctype": todict(variable.ctype), "name": variable.c_name()}
+        res = {"type": "variable", "ctype": self.todict(variable.ctype), "name": variable.c_name()}
         if variable.source_library:
             res["source"] = variable.source_library
         return res
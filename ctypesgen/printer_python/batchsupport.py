@@ -0,0 +1,191 @@
+# Functions taking and returning only numbers get a `batch` attribute which
+# calls the function once per element of its input buffers:
+#
+#     out = sin.batch(xs)                  # new array.array of results
+#     pow.batch(xs, 2.0, out=ys)           # numbers are used for every call
+#
+# The loop runs in a small C shim compiled on first use when a C compiler
+# is available, and falls back to a Python loop over map() otherwise.
+
+# ctypes type: (array typecode, C type)
+_batch_types = {
+    c_byte: ("b", "signed char"),
+    c_ubyte: ("B", "unsigned char"),
+    c_short: ("h", "short"),
+    c_ushort: ("H", "unsigned short"),
+    c_int: ("i", "int"),
+    c_uint: ("I", "unsigned int"),
+    c_long: ("l", "long"),
+    c_ulong: ("L", "unsigned long"),
+    c_longlong: ("q", "long long"),
+    c_ulonglong: ("Q", "unsigned long long"),
+    c_float: ("f", "float"),
+    c_double: ("d", "double"),
+}
+
+# Shims by (restype, argtypes); None where compiling one failed
+_batch_shims = {}
+
+_batch_shim_template = """
+#include <stddef.h>
+void ctypesgen_batch(%(restype)s (*f)(%(argtypes)s), size_t n, %(restype)s *out%(params)s)
+{
+    size_t i;
+    for (i = 0; i < n; i++)
+        out[i] = f(%(args)s);
+}
+"""
+
+
+def _batch_kind(typecode):
+    if typecode in ("f", "d"):
+        return "float"
+    if typecode in ("b", "h", "i", "l", "q"):
+        return "signed"
+    if typecode in ("B", "H", "I", "L", "Q"):
+        return "unsigned"
+    return None
+
+
+def _batch_view(obj, ctype, writable=False):
+    """Return `obj` as a flat memoryview of items of `ctype`."""
+    typecode = _batch_types[ctype][0]
+    view = memoryview(obj)
+    if not view.c_contiguous:
+        raise TypeError("buffer is not C contiguous")
+    if writable and view.readonly:
+        raise TypeError("output buffer is read-only")
+    fmt = view.format.lstrip("@=")
+    if _batch_kind(fmt) != _batch_kind(typecode):
+        raise TypeError("buffer format %r does not match %s" % (view.format, ctype.__name__))
+    if view.itemsize != sizeof(ctype):
+        raise TypeError(
+            "buffer items are %d bytes, %s needs %d"
+            % (view.itemsize, ctype.__name__, sizeof(ctype))
+        )
+    return view.cast("B").cast(typecode)
+
+
+def _batch_compile_shim(restype, argtypes):
+    """Compile and load a C loop calling a function of the given signature.
+    Returns None if there is no working C compiler."""
+    import hashlib, subprocess, tempfile
+
+    nargs = len(argtypes)
+    source = _batch_shim_template % {
+        "restype": _batch_types[restype][1],
+        "argtypes": ", ".join([_batch_types[t][1] for t in argtypes]),
+        "params": "".join(
+            [
+                ", const %s *in%d, size_t s%d" % (_batch_types[t][1], i, i)
+                for i, t in enumerate(argtypes)
+            ]
+        ),
+        "args": ", ".join(["in%d[i * s%d]" % (i, i) for i in range(nargs)]),
+    }
+    cc = os.environ.get("CC", "cc")
+    cachedir = os.environ.get("CTYPESGEN_CACHE_DIR") or os.path.join(
+        os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "ctypesgen"
+    )
+    key = hashlib.sha1((cc + source).encode()).hexdigest()
+    path = os.path.join(cachedir, "batch-%s.so" % key)
+
+    try:
+        if not os.path.exists(path):
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+            fd, tmppath = tempfile.mkstemp(suffix=".so", dir=cachedir)
+            os.close(fd)
+            try:
+                p = subprocess.Popen(
+                    cc.split() + ["-O2", "-shared", "-fPIC", "-x", "c", "-", "-o", tmppath],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                )
+                p.communicate(source.encode())
+                if p.returncode:
+                    return None
+                os.rename(tmppath, path)
+            finally:
+                if os.path.exists(tmppath):
+                    os.unlink(tmppath)
+        shim = CDLL(path).ctypesgen_batch
+    except (OSError, AttributeError):
+        return None
+
+    shim.argtypes = [c_void_p, c_size_t, c_void_p] + [c_void_p, c_size_t] * nargs
+    shim.restype = None
+    return shim
+
+
+def _batch_function(func, compile_shim=True):
+    """Return a batch version of `func`, or None if `func` does not take and
+    return only numbers, or on Python 2, whose buffers cannot be cast."""
+    if not hasattr(memoryview, "cast"):
+        return None
+    restype = func.restype
+    argtypes = tuple(func.argtypes or ())
+    if not argtypes or restype not in _batch_types or func.errcheck is not None:
+        return None
+    for argtype in argtypes:
+        if argtype not in _batch_types:
+            return None
+
+    def batch(*args, **kwargs):
+        import array, itertools
+
+        out = kwargs.pop("out", None)
+        if kwargs:
+            raise TypeError("unexpected keyword arguments: %s" % ", ".join(kwargs))
+        if len(args) != len(argtypes):
+            raise TypeError("takes %d arguments (%d given)" % (len(argtypes), len(args)))
+
+        # Buffers are iterated over, numbers are used for every call
+        n = None
+        inputs = []
+        for arg, argtype in zip(args, argtypes):
+            try:
+                view = _batch_view(arg, argtype)
+            except TypeError:
+                if not isinstance(arg, (int, float)):
+                    raise
+                inputs.append((argtype(arg), 0))
+                continue
+            if n is not None and len(view) != n:
+                raise ValueError("input buffers differ in length")
+            n = len(view)
+            inputs.append((view, 1))
+        if n is None:
+            raise TypeError("at least one argument must be a buffer")
+
+        if out is None:
+            out = array.array(_batch_types[restype][0], bytes(n * sizeof(restype)))
+        out_view = _batch_view(out, restype, writable=True)
+        if len(out_view) < n:
+            raise ValueError("output buffer is too small")
+
+        key = (restype, argtypes)
+        if key not in _batch_shims and compile_shim:
+            _batch_shims[key] = _batch_compile_shim(restype, argtypes)
+        shim = compile_shim and _batch_shims.get(key)
+
+        if shim:
+            shim_args = [cast(func, c_void_p), n, (c_char * out_view.nbytes).from_buffer(out_view)]
+            for value, stride in inputs:
+                if not stride:
+                    value = byref(value)
+                elif value.readonly:
+                    value = (c_char * value.nbytes).from_buffer_copy(value)
+                else:
+                    value = (c_char * value.nbytes).from_buffer(value)
+                shim_args.extend([value, stride])
+            shim(*shim_args)
+        else:
+            iterables = [
+                stride and value or itertools.repeat(value.value, n) for value, stride in inputs
+            ]
+            out_view[:n] = array.array(_batch_types[restype][0], map(func, *iterables))
+        return out
+
+    return batch
@@ -0,0 +1,65 @@
+# numpy is only imported when a dtype or an array view is first asked for,
+# so the wrapper still loads where numpy is not installed.
+
+
+def numpy_dtype(ctype):
+    """Return the numpy dtype with the same memory layout as `ctype`.
+
+    Field offsets are taken from ctypes itself, so padding and _pack_ are
+    honoured. Bitfields have no numpy equivalent and raise TypeError."""
+    import numpy
+
+    pointer_types = (ctypes._Pointer, ctypes._CFuncPtr, c_void_p, c_char_p, c_wchar_p, String)
+    if issubclass(ctype, pointer_types):
+        return numpy.dtype(numpy.uintp)
+
+    if issubclass(ctype, Array):
+        return numpy.dtype((numpy_dtype(ctype._type_), (ctype._length_,)))
+
+    if issubclass(ctype, (Structure, Union)):
+        names, formats, offsets = [], [], []
+        for field in ctype._fields_:
+            if len(field) > 2:
+                raise TypeError(
+                    "%s.%s is a bitfield, which numpy cannot represent" % (ctype.__name__, field[0])
+                )
+            names.append(field[0])
+            formats.append(numpy_dtype(field[1]))
+            offsets.append(getattr(ctype, field[0]).offset)
+        return numpy.dtype(
+            {"names": names, "formats": formats, "offsets": offsets, "itemsize": sizeof(ctype)}
+        )
+
+    # numpy knows the simple ctypes types
+    return numpy.dtype(ctype)
+
+
+class _numpy_dtype_descriptor(object):
+    """Computes the numpy dtype of the struct it is attached to on first
+    access and then replaces itself with it."""
+
+    def __get__(self, obj, cls):
+        dtype = numpy_dtype(cls)
+        cls._numpy_dtype_ = dtype
+        return dtype
+
+
+def as_numpy_array(pointer, count):
+    """View `count` items starting at the ctypes pointer `pointer` as a numpy
+    array, without copying. Arrays of structs are returned as record arrays.
+
+    The memory is still owned by whoever allocated it; the array must not
+    outlive it."""
+    import numpy
+
+    if not pointer:
+        raise ValueError("NULL pointer")
+    ctype = pointer._type_
+    dtype = getattr(ctype, "_numpy_dtype_", None)
+    if dtype is None:
+        dtype = numpy_dtype(ctype)
+    buf = (c_char * (sizeof(ctype) * count)).from_address(cast(pointer, c_void_p).value)
+    array = numpy.frombuffer(buf, dtype=dtype, count=count)
+    if dtype.names:
+        array = array.view(numpy.recarray)
+    return array
@@ -352,6 +352,85 @@ def UNCHECKED(type):
         return c_void_p
 
 
+# Pointer parameters of wrappers generated with --buffer-args accept any
+# object supporting the buffer protocol (bytearray, array.array, mmap, numpy
+# arrays, ...) and receive a pointer to its storage instead of a copy.
+_buffer_arg_types = {}
+
+
+def _buffer_layout(obj):
+    """Return the size in bytes, the item size and whether `obj` is read-only,
+    or None if it has no buffer. Raises TypeError if the buffer is not C
+    contiguous."""
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        # array.array and mmap only have the old buffer protocol, whose
+        # buffers are contiguous
+        try:
+            return len(buffer(obj)), getattr(obj, "itemsize", 1), False
+        except TypeError:
+            return None
+    size = view.itemsize
+    for dim, stride in reversed(zip(view.shape, view.strides)):
+        if dim > 1 and stride != size:
+            raise TypeError("buffer is not C contiguous")
+        size *= dim
+    return size, view.itemsize, view.readonly
+
+
+def _buffer_arg(ptrtype, writable=True):
+    """Return a subclass of the pointer type `ptrtype` whose from_param also
+    accepts buffers. `writable` is False for pointers to const."""
+    try:
+        return _buffer_arg_types[ptrtype, writable]
+    except KeyError:
+        pass
+
+    base_from_param = ptrtype.from_param
+
+    def from_param(cls, obj):
+        # c_void_p would happily let C write into immutable strings
+        if writable and isinstance(obj, str):
+            raise TypeError("argument is not const, but strings are read-only")
+        try:
+            return base_from_param(obj)
+        except TypeError:
+            pass
+
+        # Python 2 memoryviews cannot give ctypes their address
+        layout = None if isinstance(obj, memoryview) else _buffer_layout(obj)
+        if layout is None:
+            raise TypeError(
+                "expected %s instance or buffer instead of %s"
+                % (ptrtype.__name__, type(obj).__name__)
+            )
+        nbytes, itemsize, readonly = layout
+        # c_void_p points to anything; other pointers need matching items.
+        # The size is checked here since struct fields may be set after
+        # the wrapper declares the function.
+        if ptrtype is not c_void_p and itemsize != sizeof(ptrtype._type_):
+            raise TypeError(
+                "buffer items are %d bytes, %s needs %d"
+                % (itemsize, ptrtype._type_.__name__, sizeof(ptrtype._type_))
+            )
+        if readonly:
+            if writable:
+                raise TypeError("argument is not const, but the buffer is read-only")
+            if isinstance(obj, str):
+                # ctypes passes strings as a pointer to their contents
+                return obj
+            raise TypeError("read-only buffers other than strings are not supported")
+
+        return cast((c_char * nbytes).from_buffer(obj), ptrtype)
+
+    argtype = type(ptrtype)(
+        "buffer_" + ptrtype.__name__, (ptrtype,), {"from_param": classmethod(from_param)}
+    )
+    _buffer_arg_types[ptrtype, writable] = argtype
+    return argtype
+
+
 # ctypes doesn't have direct support for variadic functions, so we have to write
 # our own wrapper class
 class _variadic_function(object):
@@ -361,16 +440,56 @@ class _variadic_function(object):
         self.argtypes = argtypes
         if errcheck:
             self.func.errcheck = errcheck
+        self._call = _variadic_caller(self.func, argtypes)
 
     def _as_parameter_(self):
         # So we can pass this variadic function as a function pointer
         return self.func
 
     def __call__(self, *args):
-        fixed_args = []
-        i = 0
-        for argtype in self.argtypes:
-            # Typecheck what we can
-            fixed_args.append(argtype.from_param(args[i]))
-            i += 1
-        return self.func(*fixed_args + list(args[i:]))
+        return self._call(*args)
+
+
+def _variadic_caller(func, argtypes):
+    """Return a callable that typechecks the fixed arguments of `func` and
+    passes the variadic ones through untouched.
+
+    The converters are looked up once here, and the common arities get a
+    closure with one parameter per fixed argument so that no argument list
+    has to be built on each call."""
+    converters = [argtype.from_param for argtype in argtypes]
+    nfixed = len(converters)
+
+    if nfixed == 0:
+        return func
+
+    if nfixed == 1:
+        (c0,) = converters
+
+        def call(a0, *args):
+            return func(c0(a0), *args)
+
+    elif nfixed == 2:
+        c0, c1 = converters
+
+        def call(a0, a1, *args):
+            return func(c0(a0), c1(a1), *args)
+
+    elif nfixed == 3:
+        c0, c1, c2 = converters
+
+        def call(a0, a1, a2, *args):
+            return func(c0(a0), c1(a1), c2(a2), *args)
+
+    else:
+
+        def call(*args):
+            if len(args) < nfixed:
+                raise TypeError(
+                    "this function takes at least %d arguments (%d given)" % (nfixed, len(args))
+                )
+            fixed_args = [convert(arg) for convert, arg in zip(converters, args)]
+            fixed_args.extend(args[nfixed:])
+            return func(*fixed_args)
+
+    return call
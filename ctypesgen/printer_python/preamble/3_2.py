@@ -338,43 +338,54 @@ class String(MutableString, Union):
         return self.data and len(self.data) or 0
 
     def from_param(cls, obj):
-        # Convert None or 0
-        if obj is None or obj == 0:
-            return cls(POINTER(c_char)())
+        # Dispatch on the exact type first; this covers nearly every call.
+        try:
+            convert = cls._param_converters[type(obj)]
+        except KeyError:
+            return cls._from_param_slow(obj)
+        return convert(obj)
 
-        # Convert from String
-        elif isinstance(obj, String):
-            return obj
+    from_param = classmethod(from_param)
 
-        # Convert from bytes
-        elif isinstance(obj, bytes):
-            return cls(obj)
+    def _from_param_slow(cls, obj):
+        # Convert None or 0
+        if obj is None or obj == 0:
+            return None
 
-        # Convert from str
-        elif isinstance(obj, str):
-            return cls(obj.encode())
+        # Convert from subclasses of the types handled in _param_converters.
+        # Remember the match so the next call takes the fast path.
+        for base in (String, bytes, str, c_char_p, POINTER(c_char), int):
+            if isinstance(obj, base):
+                convert = cls._param_converters[base]
+                cls._param_converters[type(obj)] = convert
+                return convert(obj)
 
-        # Convert from c_char_p
-        elif isinstance(obj, c_char_p):
+        # Convert from c_char array
+        if isinstance(obj, Array) and obj._type_ is c_char:
+            cls._param_converters[type(obj)] = _string_passthrough
             return obj
 
-        # Convert from POINTER(c_char)
-        elif isinstance(obj, POINTER(c_char)):
-            return obj
+        # Convert from object
+        return cls.from_param(obj._as_parameter_)
 
-        # Convert from raw pointer
-        elif isinstance(obj, int):
-            return cls(cast(obj, POINTER(c_char)))
+    _from_param_slow = classmethod(_from_param_slow)
 
-        # Convert from c_char array
-        elif isinstance(obj, c_char * len(obj)):
-            return obj
 
-        # Convert from object
-        else:
-            return String.from_param(obj._as_parameter_)
+def _string_passthrough(obj):
+    return obj
 
-    from_param = classmethod(from_param)
+
+# bytes, str and None are handed to ctypes as-is (or encoded): ctypes passes
+# them as char * directly, so no String instance needs to be built per call.
+String._param_converters = {
+    type(None): lambda obj: None,
+    String: _string_passthrough,
+    bytes: _string_passthrough,
+    str: lambda obj: obj.encode(),
+    c_char_p: _string_passthrough,
+    POINTER(c_char): _string_passthrough,
+    int: lambda obj: String(cast(obj, POINTER(c_char))),
+}
 
 
 def ReturnString(obj, func=None, arguments=None):
@@ -395,6 +406,65 @@ def UNCHECKED(type):
         return c_void_p
 
 
+# Pointer parameters of wrappers generated with --buffer-args accept any
+# object supporting the buffer protocol (bytearray, array.array, mmap, numpy
+# arrays, ...) and receive a pointer to its storage instead of a copy.
+_buffer_arg_types = {}
+
+
+def _buffer_arg(ptrtype, writable=True):
+    """Return a subclass of the pointer type `ptrtype` whose from_param also
+    accepts buffers. `writable` is False for pointers to const."""
+    try:
+        return _buffer_arg_types[ptrtype, writable]
+    except KeyError:
+        pass
+
+    base_from_param = ptrtype.from_param
+
+    def from_param(cls, obj):
+        # c_void_p would happily let C write into immutable bytes
+        if writable and isinstance(obj, bytes):
+            raise TypeError("argument is not const, but bytes are read-only")
+        try:
+            return base_from_param(obj)
+        except TypeError:
+            pass
+
+        try:
+            view = memoryview(obj)
+        except TypeError:
+            raise TypeError(
+                "expected %s instance or buffer instead of %s"
+                % (ptrtype.__name__, type(obj).__name__)
+            )
+        if not view.c_contiguous:
+            raise TypeError("buffer is not C contiguous")
+        # c_void_p points to anything; other pointers need matching items.
+        # The size is checked here since struct fields may be set after
+        # the wrapper declares the function.
+        if ptrtype is not c_void_p and view.itemsize != sizeof(ptrtype._type_):
+            raise TypeError(
+                "buffer items are %d bytes, %s needs %d"
+                % (view.itemsize, ptrtype._type_.__name__, sizeof(ptrtype._type_))
+            )
+        if view.readonly:
+            if writable:
+                raise TypeError("argument is not const, but the buffer is read-only")
+            if isinstance(obj, bytes):
+                # ctypes passes bytes as a pointer to their contents
+                return obj
+            raise TypeError("read-only buffers other than bytes are not supported")
+
+        return cast((c_char * view.nbytes).from_buffer(obj), ptrtype)
+
+    argtype = type(ptrtype)(
+        "buffer_" + ptrtype.__name__, (ptrtype,), {"from_param": classmethod(from_param)}
+    )
+    _buffer_arg_types[ptrtype, writable] = argtype
+    return argtype
+
+
 # ctypes doesn't have direct support for variadic functions, so we have to write
 # our own wrapper class
 class _variadic_function(object):
@@ -404,16 +474,56 @@ class _variadic_function(object):
         self.argtypes = argtypes
         if errcheck:
             self.func.errcheck = errcheck
+        self._call = _variadic_caller(self.func, argtypes)
 
     def _as_parameter_(self):
         # So we can pass this variadic function as a function pointer
         return self.func
 
     def __call__(self, *args):
-        fixed_args = []
-        i = 0
-        for argtype in self.argtypes:
-            # Typecheck what we can
-            fixed_args.append(argtype.from_param(args[i]))
-            i += 1
-        return self.func(*fixed_args + list(args[i:]))
+        return self._call(*args)
+
+
+def _variadic_caller(func, argtypes):
+    """Return a callable that typechecks the fixed arguments of `func` and
+    passes the variadic ones through untouched.
+
+    The converters are looked up once here, and the common arities get a
+    closure with one parameter per fixed argument so that no argument list
+    has to be built on each call."""
+    converters = [argtype.from_param for argtype in argtypes]
+    nfixed = len(converters)
+
+    if nfixed == 0:
+        return func
+
+    if nfixed == 1:
+        (c0,) = converters
+
+        def call(a0, *args):
+            return func(c0(a0), *args)
+
+    elif nfixed == 2:
+        c0, c1 = converters
+
+        def call(a0, a1, *args):
+            return func(c0(a0), c1(a1), *args)
+
+    elif nfixed == 3:
+        c0, c1, c2 = converters
+
+        def call(a0, a1, a2, *args):
+            return func(c0(a0), c1(a1), c2(a2), *args)
+
+    else:
+
+        def call(*args):
+            if len(args) < nfixed:
+                raise TypeError(
+                    "this function takes at least %d arguments (%d given)" % (nfixed, len(args))
+                )
+            fixed_args = [convert(arg) for convert, arg in zip(converters, args)]
+            fixed_args.extend(args[nfixed:])
+            return func(*fixed_args)
+
+    return call
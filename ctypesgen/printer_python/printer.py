@@ -1,11 +1,17 @@
 #!/usr/bin/env python
 
 import os, sys, time, glob, re
+
+try:
+    from StringIO import StringIO  # Python 2, where the printer writes str
+except ImportError:
+    from io import StringIO
 from ..descriptions import *
 from ..ctypedescs import *
 from ..messages import *
 
 from .. import libraryloader  # So we can get the path to it
+from .. import locations
 from . import test  # So we can find the path to local files in the printer package
 
 
@@ -40,14 +46,33 @@ def get_preamble(major=None, minor=None):
 
 
 class WrapperPrinter:
-    def __init__(self, outpath, options, data):
-        status_message("Writing to %s." % (outpath or "stdout"))
+    # The method printing each kind of description in output_order
+    method_names = {
+        "function": "print_function",
+        "macro": "print_macro",
+        "struct": "print_struct",
+        "struct-body": "print_struct_members",
+        "typedef": "print_typedef",
+        "variable": "print_variable",
+        "enum": "print_enum",
+        "constant": "print_constant",
+    }
 
-        self.file = open(outpath, "w") if outpath else sys.stdout
+    def __init__(self, outpath, options, data):
+        # outpath may also be an open file, which is left open
+        if hasattr(outpath, "write"):
+            status_message("Writing wrapper.")
+            self.file = outpath
+            self.close_file = False
+        else:
+            status_message("Writing to %s." % (outpath or "stdout"))
+            self.file = open(outpath, "w") if outpath else sys.stdout
+            self.close_file = bool(outpath)
         self.options = options
 
         if self.options.strip_build_path and self.options.strip_build_path[-1] != os.path.sep:
             self.options.strip_build_path += os.path.sep
+        self.filenames = {}
 
         self.print_header()
         self.file.write("\n")
@@ -55,32 +80,39 @@ class WrapperPrinter:
         self.print_preamble()
         self.file.write("\n")
 
+        if self.options.numpy_dtypes:
+            self.print_numpy_support()
+            self.file.write("\n")
+
+        if self.options.batch_functions:
+            self.print_batch_support()
+            self.file.write("\n")
+
         self.print_loader()
         self.file.write("\n")
 
         self.print_group(self.options.libraries, "libraries", self.print_library)
         self.print_group(self.options.modules, "modules", self.print_module)
 
-        method_table = {
-            "function": self.print_function,
-            "macro": self.print_macro,
-            "struct": self.print_struct,
-            "struct-body": self.print_struct_members,
-            "typedef": self.print_typedef,
-            "variable": self.print_variable,
-            "enum": self.print_enum,
-            "constant": self.print_constant,
-        }
-
         for kind, desc in data.output_order:
             if desc.included:
-                method_table[kind](desc)
+                getattr(self, self.method_names[kind])(desc)
                 self.file.write("\n")
 
         self.print_group(self.options.inserted_files, "inserted files", self.insert_file)
 
     def __del__(self):
-        self.file.close()
+        if self.close_file:
+            self.file.close()
+
+    def render_description(self, kind, desc):
+        """Return the text printed for `desc`, an entry of output_order."""
+        saved_file, self.file = self.file, StringIO()
+        try:
+            getattr(self, self.method_names[kind])(desc)
+            return self.file.getvalue()
+        finally:
+            self.file = saved_file
 
     def print_group(self, list, name, function):
         if list:
@@ -94,19 +126,24 @@ class WrapperPrinter:
             self.file.write("# No %s\n" % name)
         self.file.write("\n")
 
-    def srcinfo(self, src):
-        if src == None:
+    def srcinfo(self, location):
+        if location == None:
             self.file.write("\n")
         else:
-            filename, lineno = src
-            if filename in ("<built-in>", "<command line>"):
-                self.file.write("# %s\n" % filename)
-            else:
+            # The file name as printed, worked out once per file
+            file_id = locations.file_id_of(location)
+            filename = self.filenames.get(file_id)
+            if filename is None:
+                filename = locations.file_name(file_id)
                 if self.options.strip_build_path and filename.startswith(
                     self.options.strip_build_path
                 ):
                     filename = filename[len(self.options.strip_build_path) :]
-                self.file.write("# %s: %s\n" % (filename, lineno))
+                self.filenames[file_id] = filename
+            if filename in ("<built-in>", "<command line>"):
+                self.file.write("# %s\n" % filename)
+            else:
+                self.file.write("# %s: %s\n" % (filename, locations.lineno(location)))
 
     def template_subs(self):
         template_subs = {
@@ -158,6 +195,22 @@ class WrapperPrinter:
         preamble_file.close()
         self.file.write("\n# End preamble\n")
 
+    def print_numpy_support(self):
+        self.file.write("# Begin numpy support\n\n")
+        path = path_to_local_file("numpysupport.py")
+        numpy_file = open(path, "r")
+        self.file.write(numpy_file.read())
+        numpy_file.close()
+        self.file.write("\n# End numpy support\n")
+
+    def print_batch_support(self):
+        self.file.write("# Begin batch support\n\n")
+        path = path_to_local_file("batchsupport.py")
+        batch_file = open(path, "r")
+        self.file.write(batch_file.read())
+        batch_file.close()
+        self.file.write("\n# End batch support\n")
+
     def print_loader(self):
         self.file.write("_libs = {}\n")
         self.file.write("_libdirs = %s\n\n" % self.options.compile_libdirs)
@@ -181,14 +234,14 @@ class WrapperPrinter:
 
     def print_constant(self, constant):
         self.file.write("%s = %s" % (constant.name, constant.value.py_string(False)))
-        self.srcinfo(constant.src)
+        self.srcinfo(constant.location)
 
     def print_typedef(self, typedef):
         self.file.write("%s = %s" % (typedef.name, typedef.ctype.py_string()))
-        self.srcinfo(typedef.src)
+        self.srcinfo(typedef.location)
 
     def print_struct(self, struct):
-        self.srcinfo(struct.src)
+        self.srcinfo(struct.location)
         base = {"union": "Union", "struct": "Structure"}[struct.variety]
         self.file.write("class %s_%s(%s):\n" "    pass\n" % (struct.variety, struct.tag, base))
 
@@ -241,9 +294,14 @@ class WrapperPrinter:
                 self.file.write("    ('%s', %s),\n" % (name, ctype.py_string()))
         self.file.write("]\n")
 
+        if self.options.numpy_dtypes:
+            self.file.write(
+                "%s_%s._numpy_dtype_ = _numpy_dtype_descriptor()\n" % (struct.variety, struct.tag)
+            )
+
     def print_enum(self, enum):
         self.file.write("enum_%s = c_int" % enum.tag)
-        self.srcinfo(enum.src)
+        self.srcinfo(enum.location)
         # Values of enumerator are output as constants.
 
     def print_function(self, function):
@@ -253,7 +311,7 @@ class WrapperPrinter:
             self.print_fixed_function(function)
 
     def print_fixed_function(self, function):
-        self.srcinfo(function.src)
+        self.srcinfo(function.location)
 
         # If we know what library the function lives in, look there.
         # Otherwise, check all the libraries.
@@ -274,8 +332,7 @@ class WrapperPrinter:
 
         # Argument types
         self.file.write(
-            "    %s.argtypes = [%s]\n"
-            % (function.py_name(), ", ".join([a.py_string() for a in function.argtypes]))
+            "    %s.argtypes = [%s]\n" % (function.py_name(), self.argtypes_py_string(function))
         )
 
         # Return value
@@ -297,12 +354,53 @@ class WrapperPrinter:
                 self.file.write(
                     "    %s.errcheck = %s\n" % (function.py_name(), function.errcheck.py_string())
                 )
+            elif self.options.batch_functions and self.is_batchable(function):
+                # Checked again at run time, when the types are known for sure
+                self.file.write(
+                    "    _batch = _batch_function({PN})\n"
+                    "    if _batch is not None:\n"
+                    "        {PN}.batch = _batch\n".format(PN=function.py_name())
+                )
 
         if not function.source_library:
             self.file.write("    break\n")
 
+    # Types _batch_function can loop over, by their Python name
+    batch_types = (
+        "c_byte c_ubyte c_short c_ushort c_int c_uint c_long c_ulong c_longlong c_ulonglong "
+        "c_int8 c_uint8 c_int16 c_uint16 c_int32 c_uint32 c_int64 c_uint64 "
+        "c_size_t c_ssize_t c_float c_double"
+    ).split()
+
+    def is_batchable(self, function):
+        """Return whether `function` takes and returns only numbers."""
+        types = [function.restype] + list(function.argtypes)
+        return len(types) > 1 and all(
+            isinstance(t, (CtypesSimple, CtypesTypedef)) and t.py_string() in self.batch_types
+            for t in types
+        )
+
+    def argtypes_py_string(self, function):
+        """Return the list of argument types of `function` as Python code."""
+        argtypes = []
+        for argtype in function.argtypes:
+            # With --buffer-args, pointers to numbers, structs and void also
+            # accept objects supporting the buffer protocol.
+            if (
+                self.options.buffer_args
+                and isinstance(argtype, CtypesPointer)
+                and isinstance(argtype.destination, (CtypesSimple, CtypesTypedef, CtypesStruct))
+            ):
+                argtypes.append(
+                    "_buffer_arg(%s, writable=%s)"
+                    % (argtype.py_string(), not argtype.points_to_const())
+                )
+            else:
+                argtypes.append(argtype.py_string())
+        return ", ".join(argtypes)
+
     def print_variadic_function(self, function):
-        self.srcinfo(function.src)
+        self.srcinfo(function.location)
         if function.source_library:
             self.file.write(
                 "if hasattr(_libs['{L}'], '{CN}'):\n"
@@ -315,7 +413,7 @@ class WrapperPrinter:
                     CN=function.c_name(),
                     RT=function.restype.py_string(),
                     E=function.errcheck.py_string(),
-                    t0=", ".join([a.py_string() for a in function.argtypes]),
+                    t0=self.argtypes_py_string(function),
                     PN=function.py_name(),
                 )
             )
@@ -331,13 +429,13 @@ class WrapperPrinter:
                     CN=function.c_name(),
                     RT=function.restype.py_string(),
                     E=function.errcheck.py_string(),
-                    t0=", ".join([a.py_string() for a in function.argtypes]),
+                    t0=self.argtypes_py_string(function),
                     PN=function.py_name(),
                 )
             )
 
     def print_variable(self, variable):
-        self.srcinfo(variable.src)
+        self.srcinfo(variable.location)
         if variable.source_library:
             self.file.write(
                 "try:\n"
@@ -372,7 +470,7 @@ class WrapperPrinter:
         # The macro translator makes heroic efforts but it occasionally fails.
         # We want to contain the failures as much as possible.
         # Hence the try statement.
-        self.srcinfo(macro.src)
+        self.srcinfo(macro.location)
         self.file.write(
             "try:\n"
             "    {MN} = {ME}\n"
@@ -381,7 +479,7 @@ class WrapperPrinter:
         )
 
     def print_func_macro(self, macro):
-        self.srcinfo(macro.src)
+        self.srcinfo(macro.location)
         self.file.write(
             "def {MN}({MP}):\n"
             "    return {ME}\n".format(
@@ -7,6 +7,7 @@ by the parser module and prepare it for output.
 A convenience_function, process(), calls everything else.
 """
 
-__all__ = ["process"]
+__all__ = ["process", "SymbolFileError"]
 
 from .pipeline import process
+from .operations import SymbolFileError
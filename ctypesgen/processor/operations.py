@@ -6,7 +6,7 @@ DescriptionCollection and prepare it for output.
 ctypesgen.processor.pipeline calls the operations module.
 """
 
-import ctypes, re, os, sys, keyword
+import ctypes, fnmatch, re, os, sys, keyword
 from ..descriptions import *
 from ..messages import *
 from .. import libraryloader
@@ -24,17 +24,15 @@ def automatically_typedef_structs(data, options):
             typedef = TypedefDescription(struct.tag, struct.ctype, src=struct.src)
             typedef.add_requirements(set([struct]))
 
-            data.typedefs.append(typedef)
-            data.all.insert(data.all.index(struct) + 1, typedef)
-            data.output_order.append(("typedef", typedef))
+            data.add("typedef", typedef, after=struct)
 
 
 def remove_NULL(data, options):
     """remove_NULL() removes any NULL definitions from the C headers because
 ctypesgen supplies its own NULL definition."""
 
-    for macro in data.macros:
-        if macro.name == "NULL":
+    for macro in data.lookup("NULL"):
+        if isinstance(macro, MacroDescription):
             macro.include_rule = "never"
 
 
@@ -42,20 +40,20 @@ def remove_descriptions_in_system_headers(data, opts):
     """remove_descriptions_in_system_headers() removes descriptions if they came
     from files outside of the header files specified from the command line."""
 
-    known_headers = [os.path.basename(x) for x in opts.headers]
-
-    for description in data.all:
-        if description.src != None:
-            if description.src[0] == "<command line>":
+    known_headers = set(os.path.basename(x) for x in opts.headers)
+
+    for filename in data.files():
+        if filename == "<command line>":
+            excluded = True
+        elif filename == "<built-in>":
+            excluded = not opts.builtin_symbols
+        else:
+            excluded = not opts.all_headers and os.path.basename(filename) not in known_headers
+        if excluded:
+            # If something else requires these, include them even though they
+            # are in a system header file.
+            for description in data.in_file(filename):
                 description.include_rule = "if_needed"
-            elif description.src[0] == "<built-in>":
-                if not opts.builtin_symbols:
-                    description.include_rule = "if_needed"
-            elif os.path.basename(description.src[0]) not in known_headers:
-                if not opts.all_headers:
-                    # If something else requires this, include it even though
-                    # it is in a system header file.
-                    description.include_rule = "if_needed"
 
 
 def remove_macros(data, opts):
@@ -65,25 +63,139 @@ def remove_macros(data, opts):
             macro.include_rule = "never"
 
 
+class SymbolFileError(Exception):
+    pass
+
+
+def _fullmatch(compiled):
+    # Python 2 regular expressions have no fullmatch()
+    try:
+        return compiled.fullmatch
+    except AttributeError:
+        return re.compile(r"(?:%s)\Z" % compiled.pattern, compiled.flags).match
+
+
+class SymbolMatcher(object):
+    """Matches symbol names against exact names, glob patterns and regular
+    expressions. Exact names are looked up in a set; the patterns without
+    groups or global flags, such as globs, are combined into one regular
+    expression, so each name is matched once however many there are.
+    Others are matched one by one, as combining them would renumber their
+    groups or misplace their flags."""
+
+    def __init__(self, names=(), patterns=(), prefix_regex=None):
+        # `patterns` must match the whole name; `prefix_regex`, as given to
+        # --include-symbols or --exclude-symbols, only has to match its start.
+        self.names = set(names)
+        self.tests = []
+        combinable = []
+        for pattern in patterns:
+            compiled = re.compile(pattern)
+            if compiled.groups or compiled.flags & ~re.UNICODE:
+                self.tests.append(_fullmatch(compiled))
+            else:
+                combinable.append(pattern)
+        if combinable:
+            combined = "|".join("(?:%s)" % pattern for pattern in combinable)
+            self.tests.append(_fullmatch(re.compile(combined)))
+        if prefix_regex:
+            self.tests.append(re.compile(prefix_regex).match)
+
+    def __bool__(self):
+        return bool(self.names or self.tests)
+
+    __nonzero__ = __bool__
+
+    def __call__(self, name):
+        if name in self.names:
+            return True
+        for test in self.tests:
+            if test(name):
+                return True
+        return False
+
+
+def read_symbols_file(path, names, patterns):
+    """Add the entries of a symbols file to `names` (exact names) and
+    `patterns` (regular expressions matching whole names).
+
+    The file has one entry per line. Blank lines and lines starting with '#'
+    are ignored, lines starting with 're:' are regular expressions, lines
+    containing any of '*?[' are glob patterns, and other lines are exact
+    names."""
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except (IOError, UnicodeDecodeError) as e:
+        raise SymbolFileError("Cannot read symbols file %s: %s" % (path, e))
+
+    for lineno, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("re:"):
+            pattern = line[3:]
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise SymbolFileError("%s:%d: bad regular expression: %s" % (path, lineno, e))
+            patterns.append(pattern)
+        elif any(c in line for c in "*?["):
+            patterns.append(fnmatch.translate(line))
+        else:
+            names.add(line)
+
+
+def symbol_matcher(paths, regex=None):
+    """Return a SymbolMatcher for the symbols files `paths` and the regular
+    expression `regex`."""
+    names = set()
+    patterns = []
+    for path in paths or ():
+        read_symbols_file(path, names, patterns)
+    return SymbolMatcher(names, patterns, regex)
+
+
+def filter_by_symbols(data, opts):
+    """filter_by_symbols() excludes the symbols matched by the options
+    exclude_symbols and exclude_symbols_files, then re-includes symbols
+    previously rejected by other operations which are matched by
+    include_symbols and include_symbols_files, unless they were excluded."""
+    exclude = symbol_matcher(opts.exclude_symbols_files, opts.exclude_symbols)
+    include = symbol_matcher(opts.include_symbols_files, opts.include_symbols)
+    if not exclude and not include:
+        return
+
+    # So that --incremental and --watch notice when they change
+    for path in (opts.exclude_symbols_files or []) + (opts.include_symbols_files or []):
+        if path not in data.source_files:
+            data.source_files.append(path)
+
+    _filter(data, exclude, include)
+
+
 def filter_by_regexes_exclude(data, opts):
-    """filter_by_regexes_exclude() uses regular expressions specified by options
-    dictionary to filter symbols."""
-    if opts.exclude_symbols:
-        expr = re.compile(opts.exclude_symbols)
-        for object in data.all:
-            if expr.match(object.py_name()):
-                object.include_rule = "never"
+    """filter_by_regexes_exclude() excludes the symbols matched by the option
+    exclude_symbols. filter_by_symbols() does this and more in one pass."""
+    _filter(data, SymbolMatcher(prefix_regex=opts.exclude_symbols), SymbolMatcher())
 
 
 def filter_by_regexes_include(data, opts):
-    """filter_by_regexes_include() uses regular expressions specified by options
-    dictionary to re-include symbols previously rejected by other operations."""
-    if opts.include_symbols:
-        expr = re.compile(opts.include_symbols)
-        for object in data.all:
-            if object.include_rule != "never":
-                if expr.match(object.py_name()):
-                    object.include_rule = "yes"
+    """filter_by_regexes_include() re-includes the symbols matched by the
+    option include_symbols. filter_by_symbols() does this and more in one
+    pass."""
+    _filter(data, SymbolMatcher(), SymbolMatcher(prefix_regex=opts.include_symbols))
+
+
+def _filter(data, exclude, include):
+    if not exclude and not include:
+        return
+    for object in data.all:
+        name = object.py_name()
+        if exclude and exclude(name):
+            object.include_rule = "never"
+        elif include and object.include_rule != "never" and include(name):
+            object.include_rule = "yes"
 
 
 def fix_conflicting_names(data, opts):
@@ -119,6 +231,7 @@ def fix_conflicting_names(data, opts):
             "ctypes",
             "load_library",
             "loader",
+            "numpy_dtype",
             "os",
             "re",
             "sys",
@@ -135,8 +248,21 @@ def fix_conflicting_names(data, opts):
             "UNCHECKED",
             "Union",
             "UserString",
+            "_batch_compile_shim",
+            "_batch_function",
+            "_batch_kind",
+            "_batch_shim_template",
+            "_batch_shims",
+            "_batch_types",
+            "_batch_view",
+            "_buffer_arg",
+            "_buffer_arg_types",
+            "_numpy_dtype_descriptor",
+            "_string_passthrough",
+            "_variadic_caller",
             "_variadic_function",
             "addressof",
+            "as_numpy_array",
             "c_buffer",
             "c_byte",
             "c_char",
@@ -190,9 +316,9 @@ def fix_conflicting_names(data, opts):
             original_name = description.casual_name()
             while description.py_name() in important_names:
                 if isinstance(description, (StructDescription, EnumDescription)):
-                    description.tag += "_"
+                    data.rename(description, description.tag + "_")
                 else:
-                    description.name = "_" + description.name
+                    data.rename(description, "_" + description.name)
 
             if not description.dependents:
                 description.warning(
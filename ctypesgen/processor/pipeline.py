@@ -5,6 +5,7 @@ from ..processor.operations import *
 from ..processor.dependencies import find_dependencies
 from ..ctypedescs import *
 from ..messages import *
+from .. import stats
 
 """
 A brief explanation of the processing steps:
@@ -42,22 +43,39 @@ the errors that print_errors_encountered() has flagged.
 def process(data, options):
     status_message("Processing description list.")
 
-    find_dependencies(data, options)
+    def run(operation):
+        with stats.phase(options, operation.__name__):
+            operation(data, options)
 
-    automatically_typedef_structs(data, options)
-    remove_NULL(data, options)
-    remove_descriptions_in_system_headers(data, options)
-    filter_by_regexes_exclude(data, options)
-    filter_by_regexes_include(data, options)
-    remove_macros(data, options)
+    run(find_dependencies)
+
+    run(automatically_typedef_structs)
+    run(remove_NULL)
+    run(remove_descriptions_in_system_headers)
+    run(filter_by_symbols)
+    run(remove_macros)
     if options.output_language == "python":
         # this function is python specific
-        fix_conflicting_names(data, options)
-    find_source_libraries(data, options)
-
-    calculate_final_inclusion(data, options)
-    print_errors_encountered(data, options)
-    calculate_final_inclusion(data, options)
+        run(fix_conflicting_names)
+    run(find_source_libraries)
+
+    run(calculate_final_inclusion)
+    run(print_errors_encountered)
+    run(calculate_final_inclusion)
+
+    if getattr(options, "stats", None) is not None:
+        count_descriptions(data, options.stats)
+
+
+def count_descriptions(data, stats):
+    """Record the number of descriptions of each kind, and how many of them
+    will be in the output."""
+    for kind, desc in data.output_order:
+        if kind == "struct-body":
+            # The second entry of a struct whose fields are printed later
+            continue
+        stats.count("descriptions.%s" % kind)
+        stats.count(desc.included and "descriptions.included" or "descriptions.excluded")
 
 
 def calculate_final_inclusion(data, opts):
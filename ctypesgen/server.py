@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+
+"""
+ctypesgen.server runs ctypesgen as a long-lived process, so that each
+generation does not pay for starting Python, importing ctypesgen and building
+the grammar tables and the library search cache.
+
+    ctypesgen serve [--socket PATH] [--workers N]
+
+listens on a Unix domain socket. Each request runs ctypesgen with the
+command line, working directory and environment of the client, in one of a
+pool of worker processes forked once the caches are warm.
+
+    ctypesgen client [--socket PATH] [ctypesgen options] header.h ...
+
+sends its arguments to the server and prints what ctypesgen printed, exiting
+with its status. When no server is listening it runs ctypesgen itself, so
+it can replace `ctypesgen` in a Makefile whether or not a server is up.
+
+The socket defaults to $CTYPESGEN_SOCKET, or ctypesgen.sock in
+$XDG_RUNTIME_DIR, or else in a directory of the temporary directory which
+only the user may use. The client only talks to a server running as the
+same user, and only sends the environment variables in environ_names.
+Requests and replies are a line of JSON each:
+
+    {"argv": [...], "prog": "ctypesgen", "cwd": "...", "environ": {...}}
+    {"status": 0, "stdout": "...", "stderr": "..."}
+"""
+
+import errno, io, json, multiprocessing, optparse, os, signal, socket, stat, struct, sys
+import tempfile, traceback
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver  # Python 2, which can only run the client
+
+from . import libraryloader
+from . import messages as msgs
+from .parser import cparser
+
+__all__ = [
+    "Server",
+    "ServerError",
+    "NoServerError",
+    "default_socket_path",
+    "request",
+    "serve",
+    "client",
+]
+
+# The environment variables sent with a request: those read by the C
+# preprocessor and compiler, the library search and ctypesgen's caches
+environ_names = [
+    "PATH",
+    "CPATH",
+    "C_INCLUDE_PATH",
+    "CPLUS_INCLUDE_PATH",
+    "OBJC_INCLUDE_PATH",
+    "GCC_EXEC_PREFIX",
+    "COMPILER_PATH",
+    "CC",
+    "TMPDIR",
+    "LANG",
+    "LC_ALL",
+    "LC_CTYPE",
+    "SOURCE_DATE_EPOCH",
+    "LD_LIBRARY_PATH",
+    "LIBRARY_PATH",
+    "SHLIB_PATH",
+    "LIBPATH",
+    "DYLD_LIBRARY_PATH",
+    "DYLD_FALLBACK_LIBRARY_PATH",
+    "RESOURCEPATH",
+    "HOME",
+    "XDG_CACHE_HOME",
+    "CTYPESGEN_CACHE_DIR",
+]
+
+
+class ServerError(Exception):
+    pass
+
+
+class NoServerError(ServerError):
+    """Nothing is listening on the socket. `stale` is True if the socket file
+    was left behind by a server which is gone."""
+
+    def __init__(self, message, stale=False):
+        ServerError.__init__(self, message)
+        self.stale = stale
+
+
+def private_dir(path):
+    """Create the directory `path` for this user alone, or check that it is
+    one. Raises ServerError if other users could put a socket in it."""
+    try:
+        os.mkdir(path, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise ServerError("%s is not a directory only this user can use" % path)
+    return path
+
+
+def default_socket_path():
+    path = os.environ.get("CTYPESGEN_SOCKET")
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime_dir:
+        runtime_dir = private_dir(os.path.join(tempfile.gettempdir(), "ctypesgen-%d" % os.getuid()))
+    return os.path.join(runtime_dir, "ctypesgen.sock")
+
+
+def server_uid(sock, path):
+    """Return the user ID of the server connected to `sock`, at `path`."""
+    if hasattr(socket, "SO_PEERCRED"):
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        return struct.unpack("3i", creds)[1]
+    return os.stat(path).st_uid
+
+
+def warm_caches():
+    """Build what every run needs, so that forked workers inherit it."""
+    cparser.get_parser_prototype()
+    try:
+        libraryloader.loader.getplatformpaths("c")
+    except AttributeError:
+        pass
+
+
+def run(argv, cwd, environ, prog="ctypesgen"):
+    """Run ctypesgen with `argv` as if started as `prog` in `cwd` with
+    `environ`. Returns its exit status and what it wrote to stdout and
+    stderr."""
+    from . import main as core_main
+
+    stdout, stderr = io.StringIO(), io.StringIO()
+    saved_argv, saved_cwd, saved_environ = sys.argv, os.getcwd(), dict(os.environ)
+    saved_streams = sys.stdout, sys.stderr
+    saved_level = msgs.log.level
+    saved_dirs = list(libraryloader.loader.other_dirs)
+
+    # The command line is quoted in the header of the wrapper
+    sys.argv = [prog] + list(argv)
+    os.chdir(cwd)
+    os.environ.clear()
+    os.environ.update(environ)
+    sys.stdout, sys.stderr = stdout, stderr
+    saved_log_stream = msgs.ch.setStream(stderr)
+    try:
+        core_main.main(argv)
+        status = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            status = e.code or 0
+        else:
+            stderr.write("%s\n" % e.code)
+            status = 1
+    except Exception:
+        traceback.print_exc(file=stderr)
+        status = 1
+    finally:
+        msgs.ch.setStream(saved_log_stream)
+        msgs.log.setLevel(saved_level)
+        sys.stdout, sys.stderr = saved_streams
+        libraryloader.loader.other_dirs[:] = saved_dirs
+        os.environ.clear()
+        os.environ.update(saved_environ)
+        os.chdir(saved_cwd)
+        sys.argv = saved_argv
+    return status, stdout.getvalue(), stderr.getvalue()
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            req = json.loads(self.rfile.readline().decode("utf-8"))
+            args = (
+                list(req["argv"]),
+                req["cwd"],
+                dict(req.get("environ", {})),
+                req.get("prog", "ctypesgen"),
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            reply = {"status": 2, "stdout": "", "stderr": "bad request: %s\n" % e}
+        else:
+            status, stdout, stderr = self.server.pool.apply(run, args)
+            reply = {"status": status, "stdout": stdout, "stderr": stderr}
+        self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """A server answering requests on the Unix socket `path` with a pool of
+    `workers` processes (by default one per CPU).
+
+    Each connection is handled by a thread which waits for a worker, so
+    requests beyond the number of workers queue up."""
+
+    daemon_threads = True
+
+    def __init__(self, path=None, workers=None):
+        self.path = path or default_socket_path()
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                # Left over from a server which did not exit cleanly
+                os.unlink(self.path)
+            else:
+                raise OSError("a server is already listening on %s" % self.path)
+            finally:
+                probe.close()
+
+        warm_caches()
+        # Fork before any thread is started; workers keep their caches
+        # across requests.
+        self.pool = multiprocessing.get_context("fork").Pool(workers)
+        # Only this user may connect, wherever the socket is
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, self.path, RequestHandler)
+        except:
+            self.pool.terminate()
+            raise
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self.pool.terminate()
+        self.pool.join()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def sent_environ(environ=None):
+    """Return the variables of `environ` (by default os.environ) which are
+    sent with a request."""
+    if environ is None:
+        environ = os.environ
+    return dict((name, environ[name]) for name in environ_names if name in environ)
+
+
+def request(argv, path=None, cwd=None, environ=None, prog=None):
+    """Have the server at `path` run ctypesgen with `argv`, with the
+    variables of `environ` (by default os.environ) named in environ_names.
+    Returns the exit status and the output, like run(). Raises NoServerError
+    if no server is listening, and ServerError if the server does not run as
+    this user."""
+    req = {
+        "argv": list(argv),
+        "prog": prog or sys.argv[0] or "ctypesgen",
+        "cwd": cwd or os.getcwd(),
+        "environ": sent_environ(environ),
+    }
+    path = path or default_socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except socket.error as e:
+            if e.errno == errno.ENOENT:
+                raise NoServerError("no server is listening on %s" % path)
+            if e.errno == errno.ECONNREFUSED:
+                raise NoServerError("%s is left from a server which is gone" % path, stale=True)
+            raise
+        uid = server_uid(sock, path)
+        if uid != os.getuid():
+            raise ServerError("the server on %s runs as user %d, not as this user" % (path, uid))
+        sock.sendall(json.dumps(req).encode("utf-8") + b"\n")
+        sock.shutdown(socket.SHUT_WR)
+        f = sock.makefile("rb")
+        try:
+            data = f.read()
+        finally:
+            f.close()
+    finally:
+        sock.close()
+    try:
+        reply = json.loads(data.decode("utf-8"))
+    except ValueError:
+        raise OSError("the server closed the connection without replying")
+    return reply["status"], reply["stdout"], reply["stderr"]
+
+
+def serve(args):
+    op = optparse.OptionParser(usage="usage: %prog serve [--socket PATH] [--workers N]")
+    op.add_option("", "--socket", dest="socket", metavar="PATH", help="listen on PATH")
+    op.add_option(
+        "",
+        "--workers",
+        dest="workers",
+        type="int",
+        metavar="N",
+        help="run up to N requests at once [default: one per CPU]",
+    )
+    (options, rest) = op.parse_args(args)
+    if rest:
+        op.error("unexpected arguments: %s" % " ".join(rest))
+    if not hasattr(multiprocessing, "get_context"):
+        msgs.error_message("The ctypesgen server needs Python 3.4 or later.")
+        sys.exit(1)
+
+    server = Server(options.socket, options.workers)
+    msgs.status_message("Listening on %s." % server.path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def client(args):
+    """Run ctypesgen through the server, or in this process without one.
+    Options of the client itself come first."""
+    path = None
+    while args and args[0].startswith("--socket"):
+        if args[0] == "--socket" and len(args) > 1:
+            path, args = args[1], args[2:]
+        elif args[0].startswith("--socket="):
+            path, args = args[0][len("--socket=") :], args[1:]
+        else:
+            break
+
+    try:
+        status, stdout, stderr = request(args, path)
+    except NoServerError as e:
+        from . import main as core_main
+
+        if e.stale:
+            msgs.warning_message("%s; running ctypesgen without it." % e)
+
+        sys.argv = sys.argv[:1] + args
+        core_main.main(args)
+        return
+    except (ServerError, socket.error, OSError) as e:
+        msgs.error_message("Cannot use the ctypesgen server: %s" % e)
+        sys.exit(1)
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    sys.exit(status)
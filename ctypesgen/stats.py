@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+"""
+ctypesgen.stats records where a ctypesgen run spends its time and memory.
+
+A Stats object collects the wall time and peak memory of each phase (running
+the C preprocessor, lexing its output, parsing, each processing operation and
+printing), along with counters such as the number of tokens, grammar
+reductions and descriptions of each kind.
+
+The parser, processor and printers record into options.stats when it is set.
+On the command line, --stats prints a table and --stats-json saves the same
+data as JSON. From Python:
+
+>>> options = ctypesgen.options.get_default_options()
+>>> options.stats = ctypesgen.stats.Stats()
+>>> descriptions = ctypesgen.parser.parse(headers, options)
+>>> ctypesgen.processor.process(descriptions, options)
+>>> options.stats.as_dict()
+
+A ParserProfile goes further into the parsing phase: set as
+options.parser_profile, it counts the shifts and reductions the LR parser
+makes, the time spent in each grammar rule function (the p_* functions of
+ctypesgen.parser.cgrammar), the steps of error recovery and the deepest the
+parser's stack got. --profile-parser and --profile-parser-json report it.
+"""
+
+import contextlib, json, time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+__all__ = ["Stats", "ParserProfile", "phase", "count"]
+
+
+class Stats(object):
+    """Timings, peak memory and counters for one ctypesgen run.
+
+    Peak memory is the most memory allocated by Python while a phase runs,
+    as measured by tracemalloc. Tracing slows Python code down; pass
+    track_memory=False to get timings closer to an uninstrumented run."""
+
+    def __init__(self, track_memory=True):
+        # Without reset_peak() (Python < 3.9) only the peak of the whole run
+        # could be told apart, so per-phase peaks are not recorded.
+        self.track_memory = track_memory and hasattr(tracemalloc, "reset_peak")
+        self.phases = {}  # name -> {"seconds", "calls", "peak_memory"}
+        self.counters = {}
+        self._stack = []  # Peaks of the phases entered but not yet left
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Time the enclosed code as phase `name`. Phases entered more than
+        once (e.g. once per header) are added up."""
+        # Tracing is only left on while a phase runs, as it slows everything
+        started_tracing = False
+        if self.track_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            if self._stack:
+                self._stack[-1] = max(self._stack[-1], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self._stack.append(0)
+        start = _clock()
+        try:
+            yield
+        finally:
+            seconds = _clock() - start
+            peak = self._stack.pop()
+            if self.track_memory:
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1] = max(self._stack[-1], peak)
+                tracemalloc.reset_peak()
+                if started_tracing:
+                    tracemalloc.stop()
+            self.add_time(name, seconds, peak if self.track_memory else None)
+
+    def add_time(self, name, seconds, peak_memory=None):
+        """Add `seconds` to phase `name`, for phases which are not a single
+        block of code."""
+        entry = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0, "peak_memory": None})
+        entry["seconds"] += seconds
+        entry["calls"] += 1
+        if peak_memory is not None:
+            entry["peak_memory"] = max(entry["peak_memory"] or 0, peak_memory)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self):
+        """Return the collected data as JSON-compatible dicts and lists."""
+        return {
+            "phases": [dict(name=name, **entry) for name, entry in self.phases.items()],
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def format_table(self):
+        """Return the collected data as a table for humans."""
+        lines = ["%-40s %10s %6s %12s" % ("phase", "seconds", "calls", "peak MiB")]
+        for name, entry in self.phases.items():
+            peak = entry["peak_memory"]
+            lines.append(
+                "%-40s %10.4f %6d %12s"
+                % (
+                    name,
+                    entry["seconds"],
+                    entry["calls"],
+                    "-" if peak is None else "%.1f" % (peak / 1048576.0),
+                )
+            )
+        lines.append("")
+        lines.append("%-40s %10s" % ("counter", "value"))
+        for name, value in sorted(self.counters.items()):
+            lines.append("%-40s %10d" % (name, value))
+        return "\n".join(lines)
+
+    def save_json(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.as_dict(), f, indent=4)
+            f.write("\n")
+
+
+class ParserProfile(object):
+    """What the LR parser did over one or more parses.
+
+    yacc.Parser.parse() calls shifted(), reduced() and recovered() when
+    given a profile. Reductions and times are kept per grammar rule function;
+    the times include the handlers the rules call, but not lexing."""
+
+    def __init__(self):
+        self.shifts = 0
+        self.max_depth = 0  # Most symbols on the parser's stack
+        self.productions = {}  # Function name -> [reductions, seconds]
+        self.recovery = {}  # Error recovery event -> count
+        self.error_files = {}  # File name -> syntax errors
+
+    def shifted(self, depth):
+        self.shifts += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def reduced(self, name, seconds, depth):
+        entry = self.productions.get(name)
+        if entry is None:
+            entry = self.productions[name] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def recovered(self, event, filename=None):
+        """Count a step of error recovery: "syntax errors" (reported to the
+        grammar's p_error), "error tokens" pushed, "symbols popped" off the
+        stack or "tokens discarded". Syntax errors are also counted by
+        `filename`."""
+        self.recovery[event] = self.recovery.get(event, 0) + 1
+        if filename:
+            self.error_files[filename] = self.error_files.get(filename, 0) + 1
+
+    @property
+    def reductions(self):
+        return sum(entry[0] for entry in self.productions.values())
+
+    def sorted_productions(self):
+        """Return (name, reductions, seconds) for each function, the most
+        time first."""
+        return sorted(
+            ((name, n, seconds) for name, (n, seconds) in self.productions.items()),
+            key=lambda entry: (-entry[2], entry[0]),
+        )
+
+    def sorted_error_files(self):
+        """Return (file name, syntax errors) for each file, the most errors
+        first."""
+        return sorted(self.error_files.items(), key=lambda item: (-item[1], item[0]))
+
+    def as_dict(self):
+        """Return the collected data as JSON-compatible dicts and lists."""
+        return {
+            "shifts": self.shifts,
+            "reductions": self.reductions,
+            "max_stack_depth": self.max_depth,
+            "productions": [
+                {"function": name, "reductions": n, "seconds": seconds}
+                for name, n, seconds in self.sorted_productions()
+            ],
+            "error_recovery": dict(sorted(self.recovery.items())),
+            "syntax_errors_by_file": [
+                {"file": name, "errors": n} for name, n in self.sorted_error_files()
+            ],
+        }
+
+    def format_table(self):
+        """Return the collected data as a table for humans."""
+        lines = ["%-40s %10s %10s %10s" % ("function", "reductions", "seconds", "us/call")]
+        for name, n, seconds in self.sorted_productions():
+            lines.append("%-40s %10d %10.4f %10.2f" % (name, n, seconds, seconds * 1e6 / n))
+        lines.append("")
+        lines.append("%-40s %10s" % ("counter", "value"))
+        lines.append("%-40s %10d" % ("shifts", self.shifts))
+        lines.append("%-40s %10d" % ("reductions", self.reductions))
+        lines.append("%-40s %10d" % ("max stack depth", self.max_depth))
+        for event in ("syntax errors", "error tokens", "symbols popped", "tokens discarded"):
+            lines.append("%-40s %10d" % (event, self.recovery.get(event, 0)))
+        if self.error_files:
+            lines.append("")
+            lines.append("%-40s %10s" % ("file", "errors"))
+            for name, n in self.sorted_error_files():
+                lines.append("%-40s %10d" % (name, n))
+        return "\n".join(lines)
+
+    def save_json(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.as_dict(), f, indent=4)
+            f.write("\n")
+
+
+def phase(options, name):
+    """Return a context manager timing phase `name` into options.stats, or
+    doing nothing if no statistics are being collected."""
+    stats = getattr(options, "stats", None)
+    if stats is None:
+        return _no_phase()
+    return stats.phase(name)
+
+
+@contextlib.contextmanager
+def _no_phase():
+    yield
+
+
+def count(options, name, n=1):
+    stats = getattr(options, "stats", None)
+    if stats is not None:
+        stats.count(name, n)
@@ -25,6 +25,7 @@ Known to run clean with:
 
 import sys
 import os
+import array
 import ctypes
 import math
 import unittest
@@ -34,8 +35,63 @@ test_directory = os.path.abspath(os.path.dirname(__file__))
 sys.path.append(test_directory)
 sys.path.append(os.path.join(test_directory, ".."))
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 import ctypesgentest  # TODO consider moving test() from ctypesgentest into this module
 
+cache_dir = None
+saved_cache_dir = None
+
+
+def setUpModule():
+    # Keep the lexer tables and batch shims the tests build out of the
+    # user's cache directory
+    import tempfile
+
+    global cache_dir, saved_cache_dir
+    cache_dir = tempfile.mkdtemp(prefix="ctypesgen-cache-")
+    saved_cache_dir = os.environ.get("CTYPESGEN_CACHE_DIR")
+    os.environ["CTYPESGEN_CACHE_DIR"] = cache_dir
+
+
+def tearDownModule():
+    import shutil
+
+    if saved_cache_dir is None:
+        del os.environ["CTYPESGEN_CACHE_DIR"]
+    else:
+        os.environ["CTYPESGEN_CACHE_DIR"] = saved_cache_dir
+    shutil.rmtree(cache_dir)
+
+
+def thread_map(func, items, workers):
+    """Return [func(item) for item in items], calling func from `workers`
+    threads at once (concurrent.futures is not in Python 2)."""
+    import threading
+
+    items = list(items)
+    results = [None] * len(items)
+    errors = []
+
+    def work(start):
+        try:
+            for i in range(start, len(items), workers):
+                results[i] = func(items[i])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(start,)) for start in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
 
 def cleanup_json_src_paths(json):
     """
@@ -129,6 +185,135 @@ class StdlibTest(unittest.TestCase):
         result = module.getenv(env_var_name)
         self.assertEqual(expect_result, result)
 
+    def test_string_param_conversions(self):
+        """Test that every supported kind of char * argument reaches C intact."""
+        module = self.module
+
+        class subbytes(bytes):
+            pass
+
+        for arg in (
+            b"42",
+            "42",
+            subbytes(b"42"),
+            module.String(b"42"),
+            ctypes.c_char_p(b"42"),
+            ctypes.create_string_buffer(b"42"),
+        ):
+            self.assertEqual(module.atoi(arg), 42)
+            # Once for the slow path, once for the cached fast path
+            self.assertEqual(module.atoi(arg), 42)
+
+
+class VariadicFunctionTest(unittest.TestCase):
+    "Test calling variadic functions through _variadic_function"
+
+    def setUp(self):
+        """NOTE this is called once for each test* method
+        (it is not called once per class).
+        FIXME This is slightly inefficient as it is called *way* more times than it needs to be.
+        """
+        header_str = """
+int sprintf(char *str, const char *format, ...);
+int snprintf(char *str, unsigned long size, const char *format, ...);
+"""
+        if sys.platform == "win32":
+            libraries = ["msvcrt"]
+        elif sys.platform.startswith("linux"):
+            libraries = ["libc.so.6"]
+        else:
+            libraries = ["libc"]
+        self.module, output = ctypesgentest.test(header_str, libraries=libraries)
+
+    def tearDown(self):
+        del self.module
+        ctypesgentest.cleanup()
+
+    def test_variadic_args(self):
+        """Fixed arguments are converted, the rest are passed through"""
+        module = self.module
+        buf = ctypes.create_string_buffer(64)
+
+        self.assertEqual(module.sprintf(buf, b"%d-%s", 12, b"ab"), 5)
+        self.assertEqual(buf.value, b"12-ab")
+        self.assertEqual(module.snprintf(buf, 64, "%d", 7), 1)
+        self.assertEqual(buf.value, b"7")
+        self.assertRaises(TypeError, module.snprintf, buf)
+
+
+class BufferArgsTest(unittest.TestCase):
+    "Test passing buffers to pointer parameters with --buffer-args"
+
+    def setUp(self):
+        """NOTE this is called once for each test* method
+        (it is not called once per class).
+        FIXME This is slightly inefficient as it is called *way* more times than it needs to be.
+        """
+        header_str = """
+void *memset(void *s, int c, unsigned long n);
+int memcmp(const void *s1, const void *s2, unsigned long n);
+void *memmove(void * const dest, const void *src, unsigned long n);
+double modf(double x, double *iptr);
+"""
+        if sys.platform == "win32":
+            libraries = ["msvcrt"]
+        elif sys.platform.startswith("linux"):
+            libraries = ["libc.so.6", "libm.so.6"]
+        else:
+            libraries = ["libc"]
+        self.module, output = ctypesgentest.test(header_str, libraries=libraries, buffer_args=True)
+
+    def tearDown(self):
+        del self.module
+        ctypesgentest.cleanup()
+
+    def test_writable_buffers(self):
+        """Writable buffers are passed without copying"""
+        module = self.module
+
+        buf = bytearray(4)
+        module.memset(buf, ord("x"), 3)
+        self.assertEqual(buf, bytearray(b"xxx\0"))
+
+        if sys.version_info >= (3,):
+            # Python 2's ctypes cannot pass memoryviews
+            buf = bytearray(8)
+            module.memset(memoryview(buf)[2:4], ord("y"), 2)
+            self.assertEqual(buf, bytearray(b"\0\0yy\0\0\0\0"))
+
+        # A const pointer to writable memory
+        buf = bytearray(3)
+        module.memmove(buf, b"abc", 3)
+        self.assertEqual(buf, bytearray(b"abc"))
+
+        ipart = array.array("d", [0.0])
+        self.assertEqual(module.modf(2.5, ipart), 0.5)
+        self.assertEqual(ipart[0], 2.0)
+
+        # ctypes objects are still accepted as before
+        ipart = ctypes.c_double()
+        module.modf(3.5, ctypes.byref(ipart))
+        self.assertEqual(ipart.value, 3.0)
+
+    def test_const_buffers(self):
+        """Read-only bytes are only accepted for pointers to const"""
+        module = self.module
+
+        self.assertEqual(module.memcmp(b"abc", bytearray(b"abc"), 3), 0)
+        self.assertRaises(ctypes.ArgumentError, module.memset, b"abc", 0, 3)
+        # A const pointer to writable memory
+        self.assertRaises(ctypes.ArgumentError, module.memmove, b"abc", b"xyz", 3)
+
+    def test_bad_buffers(self):
+        """Item size and contiguity are checked against the pointee type"""
+        module = self.module
+
+        self.assertRaises(ctypes.ArgumentError, module.modf, 2.5, array.array("f", [0.0]))
+        if sys.version_info >= (3,):
+            strided = memoryview(bytearray(8))[::2]
+            self.assertRaises(ctypes.ArgumentError, module.memset, strided, 0, 4)
+        self.assertRaises(ctypes.ArgumentError, module.memset, 4.2, 0, 4)
+
 
 class StdBoolTest(unittest.TestCase):
     "Test correct parsing and generation of bool type"
@@ -718,7 +903,7 @@ typedef struct {
                         "name": None,
                     },
                 ],
-                "name": "anon_4",
+                "name": "anon_1",
                 "type": "struct",
             },
             {
@@ -799,7 +984,7 @@ typedef struct {
                     "opaque": False,
                     "packed": False,
                     "src": ["/some-path/temp.h", 21],
-                    "tag": "anon_4",
+                    "tag": "anon_1",
                     "variety": "struct",
                 },
                 "name": "foo_t",
@@ -878,7 +1063,7 @@ typedef struct {
                         "name": None,
                     },
                 ],
-                "name": "anon_5",
+                "name": "anon_2",
                 "type": "struct",
             },
             {
@@ -959,7 +1144,7 @@ typedef struct {
                     "opaque": False,
                     "packed": True,
                     "src": ["/some-path/temp.h", 30],
-                    "tag": "anon_5",
+                    "tag": "anon_2",
                     "variety": "struct",
                 },
                 "name": "packed_foo_t",
@@ -989,7 +1174,7 @@ typedef struct {
                         "name": "Int",
                     }
                 ],
-                "name": "anon_6",
+                "name": "anon_3",
                 "type": "struct",
             },
             {
@@ -1012,7 +1197,7 @@ typedef struct {
                     "opaque": False,
                     "packed": False,
                     "src": ["/some-path/temp.h", 41],
-                    "tag": "anon_6",
+                    "tag": "anon_3",
                     "variety": "struct",
                 },
                 "name": "id_struct_t",
@@ -1234,6 +1419,162 @@ typedef struct {
         self.assertEqual(id_struct_t._fields_, [("Int", ctypes.c_int)])
 
 
+class NumpyDtypesTest(unittest.TestCase):
+    "Test the numpy dtypes generated with --numpy-dtypes"
+
+    def setUp(self):
+        """NOTE this is called once for each test* method
+        (it is not called once per class).
+        FIXME This is slightly inefficient as it is called *way* more times than it needs to be.
+        """
+        header_str = """
+struct point {
+    char tag;
+    double x;
+    int y[2];
+};
+
+struct __attribute__((packed)) packed_point {
+    char tag;
+    double x;
+};
+
+struct outer {
+    struct point p;
+    struct point *next;
+};
+
+struct flags {
+    int a : 3;
+    int b : 5;
+};
+"""
+        self.module, output = ctypesgentest.test(header_str, numpy_dtypes=True)
+
+    def tearDown(self):
+        del self.module
+        ctypesgentest.cleanup()
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_dtype_layout(self):
+        """Offsets and item sizes match ctypes, including packing"""
+        module = self.module
+        for struct in (module.struct_point, module.struct_packed_point, module.struct_outer):
+            dtype = struct._numpy_dtype_
+            self.assertEqual(dtype.itemsize, ctypes.sizeof(struct))
+            for name, _ in struct._fields_:
+                self.assertEqual(dtype.fields[name][1], getattr(struct, name).offset)
+        self.assertEqual(module.struct_packed_point._numpy_dtype_.fields["x"][1], 1)
+        self.assertEqual(module.struct_point._numpy_dtype_["y"].shape, (2,))
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_bitfields_rejected(self):
+        self.assertRaises(TypeError, getattr, self.module.struct_flags, "_numpy_dtype_")
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_array_view(self):
+        """A pointer and a count are viewed as a record array without copying"""
+        module = self.module
+        points = (module.struct_point * 3)()
+        for i, point in enumerate(points):
+            point.x = i * 1.5
+            point.y[1] = i
+        pointer = ctypes.cast(points, ctypes.POINTER(module.struct_point))
+
+        view = module.as_numpy_array(pointer, 3)
+        self.assertEqual(list(view.x), [0.0, 1.5, 3.0])
+        self.assertEqual(list(view.y[:, 1]), [0, 1, 2])
+        view.x[2] = 7.0
+        self.assertEqual(points[2].x, 7.0)
+
+    @unittest.skipIf(numpy is not None, "numpy is installed")
+    def test_lazy_import(self):
+        """The wrapper loads without numpy; only using a dtype needs it"""
+        self.assertRaises(ImportError, getattr, self.module.struct_point, "_numpy_dtype_")
+
+
+@unittest.skipUnless(hasattr(memoryview, "cast"), "needs Python 3")
+class BatchFunctionsTest(unittest.TestCase):
+    "Test the batch() methods generated with --batch-functions"
+
+    def setUp(self):
+        """NOTE this is called once for each test* method
+        (it is not called once per class).
+        FIXME This is slightly inefficient as it is called *way* more times than it needs to be.
+        """
+        header_str = """
+double sin(double x);
+double pow(double x, double y);
+long labs(long j);
+double modf(double x, double *iptr);
+"""
+        if sys.platform == "win32":
+            libraries = ["msvcrt"]
+        elif sys.platform.startswith("linux"):
+            libraries = ["libc.so.6", "libm.so.6"]
+        else:
+            libraries = ["libc"]
+        self.module, output = ctypesgentest.test(
+            header_str, libraries=libraries, batch_functions=True
+        )
+
+    def tearDown(self):
+        del self.module
+        ctypesgentest.cleanup()
+
+    def test_batchable(self):
+        """Only functions taking and returning numbers get batch()"""
+        module = self.module
+
+        self.assertTrue(hasattr(module.sin, "batch"))
+        self.assertTrue(hasattr(module.labs, "batch"))
+        self.assertFalse(hasattr(module.modf, "batch"))
+
+    def check_batch(self, module, pow_batch):
+        xs = array.array("d", [0.5, 1.0, 2.0, 3.0])
+        self.assertEqual(list(module.sin.batch(xs)), [math.sin(x) for x in xs])
+
+        # Numbers are used for every call
+        self.assertEqual(list(pow_batch(xs, 2)), [x ** 2 for x in xs])
+        self.assertEqual(list(pow_batch(2.0, xs)), [2.0 ** x for x in xs])
+
+        out = array.array("d", [0.0] * 4)
+        self.assertTrue(pow_batch(xs, xs, out=out) is out)
+        self.assertEqual(list(out), [x ** x for x in xs])
+
+        # Read-only buffers are accepted as inputs
+        readonly = memoryview(xs).toreadonly()
+        self.assertEqual(list(module.sin.batch(readonly)), list(module.sin.batch(xs)))
+
+        ns = array.array("l", [-3, 0, 7])
+        self.assertEqual(list(module.labs.batch(ns)), [3, 0, 7])
+
+    def test_batch(self):
+        """batch() calls the function once per element"""
+        self.check_batch(self.module, self.module.pow.batch)
+
+    def test_batch_fallback(self):
+        """The Python loop used without a C compiler gives the same results"""
+        module = self.module
+        self.check_batch(module, module._batch_function(module.pow, compile_shim=False))
+
+    def test_bad_buffers(self):
+        """Buffers of the wrong type or length are rejected"""
+        module = self.module
+
+        self.assertRaises(TypeError, module.sin.batch, array.array("f", [1.0]))
+        self.assertRaises(TypeError, module.sin.batch, array.array("q", [1]))
+        self.assertRaises(TypeError, module.sin.batch, "abc")
+        self.assertRaises(TypeError, module.pow.batch, 1.0, 2.0)
+        self.assertRaises(
+            ValueError, module.pow.batch, array.array("d", [1.0]), array.array("d", [1.0, 2.0])
+        )
+        self.assertRaises(
+            ValueError, module.sin.batch, array.array("d", [1.0, 2.0]), out=array.array("d", [0.0])
+        )
+        self.assertRaises(TypeError, module.sin.batch, array.array("d", [1.0]), out=b"12345678")
+
+
 class MathTest(unittest.TestCase):
     """Based on math_functions.py"""
 
@@ -1343,7 +1684,7 @@ class EnumTest(unittest.TestCase):
                         "name": "TEST_2",
                     },
                 ],
-                "name": "anon_2",
+                "name": "anon_1",
                 "type": "enum",
             },
             {"name": "TEST_1", "type": "constant", "value": "0"},
@@ -1378,7 +1719,7 @@ class EnumTest(unittest.TestCase):
                     "errors": [],
                     "opaque": False,
                     "src": ["/some-path/temp.h", 2],
-                    "tag": "anon_2",
+                    "tag": "anon_1",
                 },
                 "name": "test_status_t",
                 "type": "typedef",
@@ -1501,6 +1842,1050 @@ class LongDoubleTest(unittest.TestCase):
         )
 
 
+class StatsTest(unittest.TestCase):
+    "Test the timings and counters collected in options.stats"
+
+    def setUp(self):
+        """NOTE this is called once for each test* method
+        (it is not called once per class).
+        FIXME This is slightly inefficient as it is called *way* more times than it needs to be.
+        """
+        header_str = """
+        #define ANSWER 42
+        struct point { int x, y; };
+        int distance(struct point *a, struct point *b);
+        """
+        self.stats = ctypesgentest.ctypesgen.stats.Stats()
+        self.module, _ = ctypesgentest.test(header_str, stats=self.stats)
+
+    def tearDown(self):
+        del self.module
+        ctypesgentest.cleanup()
+
+    def test_phases(self):
+        """Every phase is timed, and operations run twice are added up"""
+        phases = dict((p["name"], p) for p in self.stats.as_dict()["phases"])
+        for name in (
+            "cpp",
+            "preprocessor lexing",
+            "C lexing",
+            "yacc parsing",
+            "find_dependencies",
+            "remove_macros",
+            "calculate_final_inclusion",
+        ):
+            self.assertTrue(name in phases, name)
+            self.assertTrue(phases[name]["seconds"] >= 0)
+        self.assertEqual(phases["calculate_final_inclusion"]["calls"], 2)
+        if sys.version_info >= (3, 9):
+            self.assertTrue(phases["preprocessor lexing"]["peak_memory"] > 0)
+
+    def test_counters(self):
+        """Tokens, reductions and descriptions are counted"""
+        counters = self.stats.as_dict()["counters"]
+        self.assertTrue(counters["tokens"] > 0)
+        self.assertTrue(counters["reductions"] > 0)
+        self.assertEqual(counters["descriptions.function"], 1)
+        self.assertEqual(counters["descriptions.struct"], 1)
+        included = counters.get("descriptions.included", 0)
+        excluded = counters.get("descriptions.excluded", 0)
+        kinds = sum(
+            v
+            for k, v in counters.items()
+            if k.startswith("descriptions.")
+            and k not in ("descriptions.included", "descriptions.excluded")
+        )
+        self.assertEqual(included + excluded, kinds)
+        self.assertTrue("tokens" in self.stats.format_table())
+
+
+class APITest(unittest.TestCase):
+    "Test generating wrappers in memory with ctypesgen.api"
+
+    header_str = """
+    struct point { int x, y; };
+    int distance(struct point *a, struct point *b);
+    #define ORIGIN_X 0
+    """
+
+    def test_generate_source(self):
+        """The wrapper is returned as a string"""
+        source = ctypesgentest.ctypesgen.api.generate_source(sources={"point.h": self.header_str})
+        self.assertTrue("class struct_point(Structure):" in source)
+        compile(source, "point.py", "exec")
+
+    def test_generate_module(self):
+        """The wrapper is executed into a module that is not registered"""
+        module = ctypesgentest.ctypesgen.api.generate_module(sources=self.header_str)
+        self.assertEqual(module.__name__, "header")
+        self.assertFalse("header" in sys.modules)
+        self.assertEqual(module.ORIGIN_X, 0)
+        self.assertEqual([f[0] for f in module.struct_point._fields_], ["x", "y"])
+
+    def test_no_files(self):
+        """Nothing is written to the current directory"""
+        import tempfile, shutil
+
+        cwd = os.getcwd()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            os.chdir(tmpdir)
+            ctypesgentest.ctypesgen.api.generate_module(sources={"point.h": self.header_str})
+            self.assertEqual(os.listdir(tmpdir), [])
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(tmpdir)
+
+    def test_threads(self):
+        """Wrappers generated concurrently match those generated one by one"""
+
+        def generate(i):
+            header = "int f%d(int x);\n#define N%d %d\n" % (i, i, i)
+            return ctypesgentest.ctypesgen.api.generate_source(sources={"h%d.h" % i: header})
+
+        expected = [generate(i) for i in range(8)]
+        self.assertEqual(thread_map(generate, range(8), 4), expected)
+
+
+class ConcurrencyTest(unittest.TestCase):
+    "Test that parsers running in different threads do not interfere"
+
+    header_str = """
+    struct outer {
+        struct { int a; } inner;
+        union { int i; float f; };
+        enum { RED, GREEN } colour;
+    };
+    enum { ANSWER = 42 };
+    typedef long long big;
+    unsigned long long twice(big x);
+    """
+
+    def generate(self, no_python_types):
+        return ctypesgentest.ctypesgen.api.generate_source(
+            sources={"outer.h": self.header_str}, no_python_types=no_python_types
+        )
+
+    def test_deterministic_output(self):
+        """Many concurrent parses give the same output as one at a time"""
+        # Parsers with different options must not share their type maps
+        expected = dict((flag, self.generate(flag)) for flag in (False, True))
+        self.assertNotEqual(expected[False], expected[True])
+        self.assertTrue("struct_anon_1" in expected[False])
+
+        flags = [i % 2 == 0 for i in range(24)]
+        results = thread_map(self.generate, flags, 8)
+        for flag, result in zip(flags, results):
+            self.assertEqual(result, expected[flag])
+
+    def test_python_types(self):
+        """Types parsed with --no-python-types never use the Python types"""
+        from ctypesgen.ctypedescs import CtypesSimple
+
+        self.assertEqual(CtypesSimple("size_t", True, 0, python_types=True).py_string(), "c_size_t")
+        self.assertRaises(KeyError, CtypesSimple("size_t", True, 0).py_string)
+
+
+class LexerCacheTest(unittest.TestCase):
+    "Test the cached tables of the preprocessor lexer"
+
+    text = '# 1 "a.h"\n#define A(x) ((x) << 2)\nint a(const char *s, ...);\n'
+
+    def tokens(self, lexer):
+        lexer.input(self.text)
+        result = []
+        while True:
+            tok = lexer.token()
+            if tok is None:
+                return result
+            result.append((tok.type, tok.value, tok.lineno, tok.filename))
+
+    def test_tables(self):
+        """A lexer read from cached tables gives the same tokens as a new one"""
+        import tempfile, shutil
+        from ctypesgen.parser import lex, pplexer, preprocessor
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            lextab = os.path.join(tmpdir, "lextab")
+            built = lex.lex(
+                cls=preprocessor.PreprocessorLexer, optimize=1, lextab=lextab, module=pplexer
+            )
+            self.assertTrue(os.path.exists(lextab + ".py"))
+            read = lex.lex(
+                cls=preprocessor.PreprocessorLexer, optimize=1, lextab=lextab, module=pplexer
+            )
+            self.assertEqual(read.lexstateretext, built.lexstateretext)
+            self.assertEqual(self.tokens(read), self.tokens(built))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_no_cache_dir(self):
+        """The tables are built in memory when the cache directory can't be made"""
+        from ctypesgen.parser import preprocessor
+
+        not_a_dir = os.path.join(cache_dir, "file")
+        with open(not_a_dir, "w") as f:
+            f.write("")
+        saved = preprocessor.get_lexer_prototype()
+        os.environ["CTYPESGEN_CACHE_DIR"] = os.path.join(not_a_dir, "ctypesgen")
+        try:
+            preprocessor._lexer_prototype = None
+            lexer = preprocessor.get_lexer_prototype().clone()
+            self.assertEqual(self.tokens(lexer), self.tokens(saved.clone()))
+        finally:
+            preprocessor._lexer_prototype = saved
+            os.environ["CTYPESGEN_CACHE_DIR"] = cache_dir
+            os.unlink(not_a_dir)
+
+    def test_clone(self):
+        """Parsers get independent lexers sharing the compiled tables"""
+        from ctypesgen.parser import preprocessor
+
+        options = ctypesgentest.ctypesgen.options.get_default_options()
+        a = preprocessor.PreprocessorParser(options, None).lexer
+        b = preprocessor.PreprocessorParser(options, None).lexer
+        self.assertTrue(isinstance(a, preprocessor.PreprocessorLexer))
+        self.assertFalse(a is b)
+        self.assertTrue(a.lexstatere is b.lexstatere)
+        a.input("int x;")
+        self.assertEqual(self.tokens(b)[0][0], "PP_DEFINE")
+
+    def test_dispatch(self):
+        """The dispatch tables give the same tokens as trying every rule"""
+        import tempfile, shutil
+        from ctypesgen.parser import preprocessor
+
+        header = (
+            "#include <stdio.h>\n"
+            "#include <math.h>\n"
+            '#define S L"wide \\" string" "caf\\xc3\\xa9 \xe9"\n'
+            "#define F(a, ...) (a ## 1.5e-3f + .5 - 0x1fUL * 'c' + L'\\n') # a\n"
+            "struct s { unsigned x : 3; double y[10]; } *p;\n"
+            "int f(int a, ...) { return a >>= 2, a->b ? a <<= 1 : a...; }\n"
+        )
+        tmpdir = tempfile.mkdtemp()
+        try:
+            options = ctypesgentest.ctypesgen.options.get_default_options()
+            options.save_preprocessed_headers = os.path.join(tmpdir, "pp.i")
+            ctypesgentest.ctypesgen.parser.parse(["a.h"], options, {"a.h": header})
+            with open(options.save_preprocessed_headers) as f:
+                self.text = f.read()
+        finally:
+            shutil.rmtree(tmpdir)
+
+        dispatch = preprocessor.get_lexer_prototype().clone()
+        reference = preprocessor.get_lexer_prototype().clone()
+        reference.lexstatedispatch = {}
+        reference.begin("INITIAL")
+        self.assertTrue(dispatch.lexdispatch is not None)
+        expected = self.tokens(reference)
+        self.assertTrue(len(expected) > 1000)
+        self.assertEqual(self.tokens(dispatch), expected)
+
+    def test_dispatch_groups(self):
+        """Dispatched tokens have their match groups if their rule is marked"""
+        from ctypesgen.parser import lex
+
+        class Rules(object):
+            tokens = ("PAIR", "WORD")
+            t_ignore = " "
+
+            @lex.GROUPS
+            def t_PAIR(self, t):
+                r"(\d+)=(\d+)"
+                t.value = (t.groups[1], t.groups[2])
+                return t
+
+            def t_WORD(self, t):
+                r"[a-z]+"
+                return t
+
+            def t_error(self, t):
+                t.lexer.skip(1)
+
+        lexer = lex.lex(object=Rules())
+        self.assertTrue(lexer.lexdispatch is not None)
+        lexer.input("ab 1=22")
+        word, pair = lexer.token(), lexer.token()
+        self.assertEqual((word.type, word.value), ("WORD", "ab"))
+        self.assertFalse(hasattr(word, "groups"))
+        self.assertEqual((pair.type, pair.value), ("PAIR", ("1", "22")))
+
+    def test_line_numbers(self):
+        """Tokens keep their lines when #define lines are moved to the end"""
+        from ctypesgen.parser import preprocessor
+
+        ppout = (
+            '# 1 "a.h"\n'
+            "#define A 1\n"
+            "int a;\n"
+            "#pragma pack(1)\n"
+            "\n"
+            '# 1 "b.h" 1\n'
+            "#define B 2\n"
+            "#define C 3\n"
+            "int b;\n"
+            '# 7 "a.h" 2\n'
+            "int c;\n"
+            "#define D 4\n"
+        )
+        self.text, files = preprocessor._arrange_lines(ppout)
+        self.assertEqual(files, ["a.h", "b.h"])
+        self.assertFalse("#pragma" in self.text)
+        self.assertFalse("\n\n" in self.text)
+        lexer = preprocessor.get_lexer_prototype().clone()
+        names = [(value, filename, lineno) for _, value, lineno, filename in self.tokens(lexer)]
+        for expected in [
+            ("a", "a.h", 2),
+            ("b", "b.h", 3),
+            ("c", "a.h", 7),
+            ("A", "a.h", 1),
+            ("B", "b.h", 1),
+            ("C", "b.h", 2),
+            ("D", "a.h", 8),
+        ]:
+            self.assertTrue(expected in names, expected)
+
+
+class WatchTest(unittest.TestCase):
+    "Test that --watch regenerates once per burst of changes"
+
+    def setUp(self):
+        import tempfile
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.first = os.path.join(self.tmpdir, "first.h")
+        self.second = os.path.join(self.tmpdir, "second.h")
+        for path in (self.first, self.second):
+            self.touch(path)
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.tmpdir)
+
+    def touch(self, path, mtime=None):
+        with open(path, "a") as f:
+            f.write("\n")
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+
+    def test_regenerate(self):
+        """Changes are waited out, and files found by a regeneration are watched"""
+        import threading, time
+        from ctypesgen import watch
+
+        calls = []
+
+        def regenerate():
+            calls.append(time.time())
+            return [self.first, self.second, "<built-in>"]
+
+        def regenerated(count):
+            # Lock.acquire() has no timeout on Python 2
+            deadline = time.time() + 5
+            while len(calls) < count and time.time() < deadline:
+                time.sleep(0.01)
+            return len(calls) >= count
+
+        stop = threading.Event()
+        thread = threading.Thread(target=watch.watch, args=([self.first], regenerate, 0.1, stop))
+        thread.start()
+        try:
+            time.sleep(0.1)
+            for i in range(3):
+                self.touch(self.first, 1000 + i)
+                time.sleep(0.01)
+            self.assertTrue(regenerated(1))
+            self.touch(self.second, 2000)
+            self.assertTrue(regenerated(2))
+            time.sleep(0.2)
+        finally:
+            stop.set()
+            thread.join()
+        self.assertEqual(len(calls), 2)
+
+
+class IncrementalTest(unittest.TestCase):
+    "Test that --incremental only regenerates and rewrites what changed"
+
+    def setUp(self):
+        import tempfile
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.header = os.path.join(self.tmpdir, "inc.h")
+        self.output = os.path.join(self.tmpdir, "inc.py")
+        self.write_header("int first(int x);\n")
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.tmpdir)
+
+    def write_header(self, text):
+        with open(self.header, "w") as f:
+            f.write(text)
+
+    def run_ctypesgen(self, *args):
+        from ctypesgen import main
+
+        main.main([self.header, "--incremental", "-o", self.output] + list(args))
+        st = os.stat(self.output)
+        with open(self.output) as f:
+            return getattr(st, "st_mtime_ns", st.st_mtime), f.read()
+
+    def test_unchanged_headers(self):
+        """The output is not touched when no header changed"""
+        written = self.run_ctypesgen()
+        self.assertTrue(os.path.exists(self.output + ".manifest.json"))
+        self.assertEqual(self.run_ctypesgen(), written)
+
+    def test_same_wrapper(self):
+        """The output is not rewritten when the header changes but not the wrapper"""
+        written = self.run_ctypesgen()
+        self.write_header("/* a comment */ int first(int x);\n")
+        self.assertEqual(self.run_ctypesgen(), written)
+
+    def test_changed_wrapper(self):
+        """The output is rewritten when the wrapper changes"""
+        mtime, source = self.run_ctypesgen()
+        self.assertFalse("second = _lib.second" in source)
+        self.write_header("int first(int x);\nint second(int x);\n")
+        mtime, source = self.run_ctypesgen()
+        self.assertTrue("second = _lib.second" in source)
+
+    def test_inserted_file(self):
+        """The output is rewritten when a file inserted in it changes"""
+        inserted = os.path.join(self.tmpdir, "inserted.py")
+        with open(inserted, "w") as f:
+            f.write("INSERTED = 1\n")
+        mtime, source = self.run_ctypesgen("--insert-file", inserted)
+        self.assertTrue("INSERTED = 1" in source)
+        with open(inserted, "w") as f:
+            f.write("INSERTED = 22\n")
+        mtime, source = self.run_ctypesgen("--insert-file", inserted)
+        self.assertTrue("INSERTED = 22" in source)
+
+    def test_description_hashes(self):
+        """The manifest identifies each description and sees which changed"""
+        from ctypesgen import incremental
+
+        self.run_ctypesgen()
+        path = incremental.manifest_path(self.output)
+        before = incremental.Manifest.load(path).descriptions
+        self.write_header("int first(long x);\nint second(int x);\n")
+        self.run_ctypesgen()
+        after = incremental.Manifest.load(path).descriptions
+        self.assertEqual(len(before), 1)
+        self.assertEqual(len(after), 2)
+        (first,) = before
+        self.assertTrue(first.startswith("function first "))
+        self.assertNotEqual(before[first], after[first])
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "needs Unix domain sockets and fork()")
+@unittest.skipUnless(sys.version_info >= (3, 4), "the server needs Python 3.4 or later")
+class ServerTest(unittest.TestCase):
+    "Test running ctypesgen through `ctypesgen serve`"
+
+    @classmethod
+    def setUpClass(cls):
+        import tempfile, threading
+        from ctypesgen import server
+
+        cls.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(cls.tmpdir, "served.h"), "w") as f:
+            f.write("int served(int x);\n#define SERVED 7\n")
+        cls.server = server.Server(os.path.join(cls.tmpdir, "ctypesgen.sock"), workers=2)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        import shutil
+
+        cls.server.shutdown()
+        cls.thread.join()
+        cls.server.server_close()
+        shutil.rmtree(cls.tmpdir)
+
+    def request(self, argv):
+        from ctypesgen import server
+
+        return server.request(argv, self.server.path, cwd=self.tmpdir, prog="ctypesgen")
+
+    def test_output(self):
+        """The wrapper printed by the server is the one ctypesgen prints"""
+        import json
+
+        status, stdout, stderr = self.request(["served.h", "-o", "served.py"])
+        self.assertEqual(status, 0)
+        self.assertTrue("Wrapping complete." in stderr)
+        with open(os.path.join(self.tmpdir, "served.py")) as f:
+            source = f.read()
+        self.assertTrue("SERVED = 7" in source)
+        self.assertTrue("ctypesgen served.h -o served.py" in source)
+
+        status, stdout, stderr = self.request(["served.h", "--output-language=json"])
+        self.assertEqual(status, 0)
+        self.assertEqual([d["name"] for d in json.loads(stdout)], ["served", "SERVED"])
+
+    def test_errors(self):
+        """Usage errors give the exit status and messages of ctypesgen"""
+        status, stdout, stderr = self.request([])
+        self.assertEqual(status, 1)
+        self.assertTrue("No header files specified" in stderr)
+
+    def test_concurrent_requests(self):
+        """More requests than workers are queued and all answered"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        argv = ["served.h", "--output-language=json"]
+        with ThreadPoolExecutor(6) as executor:
+            replies = list(executor.map(self.request, [argv] * 6))
+        self.assertEqual(set(status for status, stdout, stderr in replies), set([0]))
+        self.assertEqual(len(set(stdout for status, stdout, stderr in replies)), 1)
+
+    def test_private(self):
+        """The socket is for this user alone, and is sent a few variables"""
+        import stat
+        from ctypesgen import server
+
+        self.assertEqual(stat.S_IMODE(os.stat(self.server.path).st_mode), 0o600)
+        self.assertEqual(server.server_uid(self.connect(), self.server.path), os.getuid())
+
+        environ = {"CPATH": "/opt/include", "SECRET_TOKEN": "x"}
+        self.assertEqual(server.sent_environ(environ), {"CPATH": "/opt/include"})
+
+        shared = os.path.join(self.tmpdir, "shared")
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        self.assertRaises(server.ServerError, server.private_dir, shared)
+        private = os.path.join(self.tmpdir, "private")
+        self.assertEqual(server.private_dir(private), private)
+        self.assertEqual(stat.S_IMODE(os.stat(private).st_mode), 0o700)
+
+    def test_no_server(self):
+        """A missing or stale socket is told apart from other errors"""
+        import socket
+        from ctypesgen import server
+
+        missing = os.path.join(self.tmpdir, "missing.sock")
+        with self.assertRaises(server.NoServerError) as cm:
+            server.request([], missing)
+        self.assertFalse(cm.exception.stale)
+
+        stale = os.path.join(self.tmpdir, "stale.sock")
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(stale)
+        sock.close()
+        with self.assertRaises(server.NoServerError) as cm:
+            server.request([], stale)
+        self.assertTrue(cm.exception.stale)
+
+    def connect(self):
+        import socket
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.server.path)
+        self.addCleanup(sock.close)
+        return sock
+
+
+class SlotsTest(unittest.TestCase):
+    "Test the compact representation of descriptions and expressions"
+
+    def test_shared_defaults(self):
+        """Empty requirements and errors are shared until written"""
+        from ctypesgen import descriptions, expressions
+
+        a = descriptions.ConstantDescription("A", expressions.ConstantExpressionNode(1))
+        b = descriptions.ConstantDescription("B", expressions.ConstantExpressionNode(2))
+        self.assertFalse(hasattr(a, "__dict__"))
+        self.assertFalse(hasattr(a.value, "__dict__"))
+        self.assertTrue(a.requirements is b.requirements)
+        self.assertTrue(a.errors is b.errors)
+
+        a.add_requirements([b])
+        a.error("bad", cls="test")
+        a.value.error("worse")
+        self.assertEqual(a.requirements, set([b]))
+        self.assertEqual(b.dependents, set([a]))
+        self.assertEqual(b.requirements, set())
+        self.assertEqual(a.errors, [("bad", "test")])
+        self.assertEqual(list(b.errors), [])
+        self.assertEqual(list(b.value.errors), [])
+        self.assertEqual(a.value.errors, [("worse", None)])
+
+
+class JSONFormatTest(unittest.TestCase):
+    "Test the layouts of JSON output"
+
+    header_str = """
+    struct point { int x, y; };
+    int distance(struct point *a, struct point *b);
+    #define ORIGIN_X 0
+    """
+
+    def generate(self, **options):
+        return ctypesgentest.ctypesgen.api.generate_source(
+            sources={"point.h": self.header_str}, output_language="json", **options
+        )
+
+    def test_array(self):
+        """The array is written as json.dumps() would write it"""
+        import json
+
+        source = self.generate()
+        items = json.loads(source)
+        self.assertEqual(source, json.dumps(items, sort_keys=True, indent=4) + "\n")
+        self.assertEqual(json.loads(self.generate(json_compact=True)), items)
+        self.assertFalse("\n" in self.generate(json_compact=True).rstrip("\n"))
+
+    def test_ndjson(self):
+        """NDJSON has one description per line"""
+        import json
+
+        items = json.loads(self.generate())
+        for compact in (False, True):
+            lines = self.generate(json_format="ndjson", json_compact=compact).splitlines()
+            self.assertEqual([json.loads(line) for line in lines], items)
+        decoded = ctypesgentest.ctypesgen.api.generate_module(
+            sources={"point.h": self.header_str}, output_language="json", json_format="ndjson"
+        )
+        self.assertEqual(decoded, items)
+
+    def test_type_table(self):
+        """Types are written once, before they are referred to"""
+        import json, re
+        from ctypesgen.printer_json.printer import expand_refs
+
+        items = json.loads(self.generate())
+        table = json.loads(self.generate(json_type_table=True))
+        seen = set()
+        for item in table:
+            if item["type"] == "ctype":
+                self.assertFalse(item["id"] in seen)
+                seen.add(item["id"])
+            for ref in re.findall(r'"\$ref": "(\w+)"', json.dumps(item)):
+                self.assertTrue(ref in seen)
+        self.assertTrue(len(seen) < json.dumps(table).count('"$ref"'))
+        self.assertEqual(expand_refs(table), items)
+        lines = self.generate(json_type_table=True, json_format="ndjson").splitlines()
+        self.assertEqual(expand_refs([json.loads(line) for line in lines]), items)
+
+
+class IRTest(unittest.TestCase):
+    "Test saving processed descriptions with --save-ir and loading them"
+
+    header_str = """
+    #define SHIFTED (1 << 4 | 3)
+    #define MAX(a, b) ((a) > (b) ? (a) : (b))
+    #define NAME "name"
+    struct point { int x, y; };
+    typedef struct point point_t;
+    enum color { RED = SHIFTED, GREEN };
+    int distance(point_t *a, point_t *b);
+    """
+
+    def setUp(self):
+        import tempfile
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "point.ir")
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.tmpdir)
+
+    def render(self, printer, descriptions, options):
+        try:
+            from StringIO import StringIO  # Python 2, where the printers write str
+        except ImportError:
+            from io import StringIO
+
+        output = StringIO()
+        printer.WrapperPrinter(output, options, descriptions)
+        return output.getvalue()
+
+    def test_round_trip(self):
+        """Printers give the same output for loaded descriptions"""
+        ctypesgen = ctypesgentest.ctypesgen
+        options = ctypesgen.options.get_default_options()
+        options.headers = ["point.h"]
+        sources = {"point.h": self.header_str}
+        descriptions = ctypesgen.parser.parse(options.headers, options, sources)
+        ctypesgen.processor.process(descriptions, options)
+        ctypesgen.ir.save(descriptions, options.headers, self.path)
+
+        loaded, headers = ctypesgen.ir.load(self.path)
+        self.assertEqual(headers, ["point.h"])
+        self.assertEqual(
+            [desc.casual_name() for desc in loaded.all],
+            [desc.casual_name() for desc in descriptions.all],
+        )
+        for printer in (ctypesgen.printer_python, ctypesgen.printer_json):
+            self.assertEqual(
+                self.render(printer, loaded, options), self.render(printer, descriptions, options)
+            )
+        (shifted,) = [m for m in loaded.macros if m.name == "SHIFTED"]
+        self.assertEqual(shifted.expr.evaluate({}), 19)
+
+    def test_rejected(self):
+        """Other files and other versions are not loaded"""
+        import struct
+
+        ctypesgen = ctypesgentest.ctypesgen
+        with open(self.path, "wb") as f:
+            f.write(b"#define X 1\n")
+        self.assertRaises(ctypesgen.ir.IRError, ctypesgen.ir.load, self.path)
+        with open(self.path, "wb") as f:
+            f.write(ctypesgen.ir.MAGIC + struct.pack("!HH", 0, 3) + b"0.0" + b"garbage")
+        self.assertRaises(ctypesgen.ir.IRError, ctypesgen.ir.load, self.path)
+
+    def write_pickle(self, payload):
+        """Write an IR file holding the pickle opcodes `payload`."""
+        import struct, zlib
+
+        ctypesgen = ctypesgentest.ctypesgen
+        version = ctypesgen.version.VERSION_NUMBER.encode("utf-8")
+        with open(self.path, "wb") as f:
+            f.write(ctypesgen.ir.MAGIC)
+            f.write(struct.pack("!HH", ctypesgen.ir.IR_VERSION, len(version)))
+            f.write(version)
+            f.write(zlib.compress(b"\x80\x04" + payload + b"."))
+
+    def unicode(self, text):
+        return b"\x8c" + bytes([len(text)]) + text.encode("ascii")
+
+    def test_no_code_run(self):
+        """Only classes from ctypesgen are loaded, not what their modules import"""
+        ctypesgen = ctypesgentest.ctypesgen
+        victim = os.path.join(self.tmpdir, "victim")
+        with open(victim, "w") as f:
+            f.write("")
+        for module, name in [
+            ("ctypesgen.incremental", "os.remove"),
+            ("ctypesgen.incremental", "os"),
+            ("os", "remove"),
+        ]:
+            # module.name(victim), with STACK_GLOBAL, TUPLE1 and REDUCE
+            call = self.unicode(module) + self.unicode(name) + b"\x93"
+            self.write_pickle(call + self.unicode(victim) + b"\x85R")
+            self.assertRaises(ctypesgen.ir.IRError, ctypesgen.ir.load, self.path)
+            self.assertTrue(os.path.exists(victim))
+
+    def test_damaged(self):
+        """Well-formed pickles of the wrong shape are reported as damaged"""
+        ctypesgen = ctypesgentest.ctypesgen
+        self.write_pickle(b"K\x07")  # The integer 7
+        self.assertRaises(ctypesgen.ir.IRError, ctypesgen.ir.load, self.path)
+        # A persistent ID past the end of the functions of a module
+        self.write_pickle(
+            self.unicode("code") + self.unicode("ctypesgen.ir") + b"J\xff\xff\x00\x00\x87Q"
+        )
+        self.assertRaises(ctypesgen.ir.IRError, ctypesgen.ir.load, self.path)
+
+
+class SymbolsFileTest(unittest.TestCase):
+    "Test --include-symbols-file and --exclude-symbols-file"
+
+    header_str = """
+    int apr_pool_create(void);
+    int apr_pool_destroy(void);
+    int apr_file_open(void);
+    int apr_file_close(void);
+    int other(void);
+    #define APR_SUCCESS 0
+    """
+
+    def setUp(self):
+        import tempfile
+
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        import shutil
+
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, text):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def included(self, **kwargs):
+        ctypesgen = ctypesgentest.ctypesgen
+        options = ctypesgen.options.get_default_options()
+        options.headers = ["apr.h"]
+        for name, value in kwargs.items():
+            setattr(options, name, value)
+        descriptions = ctypesgen.parser.parse(options.headers, options, {"apr.h": self.header_str})
+        ctypesgen.processor.process(descriptions, options)
+        return sorted(desc.py_name() for desc in descriptions.all if desc.included)
+
+    def test_exclude(self):
+        """Exact names, globs and regular expressions are excluded"""
+        path = self.write(
+            "exclude.txt", "# Not for Python\n\napr_pool_*\nother\nre:apr_file_(open|read)\n"
+        )
+        self.assertEqual(
+            self.included(exclude_symbols_files=[path]), ["APR_SUCCESS", "apr_file_close"]
+        )
+        # Patterns match whole names, but -x keeps matching prefixes
+        self.assertEqual(
+            self.included(exclude_symbols_files=[path], exclude_symbols="APR"),
+            ["apr_file_close"],
+        )
+
+    def test_include(self):
+        """Symbols which are both included and excluded are excluded"""
+        include = self.write("include.txt", "apr_pool_create\napr_file_*\n")
+        exclude = self.write("exclude.txt", "apr_file_close\n")
+        self.assertEqual(
+            self.included(include_symbols_files=[include], exclude_symbols_files=[exclude]),
+            ["APR_SUCCESS", "apr_file_open", "apr_pool_create", "apr_pool_destroy", "other"],
+        )
+
+    def test_groups(self):
+        """Regular expressions with groups or flags match on their own"""
+        from ctypesgen.processor.operations import SymbolMatcher
+
+        match = SymbolMatcher(patterns=["(x)", r"(a)\1", "(?i)APR_.*", "apr_*"])
+        self.assertEqual([match(n) for n in ("aa", "x", "apr_file", "apr_", "ab")], [1, 1, 1, 1, 0])
+        path = self.write("exclude.txt", "re:(?P<n>apr)_pool_create\nre:(?P<n>apr)_file_open\n")
+        self.assertEqual(
+            self.included(exclude_symbols_files=[path]),
+            ["APR_SUCCESS", "apr_file_close", "apr_pool_destroy", "other"],
+        )
+
+    def test_regex_operations(self):
+        """The operations for -x and -i alone are still there"""
+        ctypesgen = ctypesgentest.ctypesgen
+        operations = ctypesgen.processor.operations
+        options = ctypesgen.options.get_default_options()
+        options.headers = ["apr.h"]
+        options.exclude_symbols = "apr_pool"
+        descriptions = ctypesgen.parser.parse(options.headers, options, {"apr.h": self.header_str})
+        operations.filter_by_regexes_exclude(descriptions, options)
+        never = sorted(d.py_name() for d in descriptions.all if d.include_rule == "never")
+        self.assertEqual(never, ["apr_pool_create", "apr_pool_destroy"])
+
+    def test_errors(self):
+        """Missing files and bad regular expressions are reported"""
+        ctypesgen = ctypesgentest.ctypesgen
+        bad = self.write("bad.txt", "re:apr_(\n")
+        missing = os.path.join(self.tmpdir, "missing.txt")
+        for path in (bad, missing):
+            self.assertRaises(
+                ctypesgen.processor.SymbolFileError,
+                self.included,
+                exclude_symbols_files=[path],
+            )
+
+
+class DescriptionCollectionTest(unittest.TestCase):
+    "Test adding descriptions to a DescriptionCollection"
+
+    def test_add_after(self):
+        """Descriptions added after others are put in place in all"""
+        descriptions = ctypesgentest.ctypesgen.descriptions
+        a, b, c = [descriptions.ConstantDescription(name, None, None) for name in "abc"]
+        data = descriptions.DescriptionCollection([a, b], [], [], [], [], [], [], [a, b], [])
+        ta, tb, tta = [descriptions.TypedefDescription(name, None) for name in ("ta", "tb", "tta")]
+        data.add("typedef", ta, after=a)
+        data.add("constant", c)
+        data.add("typedef", tb, after=b)
+        data.add("typedef", tta, after=ta)
+        self.assertEqual([d.name for d in data.all], ["a", "ta", "tta", "b", "tb", "c"])
+        self.assertEqual([d.name for d in data.typedefs], ["ta", "tb", "tta"])
+        self.assertEqual([d.name for d in data.constants], ["a", "b", "c"])
+        self.assertEqual(
+            [(kind, d.name) for kind, d in data.output_order],
+            [("typedef", "ta"), ("constant", "c"), ("typedef", "tb"), ("typedef", "tta")],
+        )
+
+        all = data.all
+        data.add("typedef", descriptions.TypedefDescription("tc", None), after=c)
+        all.remove(tb)
+        data.all = all
+        self.assertEqual([d.name for d in data.all], ["a", "ta", "tta", "b", "c", "tc"])
+
+        stray = descriptions.TypedefDescription("stray", None)
+        data.add("typedef", descriptions.TypedefDescription("t", None), after=stray)
+        del stray
+        self.assertRaises(ValueError, lambda: data.all)
+
+    def test_lookup(self):
+        """Descriptions are found by name, kind and source file"""
+        import shutil, tempfile
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        with open(os.path.join(tmpdir, "types.h"), "w") as f:
+            f.write("typedef int coord;\n")
+        with open(os.path.join(tmpdir, "point.h"), "w") as f:
+            f.write(
+                '#include "types.h"\n'
+                "struct point { coord x, y; };\n"
+                "enum shape { ORIGIN };\n"
+                "int point(struct point *p);\n"
+                "int lambda(void);\n"
+            )
+        ctypesgen = ctypesgentest.ctypesgen
+        options = ctypesgen.options.get_default_options()
+        options.headers = [os.path.join(tmpdir, "point.h")]
+        options.output_language = "python"
+        data = ctypesgen.parser.parse(options.headers, options)
+        ctypesgen.processor.process(data, options)
+
+        self.assertEqual(
+            sorted(d.casual_name() for d in data.lookup("point")),
+            ['Function "point"', 'Typedef "point"'],
+        )
+        self.assertEqual(
+            [d.casual_name() for d in data.lookup("point", "struct")], ['Struct "point"']
+        )
+        self.assertEqual(data.lookup("point", "enum"), [])
+        self.assertEqual([d.casual_name() for d in data.lookup("shape", "enum")], ['Enum "shape"'])
+        self.assertEqual(data.by_kind("enum"), data.enums)
+        self.assertEqual(
+            [d.casual_name() for d in data.in_file(os.path.join(tmpdir, "types.h"))],
+            ['Typedef "coord"'],
+        )
+        self.assertEqual(
+            [os.path.basename(f) for f in data.files() if f.startswith(tmpdir)],
+            ["types.h", "point.h"],
+        )
+
+        # Renamed to avoid the Python keyword
+        self.assertEqual(data.lookup("lambda"), [])
+        self.assertEqual([d.casual_name() for d in data.lookup("_lambda")], ['Function "_lambda"'])
+
+
+class LocationsTest(unittest.TestCase):
+    "Test the location handles of descriptions"
+
+    def test_handles(self):
+        """Handles give back their file and line, and sort by line"""
+        locations = ctypesgentest.ctypesgen.locations
+        handles = [locations.location("/tmp/a.h", line) for line in (7, 1, 100000)]
+        self.assertEqual([locations.src(h) for h in handles][0], ("/tmp/a.h", 7))
+        self.assertEqual(sorted(locations.lineno(h) for h in handles), [1, 7, 100000])
+        self.assertEqual([locations.lineno(h) for h in sorted(handles)], [1, 7, 100000])
+        self.assertEqual(locations.src(locations.location("<builtin>", -1)), ("<builtin>", -1))
+        other = locations.location("/tmp/a.h", 3)
+        self.assertEqual(locations.file_id_of(handles[0]), locations.file_id_of(other))
+        self.assertEqual(locations.src(None), None)
+
+    def test_threads(self):
+        """Files seen first by different threads at once get their own IDs"""
+        locations = ctypesgentest.ctypesgen.locations
+        names = ["/tmp/threads/%d.h" % i for i in range(2000)]
+        # Switch threads as often as possible
+        try:
+            get_interval, set_interval = sys.getswitchinterval, sys.setswitchinterval
+            switch_often = 1e-6
+        except AttributeError:
+            get_interval, set_interval = sys.getcheckinterval, sys.setcheckinterval
+            switch_often = 1
+        interval = get_interval()
+        set_interval(switch_often)
+        try:
+            ids = thread_map(locations.file_id, names, 8)
+        finally:
+            set_interval(interval)
+        self.assertEqual(len(set(ids)), len(names))
+        self.assertEqual([locations.file_name(i) for i in ids], names)
+
+    def test_descriptions(self):
+        """Descriptions hold a handle, with integer line numbers"""
+        ctypesgen = ctypesgentest.ctypesgen
+        options = ctypesgen.options.get_default_options()
+        options.headers = ["temp.h"]
+        header = "int f(void);\nstruct s { int x; };\n#define M 1\n"
+        data = ctypesgen.parser.parse(options.headers, options, {"temp.h": header})
+        for desc in data.all:
+            self.assertIsInstance(desc.location, int)
+            self.assertIsInstance(desc.src[1], int)
+        self.assertEqual(
+            sorted((d.casual_name(), d.src[1]) for d in data.all if d.src[0].endswith("temp.h")),
+            [('Function "f"', 1), ('Macro "M"', 3), ('Struct "s"', 2)],
+        )
+
+
+class YaccProductionTest(unittest.TestCase):
+    "Test the production object passed to grammar rules"
+
+    def test_offsets(self):
+        """Symbols are read from the parser's stack at the production's offset"""
+        from ctypesgen.parser import yacc
+
+        def symbol(value, lineno):
+            sym = yacc.YaccSymbol()
+            sym.type = "X"
+            sym.value = value
+            sym.lineno = lineno
+            return sym
+
+        stack = [symbol("below", 1), symbol("a", 2), symbol("b", 3)]
+        p = yacc.YaccProduction(stack)
+        p.sym = symbol(None, 2)
+        p.base = 1
+        p.plen = 2
+        self.assertEqual(len(p), 3)
+        self.assertEqual((p[1], p[2], p[-1]), ("a", "b", "below"))
+        self.assertEqual(p[1:], ["a", "b"])
+        self.assertEqual([sym.lineno for sym in p.slice[0:3]], [2, 2, 3])
+        self.assertIs(p.slice[-1], stack[2])
+        self.assertRaises(IndexError, lambda: p.slice[3])
+        p[0] = "result"
+        p[2] = "B"
+        self.assertEqual((p.sym.value, stack[2].value), ("result", "B"))
+        self.assertFalse(hasattr(p.sym, "__dict__"))
+
+
+class ParserProfileTest(unittest.TestCase):
+    "Test profiling the LR parser"
+
+    def profile(self, header_str):
+        ctypesgen = ctypesgentest.ctypesgen
+        options = ctypesgen.options.get_default_options()
+        options.headers = ["profile.h"]
+        options.parser_profile = ctypesgen.stats.ParserProfile()
+        ctypesgen.parser.parse(options.headers, options, {"profile.h": header_str})
+        return options.parser_profile
+
+    def test_counts(self):
+        """Reductions are counted per grammar rule function"""
+        plain = self.profile("int f(int x);\n")
+        profile = self.profile(
+            "int f(int x);\nstruct s { struct { int a[((((((((1))))))))]; } inner; };\n"
+        )
+        self.assertGreater(profile.shifts, plain.shifts)
+        self.assertGreater(profile.max_depth, plain.max_depth)
+        self.assertEqual(profile.productions["p_struct_or_union_specifier"][0], 2)
+        self.assertEqual(profile.recovery, {})
+        data = profile.as_dict()
+        self.assertEqual(data["reductions"], sum(p["reductions"] for p in data["productions"]))
+        seconds = [p["seconds"] for p in data["productions"]]
+        self.assertEqual(seconds, sorted(seconds, reverse=True))
+        self.assertIn("p_struct_or_union_specifier", profile.format_table())
+
+    def test_error_recovery(self):
+        """Syntax errors and the recovery from them are counted"""
+        profile = self.profile("int bad bad;\nint f(int x);\n")
+        self.assertEqual(profile.recovery["syntax errors"], 1)
+        self.assertGreater(profile.recovery["error tokens"], 0)
+        self.assertEqual(list(profile.error_files.values()), [1])
+        (entry,) = profile.as_dict()["syntax_errors_by_file"]
+        self.assertEqual(entry, {"file": list(profile.error_files)[0], "errors": 1})
+        self.assertIn("errors", profile.format_table())
+
+
 def main(argv=None):
     if argv is None:
         argv = sys.argv
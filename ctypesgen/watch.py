@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+"""
+ctypesgen.watch regenerates a wrapper whenever one of the files it was
+generated from changes, for --watch.
+
+The files are those the C preprocessor read, as named in its line markers,
+so headers included by other headers are watched too, and the list is
+updated after each regeneration. Their modification times are polled, and
+a burst of changes (an editor saving several files, a checkout) is waited
+out until the files stay the same for one polling interval, so that it
+causes a single regeneration.
+
+Regenerating in the same process keeps the grammar tables and the library
+search cache, and with --incremental the output is only rewritten when it
+changes.
+"""
+
+import os, threading, time
+
+from . import messages as msgs
+
+__all__ = ["watch"]
+
+try:
+    _clock = time.perf_counter
+except AttributeError:
+    _clock = time.time
+
+
+def existing_files(files):
+    # Names such as "<built-in>" in line markers are not files
+    return [os.path.abspath(path) for path in files if os.path.isfile(path)]
+
+
+def snapshot(files):
+    """Return the modification time of each of `files`, None if missing."""
+    times = {}
+    for path in files:
+        try:
+            st = os.stat(path)
+        except OSError:
+            times[path] = None
+        else:
+            # Python 2 only has the time as a float
+            times[path] = getattr(st, "st_mtime_ns", st.st_mtime)
+    return times
+
+
+def watch(files, regenerate, interval=0.5, stop=None):
+    """Call `regenerate` whenever one of `files` changes, until `stop` (a
+    threading.Event) is set or the user interrupts. `regenerate` returns
+    the files to watch from then on."""
+    if stop is None:
+        stop = threading.Event()
+    times = snapshot(existing_files(files))
+    msgs.status_message("Watching %d files for changes." % len(times))
+    try:
+        while not stop.wait(interval):
+            current = snapshot(times)
+            if current == times:
+                continue
+
+            # Wait until the files stop changing
+            while not stop.wait(interval):
+                latest = snapshot(times)
+                if latest == current:
+                    break
+                current = latest
+            if stop.is_set():
+                break
+
+            changed = [path for path in times if current[path] != times[path]]
+            msgs.status_message("Changed: %s" % ", ".join(sorted(changed)))
+            start = _clock()
+            try:
+                files = regenerate()
+            except Exception as e:
+                # Keep watching; the next edit may fix it
+                msgs.error_message("Regenerating failed: %s" % e)
+                times = current
+                continue
+            msgs.status_message("Regenerated in %.3f s." % (_clock() - start))
+            # Files changed while regenerating are seen at the next poll
+            new_times = snapshot(existing_files(files))
+            for path in new_times:
+                if path in current:
+                    new_times[path] = current[path]
+            times = new_times
+    except KeyboardInterrupt:
+        pass